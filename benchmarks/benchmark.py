@@ -0,0 +1,386 @@
+"""Benchmarks of the EnergyScore, Cost and Potential Savings update paths
+
+Run from the repository root:
+
+    python -m benchmarks.benchmark --output results.json
+    python -m benchmarks.benchmark --compare benchmarks/baseline.json
+
+Every case is run over windows of rolling hours and numbers of simulated
+sensor instances, with a simulated clock ticking every scan interval. The
+latency is measured without tracing, and the allocations and peak memory in a
+second, traced run, since tracemalloc slows down the code it traces. The
+results are written as JSON keyed by case, so runs of different versions can
+be compared.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Callable
+from unittest.mock import patch
+
+from homeassistant.util import dt
+import numpy as np
+
+from custom_components.energyscore.const import (
+    CONF_ENERGY_ENTITY,
+    CONF_PRICE_ENTITY,
+    SCAN_INTERVAL,
+)
+from custom_components.energyscore.coordinator import SourceData
+from custom_components.energyscore.engine import (
+    calculate_hourly_energy_deltas,
+    normalise_energy,
+    normalise_price,
+)
+from custom_components.energyscore.history import epoch_interval
+from custom_components.energyscore.hub import PriceHub
+from custom_components.energyscore.sensor import Cost, EnergyScore, PotentialSavings
+
+HOURS = [24, 168, 720, 8760]
+INSTANCES = [1, 10, 100, 1000]
+
+# Metrics where a higher value than the baseline is a regression
+METRICS = [
+    "setup_ms",
+    "median_us",
+    "p95_us",
+    "alloc_bytes",
+    "alloc_blocks",
+    "peak_bytes",
+]
+
+START = datetime.datetime(2023, 1, 2, tzinfo=datetime.timezone.utc)
+
+
+class Clock:
+    """Simulated clock replacing dt.now while a case runs"""
+
+    def __init__(self, start: datetime.datetime) -> None:
+        self.time = start
+
+    def __call__(self, time_zone: datetime.tzinfo | None = None):
+        return self.time
+
+    def tick(self, step: datetime.timedelta = SCAN_INTERVAL) -> None:
+        """Moves the clock one step forward"""
+        self.time += step
+
+
+def _config(index: int, price_entity: str) -> dict:
+    return {
+        "name": f"Benchmark {index}",
+        "unique_id": f"benchmark_{index}",
+        CONF_ENERGY_ENTITY: f"sensor.benchmark_energy_{index}",
+        CONF_PRICE_ENTITY: price_entity,
+    }
+
+
+def _source_data(rng: np.random.Generator, energy: float) -> SourceData:
+    price = float(rng.uniform(0.5, 3.0))
+    return SourceData(price, energy, {"state_class": "total_increasing"}, {})
+
+
+def _energy_scores(
+    hours: int, instances: int, shared: bool, clock: Clock, rng: np.random.Generator
+) -> list[EnergyScore]:
+    """Returns EnergyScore sensors with full histories, scored by price hubs"""
+    coordinator = SimpleNamespace(interval=60, data=None)
+    now = epoch_interval(clock.time, 60)
+    hubs: dict[str, PriceHub] = {}
+    sensors = []
+    for index in range(instances):
+        price_entity = "sensor.price" if shared else f"sensor.price_{index}"
+        sensor = EnergyScore(coordinator, _config(index, price_entity), 0, hours)
+        # The states are formatted as they would be written
+        sensor.async_write_ha_state = lambda sensor=sensor: (
+            sensor.state,
+            sensor.extra_state_attributes,
+        )
+        capacity = hours + 1
+        intervals = np.arange(now - capacity, now)
+        slots = intervals % capacity
+        for history, values in [
+            (sensor._energy_history, np.cumsum(rng.uniform(0, 2, capacity))),
+            (sensor._price_history, rng.uniform(0.5, 3.0, capacity)),
+        ]:
+            # The first hour allocates the arrays, which are then filled at once
+            history.set(now - capacity, float(values[0]))
+            history._hours[slots] = intervals
+            history._values[slots] = values
+            history.newest = now - 1
+        if price_entity not in hubs:
+            hubs[price_entity] = PriceHub(None, price_entity, 60)
+        sensor.async_join_price_hub(hubs[price_entity])
+        sensors.append(sensor)
+    # Built once, there is no event loop to rebuild them at the first update
+    for hub in hubs.values():
+        hub.async_rebuild()
+    return sensors
+
+
+def _savings(instances: int) -> list[tuple[Cost, PotentialSavings, list[float]]]:
+    """Returns Cost and Potential Savings sensors, with the energy readings"""
+    coordinator = SimpleNamespace(interval=60, data=None, cost_unit_valid=True)
+    sensors = []
+    for index in range(instances):
+        config = _config(index, f"sensor.price_{index}")
+        cost = Cost(coordinator, config)
+        sensors.append((cost, PotentialSavings(coordinator, config, cost), [0.0]))
+    return sensors
+
+
+def _measure(
+    setup: Callable[[], Callable[[], None]], samples: int, calls: int
+) -> dict[str, float]:
+    """Measures the latency of the calls of a case, then its memory use
+
+    The latency is the time of one call, and the allocations the memory
+    allocated by one call, including what is freed again before it returns.
+    The setup, like restoring the sensors and building their price hubs, is
+    timed separately and included in the peak memory.
+    """
+    start = time.perf_counter()
+    call = setup()
+    setup_duration = time.perf_counter() - start
+    call()  # Warm up
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        call()
+        durations.append((time.perf_counter() - start) / calls)
+    del call
+
+    tracemalloc.start()
+    call = setup()
+    call()
+    allocated = []
+    blocks = []
+    for _ in range(min(samples, 20)):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        snapshot = tracemalloc.take_snapshot()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        allocated.append((peak - before) / calls)
+        blocks.append(
+            sum(
+                stat.count_diff
+                for stat in tracemalloc.take_snapshot().compare_to(snapshot, "filename")
+                if stat.count_diff > 0
+            )
+            / calls
+        )
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del call
+
+    durations.sort()
+    return {
+        "setup_ms": round(setup_duration * 1e3, 1),
+        "median_us": round(statistics.median(durations) * 1e6, 2),
+        "p95_us": round(durations[math.ceil(0.95 * len(durations)) - 1] * 1e6, 2),
+        "alloc_bytes": round(statistics.mean(allocated)),
+        "alloc_blocks": round(statistics.mean(blocks), 1),
+        "peak_bytes": peak,
+    }
+
+
+def run_energyscore(hours: int, instances: int, shared: bool, samples: int):
+    """EnergyScore.process_new_data of every instance, per instance"""
+    clock = Clock(START)
+
+    def setup():
+        clock.time = START
+        rng = np.random.default_rng(0)
+        sensors = _energy_scores(hours, instances, shared, clock, rng)
+        energy = [
+            sensor._energy_history.get(sensor.newest_interval) for sensor in sensors
+        ]
+
+        def tick():
+            clock.tick()
+            for index, sensor in enumerate(sensors):
+                energy[index] += float(rng.uniform(0, 0.3))
+                sensor._state = sensor.process_new_data(
+                    _source_data(rng, energy[index])
+                )
+
+        return tick
+
+    with patch.object(dt, "now", clock):
+        return _measure(setup, samples, instances)
+
+
+def run_savings(instances: int, samples: int):
+    """Cost and PotentialSavings.process_new_data of every instance, per
+    instance"""
+    clock = Clock(START)
+
+    def setup():
+        clock.time = START
+        rng = np.random.default_rng(0)
+        sensors = _savings(instances)
+
+        def tick():
+            clock.tick()
+            for cost, savings, energy in sensors:
+                energy[0] += float(rng.uniform(0, 0.3))
+                data = _source_data(rng, energy[0])
+                cost.process_new_data(data)
+                savings.process_new_data(data, cost.state)
+                # The attributes are formatted as they would be written
+                cost.extra_state_attributes
+                savings.extra_state_attributes
+
+        return tick
+
+    with patch.object(dt, "now", clock):
+        return _measure(setup, samples, instances)
+
+
+def run_normalise(hours: int, samples: int):
+    """normalise_price and normalise_energy of a window, per window"""
+    rng = np.random.default_rng(0)
+    prices = rng.uniform(0.5, 3.0, hours)
+    energy = rng.uniform(0, 2, hours)
+
+    def setup():
+        return lambda: (normalise_price(prices), normalise_energy(energy))
+
+    return _measure(setup, samples, 1)
+
+
+def run_deltas(hours: int, instances: int, samples: int):
+    """calculate_hourly_energy_deltas of the stacked readings of every
+    instance, per instance"""
+    rng = np.random.default_rng(0)
+    readings = np.cumsum(rng.uniform(0, 2, (instances, hours + 1)), axis=1)
+    readings[:, :: max(hours // 10, 1)] = np.nan
+
+    def setup():
+        return lambda: calculate_hourly_energy_deltas(readings)
+
+    return _measure(setup, samples, instances)
+
+
+def run(
+    hours: list[int], instances: list[int], shared: bool, samples: int
+) -> dict[str, dict[str, float]]:
+    """Runs all cases, returns the results by case"""
+    results = {}
+
+    def record(case: str, result: dict[str, float]) -> None:
+        results[case] = result
+        print(
+            f"{case:<55} {result['median_us']:>12.1f} µs "
+            f"p95 {result['p95_us']:>12.1f} µs "
+            f"{result['alloc_bytes']:>10} B "
+            f"peak {result['peak_bytes'] / 2**20:>8.1f} MiB",
+            file=sys.stderr,
+        )
+
+    for window in hours:
+        record(f"normalise[hours={window}]", run_normalise(window, samples))
+        for count in instances:
+            record(
+                f"calculate_hourly_energy_deltas[hours={window},instances={count}]",
+                run_deltas(window, count, samples),
+            )
+            record(
+                f"energyscore.process_new_data[hours={window},instances={count}]",
+                run_energyscore(window, count, shared, samples),
+            )
+    for count in instances:
+        # A day of ticks, as the savings keep the prices of the day
+        record(
+            f"savings.process_new_data[instances={count}]",
+            run_savings(count, max(samples, 144)),
+        )
+    return results
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float,
+    metrics: list[str] = METRICS,
+) -> list[str]:
+    """Prints the change of every metric from the baseline, returns the
+    regressions above the tolerance"""
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        for metric in metrics:
+            old, new = baseline[case].get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            flag = ""
+            if change > tolerance:
+                flag = " REGRESSION"
+                regressions.append(f"{case} {metric}")
+            print(
+                f"{case:<55} {metric:<12} {old:>12} -> {new:>12} {change:>+7.1%}{flag}"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Runs the benchmarks from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=int, nargs="+", default=HOURS)
+    parser.add_argument("--instances", type=int, nargs="+", default=INSTANCES)
+    parser.add_argument(
+        "--samples", type=int, default=50, help="Ticks measured per case"
+    )
+    parser.add_argument(
+        "--shared",
+        action="store_true",
+        help="Let all instances share one price entity",
+    )
+    parser.add_argument("--output", help="Write the results to a JSON file")
+    parser.add_argument("--compare", help="Compare with the results of a JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Relative increase of a metric reported as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.hours, args.instances, args.shared, args.samples)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "environment": {
+                        "machine": platform.machine(),
+                        "numpy": np.__version__,
+                        "python": platform.python_version(),
+                    },
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        if regressions := compare(results, baseline, args.tolerance):
+            print(f"{len(regressions)} regressions", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""Benchmark of the startup of Home Assistant with many EnergyScore entries
+
+Run from the repository root:
+
+    python -m benchmarks.startup --entries 100 --output startup.json
+    python -m benchmarks.startup --compare benchmarks/startup_baseline.json
+
+Every step runs in a new Python process, so the imports are timed as they
+are when Home Assistant starts:
+
+- import: importing the sensor platform, and whether NumPy is loaded by it
+- first_start: setting up the entries from restored states written by an
+  earlier version, which fills the history stores from the attributes
+- restart: setting up the entries again with the stores and the states
+  restored from the first start
+
+Each start reports the time to set up the entries and the time of the first
+update of all of them, the median of a number of runs. The results are written as JSON like the update
+benchmarks, so runs of different versions can be compared.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Metrics where a higher value than the baseline is a regression
+METRICS = ["import_ms", "setup_ms", "first_update_ms"]
+
+ENTRIES = [100]
+
+
+def _config(entries: int, rolling_hours: int) -> dict:
+    return {
+        "sensor": [
+            {
+                "platform": "energyscore",
+                "name": f"Startup {index}",
+                "unique_id": f"startup_{index}",
+                "energy_entity": f"sensor.startup_energy_{index}",
+                "price_entity": "sensor.startup_price",
+                "rolling_hours": rolling_hours,
+            }
+            for index in range(entries)
+        ]
+    }
+
+
+def _restored_states(entries: int, rolling_hours: int) -> list[dict]:
+    """Returns the restore data of the sensors of every entry, as written by
+    an earlier version that kept the history in the attributes"""
+    from homeassistant.core import State
+    from homeassistant.helpers.restore_state import StoredState
+    from homeassistant.util import dt
+
+    from custom_components.energyscore.const import (
+        ATTRIBUTE_HOURS,
+        ENERGY,
+        ENERGY_TODAY,
+        HISTORY,
+        HISTORY_START,
+        HISTORY_STEP,
+        LAST_ENERGY,
+        LAST_UPDATED,
+        PRICES,
+        QUALITY,
+    )
+    from custom_components.energyscore.history import TIME_FORMAT, epoch_hour
+
+    now = dt.now()
+    last_updated = now.strftime(TIME_FORMAT)
+    count = min(rolling_hours, ATTRIBUTE_HOURS) + 1
+    start = epoch_hour(now) - count + 1
+    midnight = dt.start_of_local_day(now)
+    prices = {
+        (midnight + datetime.timedelta(hours=hour)).strftime(TIME_FORMAT): 1.0
+        + hour % 5 / 10
+        for hour in range(now.hour + 1)
+    }
+    states = []
+    for index in range(entries):
+        name = f"sensor.startup_{index}"
+        for entity_id, state, attributes in [
+            (
+                f"{name}_energyscore",
+                "50",
+                {
+                    "energy_entity": f"sensor.startup_energy_{index}",
+                    "price_entity": "sensor.startup_price",
+                    QUALITY: 1.0,
+                    LAST_UPDATED: last_updated,
+                    HISTORY: {
+                        HISTORY_START: start,
+                        HISTORY_STEP: 1,
+                        ENERGY: [1000.0 + hour for hour in range(count)],
+                        PRICES: [1.0 + hour % 5 / 10 for hour in range(count)],
+                    },
+                },
+            ),
+            (
+                f"{name}_cost",
+                "1.5",
+                {LAST_ENERGY: {last_updated: 1000.0}, LAST_UPDATED: last_updated},
+            ),
+            (
+                f"{name}_potential_savings",
+                "0.5",
+                {
+                    ENERGY_TODAY: 1.0,
+                    LAST_ENERGY: {last_updated: 1000.0},
+                    LAST_UPDATED: last_updated,
+                    PRICES: prices,
+                    QUALITY: 1.0,
+                },
+            ),
+        ]:
+            states.append(
+                StoredState(State(entity_id, state, attributes), None, now).as_dict()
+            )
+    return states
+
+
+async def _start(config_dir: str, entries: int, rolling_hours: int, first: bool):
+    """Sets up the entries and updates them once, returns the durations"""
+    from homeassistant import loader
+    from homeassistant.helpers.restore_state import (
+        DATA_RESTORE_STATE_TASK,
+        RestoreStateData,
+    )
+    from homeassistant.setup import async_setup_component
+    from homeassistant.util import dt
+    from pytest_homeassistant_custom_component.common import (
+        async_fire_time_changed,
+        async_test_home_assistant,
+    )
+
+    from custom_components.energyscore.const import SCAN_INTERVAL
+
+    hass = await async_test_home_assistant(asyncio.get_running_loop())
+    hass.config.config_dir = config_dir
+    # Enables the custom integrations, like the test fixture
+    hass.data.pop(loader.DATA_CUSTOM_COMPONENTS)
+    if first:
+        data = await RestoreStateData.async_get_instance(hass)
+        await hass.async_block_till_done()
+        await data.store.async_save(_restored_states(entries, rolling_hours))
+        # Emulate a fresh load
+        hass.data.pop(DATA_RESTORE_STATE_TASK)
+    hass.states.async_set("sensor.startup_price", "1.2")
+    for index in range(entries):
+        hass.states.async_set(
+            f"sensor.startup_energy_{index}",
+            "1100.0",
+            {"state_class": "total_increasing"},
+        )
+
+    start = time.perf_counter()
+    assert await async_setup_component(hass, "sensor", _config(entries, rolling_hours))
+    await hass.async_block_till_done()
+    setup = time.perf_counter() - start
+    assert hass.states.get("sensor.startup_0_energyscore"), "Not set up"
+
+    start = time.perf_counter()
+    async_fire_time_changed(hass, dt.utcnow() + SCAN_INTERVAL)
+    await hass.async_block_till_done()
+    first_update = time.perf_counter() - start
+
+    # Writes the restore data and closes the history stores
+    await hass.async_stop(force=True)
+    return {
+        "setup_ms": round(setup * 1e3, 1),
+        "first_update_ms": round(first_update * 1e3, 1),
+    }
+
+
+def _import() -> dict:
+    start = time.perf_counter()
+    import custom_components.energyscore.sensor  # noqa: F401
+
+    return {
+        "import_ms": round((time.perf_counter() - start) * 1e3, 1),
+        "numpy_loaded": "numpy" in sys.modules,
+    }
+
+
+def _step(step: str, *args: str) -> dict:
+    """Runs a step in a new Python process, returns its result"""
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--step", step, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(process.stdout)
+
+
+def _median(runs: list[dict]) -> dict:
+    """Returns the median of every metric of the runs of a step"""
+    return {
+        key: statistics.median(step[key] for step in runs)
+        if key in METRICS
+        else runs[0][key]
+        for key in runs[0]
+    }
+
+
+def run(entries: list[int], rolling_hours: int, repeat: int) -> dict[str, dict]:
+    """Runs the steps for every number of entries, repeated in new
+    configuration directories"""
+    results = {"import": _median([_step("import") for _ in range(repeat)])}
+    print(f"{'import':<45} {results['import']}", file=sys.stderr)
+    for count in entries:
+        runs: dict[str, list[dict]] = {"first_start": [], "restart": []}
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as config_dir:
+                args = [config_dir, "--entries", str(count)]
+                args += ["--rolling-hours", str(rolling_hours)]
+                for step, step_runs in runs.items():
+                    step_runs.append(_step(step, *args))
+        for step, step_runs in runs.items():
+            case = f"{step}[entries={count},hours={rolling_hours}]"
+            results[case] = _median(step_runs)
+            print(f"{case:<45} {results[case]}", file=sys.stderr)
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Runs the benchmark from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=ENTRIES)
+    parser.add_argument("--rolling-hours", type=int, default=168)
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Runs of every step, the median is kept"
+    )
+    parser.add_argument("--output", help="Write the results to a JSON file")
+    parser.add_argument("--compare", help="Compare with the results of a JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Relative increase of a metric reported as a regression",
+    )
+    parser.add_argument(
+        "--step",
+        choices=["import", "first_start", "restart"],
+        help=argparse.SUPPRESS,
+    )
+    parser.add_argument("config_dir", nargs="?", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.step == "import":
+        print(json.dumps(_import()))
+        return 0
+    if args.step:
+        os.makedirs(os.path.join(args.config_dir, ".storage"), exist_ok=True)
+        result = asyncio.run(
+            _start(
+                args.config_dir,
+                args.entries[0],
+                args.rolling_hours,
+                args.step == "first_start",
+            )
+        )
+        print(json.dumps(result))
+        return 0
+
+    results = run(args.entries, args.rolling_hours, args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "environment": {
+                        "machine": platform.machine(),
+                        "python": platform.python_version(),
+                    },
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+    if args.compare:
+        # The update benchmarks import the integration
+        from .benchmark import compare
+
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        if regressions := compare(results, baseline, args.tolerance, METRICS):
+            print(f"{len(regressions)} regressions", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
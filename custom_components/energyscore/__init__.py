@@ -5,15 +5,32 @@ Inspiration from
 - https://developers.home-assistant.io/docs/config_entries_index/
 """
 
-import logging
-
-from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from __future__ import annotations
 
-from .const import CONF_ROLLING_HOURS, CONF_TRESHOLD, DOMAIN
-
-PLATFORMS = [Platform.SENSOR]
+import logging
+from typing import TYPE_CHECKING
+
+from .const import (
+    CONF_BACKFILL,
+    CONF_COALESCE,
+    CONF_EVENT_DRIVEN,
+    CONF_INTERVAL,
+    CONF_MAX_SHIFTABLE_POWER,
+    CONF_PRICE_ATTRIBUTES,
+    CONF_ROLLING_HOURS,
+    CONF_SCORE_WINDOWS,
+    CONF_TRESHOLD,
+    DOMAIN,
+    INTERVALS,
+)
+
+# Home Assistant is only imported by the platforms, so the engine can be
+# imported without it
+if TYPE_CHECKING:
+    from homeassistant.config_entries import ConfigEntry
+    from homeassistant.core import HomeAssistant
+
+PLATFORMS = ["sensor"]
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
@@ -28,7 +45,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     entry.async_on_unload(entry.add_update_listener(update_listener))
 
     # Forward the setup to the sensor platform.
-    await hass.config_entries.async_forward_entry_setups(entry, ["sensor"])
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     return True
 
 
@@ -42,9 +59,33 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     return await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the history stores and runtime state of a removed config entry."""
+    from homeassistant.const import CONF_UNIQUE_ID
+
+    from .runtime import async_get_runtime_store
+    from .store import history_path, remove_history
+
+    unique_id = entry.data[CONF_UNIQUE_ID]
+    for interval in INTERVALS:
+        await hass.async_add_executor_job(
+            remove_history, history_path(hass, unique_id, interval)
+        )
+    if (runtime := async_get_runtime_store(hass)) is not None:
+        runtime.async_remove(
+            [unique_id, f"{unique_id}_cost", f"{unique_id}_potential_savings"]
+        )
+
+
 async def async_setup(hass: HomeAssistant, config: dict) -> bool:
     """Set up the EnergyScore integration from yaml configuration."""
+    from .runtime import async_load_runtime_store
+    from .services import async_setup_services
+
     hass.data.setdefault(DOMAIN, {})
+    # The runtime state of all sensors is read once, before they are set up
+    await async_load_runtime_store(hass)
+    async_setup_services(hass)
     return True
 
 
@@ -53,7 +94,6 @@ async def async_migrate_entry(hass: HomeAssistant, config_entry: ConfigEntry):
     _LOGGER.debug("Migrating from version %s", config_entry.version)
 
     if config_entry.version == 1:
-
         added_options = {}
         added_options[CONF_TRESHOLD] = 0
         added_options[CONF_ROLLING_HOURS] = 24
@@ -61,6 +101,61 @@ async def async_migrate_entry(hass: HomeAssistant, config_entry: ConfigEntry):
         config_entry.version = 2
         hass.config_entries.async_update_entry(config_entry, options=added_options)
 
+    if config_entry.version == 2:
+        added_options = {**config_entry.options}
+        added_options[CONF_EVENT_DRIVEN] = False
+
+        config_entry.version = 3
+        hass.config_entries.async_update_entry(config_entry, options=added_options)
+
+    if config_entry.version == 3:
+        added_options = {**config_entry.options}
+        added_options[CONF_SCORE_WINDOWS] = []
+
+        config_entry.version = 4
+        hass.config_entries.async_update_entry(config_entry, options=added_options)
+
+    if config_entry.version == 4:
+        # The history moves from the state attributes to a history store, which
+        # is filled from the restored attributes on the first start. Later
+        # layouts of the store are versioned by its file name, see STORE_VERSION
+        config_entry.version = 5
+
+    if config_entry.version == 5:
+        added_options = {**config_entry.options}
+        added_options[CONF_BACKFILL] = False
+
+        config_entry.version = 6
+        hass.config_entries.async_update_entry(config_entry, options=added_options)
+
+    if config_entry.version == 6:
+        added_options = {**config_entry.options}
+        added_options[CONF_PRICE_ATTRIBUTES] = False
+
+        config_entry.version = 7
+        hass.config_entries.async_update_entry(config_entry, options=added_options)
+
+    if config_entry.version == 7:
+        added_options = {**config_entry.options}
+        added_options[CONF_INTERVAL] = 60
+
+        config_entry.version = 8
+        hass.config_entries.async_update_entry(config_entry, options=added_options)
+
+    if config_entry.version == 8:
+        added_options = {**config_entry.options}
+        added_options[CONF_COALESCE] = False
+
+        config_entry.version = 9
+        hass.config_entries.async_update_entry(config_entry, options=added_options)
+
+    if config_entry.version == 9:
+        added_options = {**config_entry.options}
+        added_options[CONF_MAX_SHIFTABLE_POWER] = 0
+
+        config_entry.version = 10
+        hass.config_entries.async_update_entry(config_entry, options=added_options)
+
     _LOGGER.info("Migration to version %s successful", config_entry.version)
 
     return True
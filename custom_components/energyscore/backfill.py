@@ -0,0 +1,63 @@
+"""Backfill of the history from the recorder statistics"""
+from __future__ import annotations
+
+from collections import defaultdict
+import datetime
+from typing import Literal
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.statistics import statistics_during_period
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt
+
+from .history import epoch_interval, interval_start
+
+
+async def async_interval_statistics(
+    hass: HomeAssistant,
+    statistic_id: str,
+    statistic_type: Literal["mean", "state"],
+    first: int,
+    last: int,
+    minutes: int = 60,
+) -> dict[int, float]:
+    """Returns the statistics of an entity from the first to the last epoch
+    interval of the given minutes, with one query in the recorder executor
+
+    Intervals shorter than an hour are taken from the 5 minute statistics,
+    which the recorder keeps for a shorter time than the hourly statistics.
+    """
+    start = interval_start(first, minutes, dt.DEFAULT_TIME_ZONE)
+    end = interval_start(last + 1, minutes, dt.DEFAULT_TIME_ZONE)
+    statistics = await get_instance(hass).async_add_executor_job(
+        statistics_during_period,
+        hass,
+        start,
+        end,
+        [statistic_id],
+        "hour" if minutes == 60 else "5minute",
+        None,
+        {statistic_type},
+    )
+    values: defaultdict[int, list[float]] = defaultdict(list)
+    for row in statistics.get(statistic_id, []):
+        if (value := row.get(statistic_type)) is None:
+            continue
+        row_end = row["end"]
+        if not isinstance(row_end, datetime.datetime):
+            row_end = dt.utc_from_timestamp(row_end)
+        # The value is for the local interval the statistics period ends in
+        interval = epoch_interval(
+            dt.as_local(row_end - datetime.timedelta(seconds=1)), minutes
+        )
+        values[interval].append(float(value))
+    # The state at the end of an interval, or the mean over it
+    return {
+        interval: round(
+            interval_values[-1]
+            if statistic_type == "state"
+            else sum(interval_values) / len(interval_values),
+            2,
+        )
+        for interval, interval_values in values.items()
+    }
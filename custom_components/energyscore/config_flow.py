@@ -16,11 +16,21 @@ import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
 
 from .const import (
+    CONF_BACKFILL,
+    CONF_COALESCE,
     CONF_ENERGY_ENTITY,
+    CONF_EVENT_DRIVEN,
+    CONF_INTERVAL,
+    CONF_MAX_SHIFTABLE_POWER,
+    CONF_PRICE_ATTRIBUTES,
     CONF_PRICE_ENTITY,
     CONF_ROLLING_HOURS,
+    CONF_SCORE_WINDOWS,
     CONF_TRESHOLD,
     DOMAIN,
+    INTERVALS,
+    MAX_ROLLING_HOURS,
+    SCORE_WINDOWS,
 )
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
@@ -45,7 +55,7 @@ CONFIG_SCHEMA = vol.Schema(
 class EnergyScoreConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """EnergyScore config flow."""
 
-    VERSION = 2
+    VERSION = 10
 
     async def async_step_user(self, user_input: dict[str, Any] | None = None):
         """Invoked when a user initiates a flow via the user interface."""
@@ -67,6 +77,13 @@ class EnergyScoreConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             # Set the default options:
             self.options[CONF_TRESHOLD] = 0
             self.options[CONF_ROLLING_HOURS] = 24
+            self.options[CONF_EVENT_DRIVEN] = False
+            self.options[CONF_SCORE_WINDOWS] = []
+            self.options[CONF_BACKFILL] = False
+            self.options[CONF_PRICE_ATTRIBUTES] = False
+            self.options[CONF_INTERVAL] = 60
+            self.options[CONF_COALESCE] = False
+            self.options[CONF_MAX_SHIFTABLE_POWER] = 0
 
             return self.async_create_entry(
                 title=self.data["name"], data=self.data, options=self.options
@@ -110,7 +127,35 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                 ): vol.Coerce(float),
                 vol.Required(
                     CONF_ROLLING_HOURS, default=self.current_options[CONF_ROLLING_HOURS]
-                ): vol.All(int, vol.Range(min=2, max=168)),
+                ): vol.All(int, vol.Range(min=2, max=MAX_ROLLING_HOURS)),
+                vol.Required(
+                    CONF_EVENT_DRIVEN, default=self.current_options[CONF_EVENT_DRIVEN]
+                ): bool,
+                vol.Required(
+                    CONF_SCORE_WINDOWS,
+                    default=self.current_options[CONF_SCORE_WINDOWS],
+                ): selector.SelectSelector(
+                    selector.SelectSelectorConfig(
+                        options=list(SCORE_WINDOWS), multiple=True
+                    ),
+                ),
+                vol.Required(
+                    CONF_BACKFILL, default=self.current_options[CONF_BACKFILL]
+                ): bool,
+                vol.Required(
+                    CONF_PRICE_ATTRIBUTES,
+                    default=self.current_options[CONF_PRICE_ATTRIBUTES],
+                ): bool,
+                vol.Required(
+                    CONF_INTERVAL, default=self.current_options[CONF_INTERVAL]
+                ): vol.In(INTERVALS),
+                vol.Required(
+                    CONF_COALESCE, default=self.current_options[CONF_COALESCE]
+                ): bool,
+                vol.Required(
+                    CONF_MAX_SHIFTABLE_POWER,
+                    default=self.current_options[CONF_MAX_SHIFTABLE_POWER],
+                ): vol.All(vol.Coerce(float), vol.Range(min=0)),
             }
         )
 
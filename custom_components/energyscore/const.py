@@ -1,25 +1,58 @@
 """Constants for EnergyScore"""
+import datetime
+
 # Base component constants
 DOMAIN = "energyscore"
 
+# Time between updating data
+SCAN_INTERVAL = datetime.timedelta(minutes=10)
+
+# Shortest time between event driven updates, in seconds
+REFRESH_COOLDOWN = 5
+
 # Icons
 ICON = "mdi:speedometer"
 ICON_COST = "mdi:currency-eur"
 ICON_SAVINGS = "mdi:piggy-bank"
+ICON_DIAGNOSTIC = "mdi:timer-outline"
 
 # Configuration and options
+CONF_BACKFILL = "backfill"
+CONF_COALESCE = "coalesce_energy"
+CONF_PRICE_ATTRIBUTES = "price_attributes"
 CONF_PRICE_ENTITY = "price_entity"
 CONF_ENERGY_ENTITY = "energy_entity"
+CONF_EVENT_DRIVEN = "event_driven"
+CONF_INTERVAL = "interval"
+CONF_MAX_SHIFTABLE_POWER = "max_shiftable_power"
 CONF_ROLLING_HOURS = "rolling_hours"
+CONF_SCORE_WINDOWS = "score_windows"
 CONF_TRESHOLD = "energy_treshold"
 
 # Other
 COST_AVG = "average_cost"
 COST_MAX = "maximum_cost"
 COST_MIN = "minimum_cost"
+DAY_ENERGY = "day_energy"
+DAY_PRICES = "day_prices"
 ENERGY = "total_energy"
 ENERGY_TODAY = "energy_today"
+HISTORY = "history"
+HISTORY_START = "start"
+HISTORY_STEP = "step"
 LAST_ENERGY = "last_updated_energy"
 LAST_UPDATED = "last_updated"
 PRICES = "price"
 QUALITY = "quality"
+SCORE = "score"
+SCORES = "scores"
+
+# Longest history kept, and hours of it shown in the state attributes
+MAX_ROLLING_HOURS = 8760
+ATTRIBUTE_HOURS = 168
+
+# Lengths of the intervals prices and energy are kept for, in minutes
+INTERVALS = [15, 30, 60]
+
+# Extra windows an EnergyScore can be calculated over, in hours
+SCORE_WINDOWS = {"24h": 24, "7d": 168, "30d": 720}
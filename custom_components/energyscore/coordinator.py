@@ -0,0 +1,340 @@
+"""Data update coordinator for EnergyScore"""
+from __future__ import annotations
+
+from collections import defaultdict
+import datetime
+import logging
+from typing import Any, Callable, Mapping, NamedTuple
+
+from homeassistant.const import (
+    ATTR_UNIT_OF_MEASUREMENT,
+    CONF_NAME,
+    STATE_UNAVAILABLE,
+    STATE_UNKNOWN,
+)
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers.debounce import Debouncer
+import homeassistant.helpers.entity_registry as er
+from homeassistant.helpers.event import (
+    async_track_state_change_event,
+    async_track_time_change,
+)
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.util import dt
+
+from .const import (
+    CONF_ENERGY_ENTITY,
+    CONF_PRICE_ENTITY,
+    REFRESH_COOLDOWN,
+    SCAN_INTERVAL,
+)
+from .engine import EnergyAggregator, IntervalEnergy
+from .history import epoch_interval
+from .metrics import UpdateMetrics
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class SourceData(NamedTuple):
+    """Validated states of the price and energy entities"""
+
+    price: float
+    energy: float
+    energy_attributes: Mapping[str, Any]
+    prices: Mapping[int, float]  # Published prices by epoch interval
+
+
+def interval_prices(
+    attributes: Mapping[str, Any], minutes: int = 60, day: str = "today"
+) -> dict[int, float]:
+    """Returns the prices of today, or of tomorrow, published in the
+    attributes of a Nord Pool style price entity, by epoch interval of the
+    given minutes
+
+    The timestamped raw_today attribute is used if present, else the today
+    list, which covers today from local midnight, and likewise for tomorrow.
+    Prices of shorter market intervals are averaged, and the price of a longer
+    market interval is given to every interval it covers.
+    """
+    periods: list[tuple[datetime.datetime, datetime.datetime, Any]] = []
+    if attributes.get(f"raw_{day}"):
+        for period in attributes[f"raw_{day}"]:
+            start, end = (
+                dt.parse_datetime(time) if isinstance(time, str) else time
+                for time in (period.get("start"), period.get("end"))
+            )
+            if isinstance(start, datetime.datetime):
+                if not isinstance(end, datetime.datetime):
+                    # Only the interval it starts in is known
+                    end = start + datetime.timedelta(seconds=1)
+                periods.append((start, end, period.get("value")))
+    elif attributes.get(day):
+        # Days have 23 or 25 hours when daylight saving time starts or ends
+        date = dt.now().date() + datetime.timedelta(days=day == "tomorrow")
+        midnight = dt.start_of_local_day(date).timestamp()
+        seconds = (
+            dt.start_of_local_day(date + datetime.timedelta(days=1)).timestamp()
+            - midnight
+        )
+        length = seconds / len(attributes[day])
+        if length % 60 == 0:
+            periods = [
+                (
+                    dt.utc_from_timestamp(midnight + index * length),
+                    dt.utc_from_timestamp(midnight + (index + 1) * length),
+                    value,
+                )
+                for index, value in enumerate(attributes[day])
+            ]
+
+    intervals: defaultdict[int, list[float]] = defaultdict(list)
+    for start, end, value in periods:
+        if not isinstance(value, (float, int)):
+            continue
+        first = epoch_interval(dt.as_local(start), minutes)
+        last = epoch_interval(dt.as_local(end - datetime.timedelta(seconds=1)), minutes)
+        for interval in range(first, last + 1):
+            intervals[interval].append(value)
+    return {
+        interval: round(sum(values) / len(values), 2)
+        for interval, values in intervals.items()
+    }
+
+
+class EnergyScoreCoordinator(DataUpdateCoordinator[SourceData | None]):
+    """Fetches the source states once per update for all EnergyScore sensors
+
+    The data is None when the source states could not be used. In event driven
+    mode there is no polling, and the data is refreshed when the state of a
+    source entity changes and at the start of every interval. These refreshes
+    are debounced, so a meter reporting every few seconds, or the price and
+    energy changing at once, refresh at most once per cooldown.
+
+    The unit of measurement of the cost is only resolved again when
+    cost_unit_valid is cleared, which happens when a source entity is updated
+    in the entity registry or the unit of a source state changes.
+
+    With price_attributes, the prices published in the attributes of the price
+    entity are parsed as well, by interval. The fetches are timed in the
+    metrics of the entry.
+
+    With coalesce, every state change of the energy entity is added to an
+    energy aggregator, and the energy listeners get the energy used during
+    each completed interval when the first reading of a new interval arrives.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        config,
+        event_driven: bool,
+        price_attributes: bool = False,
+        interval: int = 60,
+        coalesce: bool = False,
+    ) -> None:
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=config[CONF_NAME],
+            update_interval=None if event_driven else SCAN_INTERVAL,
+            request_refresh_debouncer=Debouncer(
+                hass, _LOGGER, cooldown=REFRESH_COOLDOWN, immediate=True
+            ),
+        )
+        self.cost_unit_valid = False
+        self.energy_aggregator = (
+            EnergyAggregator(interval, dt.DEFAULT_TIME_ZONE) if coalesce else None
+        )
+        self.energy_entity = config[CONF_ENERGY_ENTITY]
+        self.event_driven = event_driven
+        self.interval = interval
+        self.metrics = UpdateMetrics()
+        self.price_attributes = price_attributes
+        self.price_entity = config[CONF_PRICE_ENTITY]
+        self._energy_listeners: list[Callable[[list[IntervalEnergy]], None]] = []
+        self._listener_count = 0
+        self._source_units: tuple[str | None, str | None] | None = None
+        self._unsub_sources: list[CALLBACK_TYPE] = []
+
+    @callback
+    def async_add_listener(
+        self, update_callback: CALLBACK_TYPE, context: Any = None
+    ) -> Callable[[], None]:
+        """Listen for data updates, following the sources while listened to"""
+        remove_listener = super().async_add_listener(update_callback, context)
+        self._listener_count += 1
+        if not self._unsub_sources:
+            self._async_track_sources()
+
+        @callback
+        def _remove_listener() -> None:
+            remove_listener()
+            self._listener_count -= 1
+            if self._listener_count == 0:
+                while self._unsub_sources:
+                    self._unsub_sources.pop()()
+
+        return _remove_listener
+
+    @callback
+    def async_add_energy_listener(
+        self, energy_callback: Callable[[list[IntervalEnergy]], None]
+    ) -> CALLBACK_TYPE:
+        """Listen for the energy of completed intervals when coalescing,
+        returns a callback to stop listening"""
+        self._energy_listeners.append(energy_callback)
+        return lambda: self._energy_listeners.remove(energy_callback)
+
+    @callback
+    def _async_track_sources(self) -> None:
+        """Follow the registry entries, and in event driven mode the states, of
+        the source entities"""
+
+        @callback
+        def _async_registry_updated(event: Event) -> None:
+            if self.price_entity in (
+                event.data.get("entity_id"),
+                event.data.get("old_entity_id"),
+            ) or self.energy_entity in (
+                event.data.get("entity_id"),
+                event.data.get("old_entity_id"),
+            ):
+                self.cost_unit_valid = False
+
+        self._unsub_sources = [
+            self.hass.bus.async_listen(
+                er.EVENT_ENTITY_REGISTRY_UPDATED, _async_registry_updated
+            )
+        ]
+        if self.energy_aggregator is not None:
+            self._unsub_sources.append(
+                async_track_state_change_event(
+                    self.hass, self.energy_entity, self._async_energy_changed
+                )
+            )
+        if not self.event_driven:
+            return
+
+        async def _async_source_changed(event: Event) -> None:
+            old_state = event.data.get("old_state")
+            new_state = event.data.get("new_state")
+            if (
+                old_state is not None
+                and new_state is not None
+                and old_state.state == new_state.state
+            ):
+                # Only attributes changed
+                self._async_check_source_units()
+                return
+            await self.async_request_refresh()
+
+        async def _async_interval_changed(now: datetime.datetime) -> None:
+            await self.async_request_refresh()
+
+        self._unsub_sources += [
+            async_track_state_change_event(
+                self.hass,
+                [self.price_entity, self.energy_entity],
+                _async_source_changed,
+            ),
+            async_track_time_change(
+                self.hass,
+                _async_interval_changed,
+                minute=f"/{self.interval}",
+                second=0,
+            ),
+        ]
+
+    @callback
+    def _async_energy_changed(self, event: Event) -> None:
+        """Adds a new energy reading to the aggregator, and passes the energy
+        of the intervals it completes to the energy listeners"""
+        new_state = event.data.get("new_state")
+        old_state = event.data.get("old_state")
+        if new_state is None or (
+            old_state is not None and old_state.state == new_state.state
+        ):
+            return
+        try:
+            total = float(new_state.state)
+        except ValueError:
+            # Unavailable or unknown, the usage is given to the next reading
+            return
+        price = self._current_price()
+        completed = self.energy_aggregator.add(
+            new_state.last_updated.timestamp(), total, price
+        )
+        if not completed:
+            return
+        # Intervals without readings get the published price, else the current
+        prices = self.data.prices if self.data is not None else {}
+        completed = [
+            interval
+            if interval.price is not None
+            else interval._replace(price=prices.get(interval.interval, price))
+            for interval in completed
+        ]
+        for energy_callback in list(self._energy_listeners):
+            energy_callback(completed)
+
+    @callback
+    def _current_price(self) -> float | None:
+        """Returns the price of the price state, None if not available"""
+        if (state := self.hass.states.get(self.price_entity)) is None:
+            return None
+        try:
+            return round(float(state.state), 2)
+        except ValueError:
+            return None
+
+    @callback
+    def _async_check_source_units(self) -> None:
+        """Invalidates the cost unit if the unit of a source state has changed"""
+        units = tuple(
+            state.attributes.get(ATTR_UNIT_OF_MEASUREMENT) if state else None
+            for state in (
+                self.hass.states.get(self.price_entity),
+                self.hass.states.get(self.energy_entity),
+            )
+        )
+        if units != self._source_units:
+            self._source_units = units
+            self.cost_unit_valid = False
+
+    async def _async_update_data(self) -> SourceData | None:
+        """Fetches the source data, timed in the metrics of the entry"""
+        with self.metrics.time_fetch():
+            return self._async_fetch_source_data()
+
+    @callback
+    def _async_fetch_source_data(self) -> SourceData | None:
+        """Fetches and validates the price and energy states"""
+        self._async_check_source_units()
+        price = self.hass.states.get(self.price_entity)
+        energy = self.hass.states.get(self.energy_entity)
+        if price is None or energy is None:
+            _LOGGER.error("%s - Could not fetch price and energy data", self.name)
+            return None
+
+        if price.state in [STATE_UNAVAILABLE, STATE_UNKNOWN]:
+            _LOGGER.info("%s - Price data is %s", self.name, price.state)
+        if energy.state in [STATE_UNAVAILABLE, STATE_UNKNOWN]:
+            _LOGGER.info("%s - Energy data is %s", self.name, energy.state)
+        if price.state in [STATE_UNAVAILABLE, STATE_UNKNOWN] or energy.state in [
+            STATE_UNAVAILABLE,
+            STATE_UNKNOWN,
+        ]:
+            return None
+
+        try:
+            return SourceData(
+                price=round(float(price.state), 2),
+                energy=round(float(energy.state), 2),
+                energy_attributes=energy.attributes,
+                prices=interval_prices(price.attributes, self.interval)
+                if self.price_attributes
+                else {},
+            )
+        except ValueError:
+            _LOGGER.exception("%s - Possibly non-numeric source state", self.name)
+            return None
@@ -0,0 +1,457 @@
+"""Calculations of EnergyScore, cost and potential savings
+
+Free of Home Assistant imports, so the calculations can be used and
+benchmarked on their own. The sensors adapt the source states to the inputs
+and the results to their states and attributes.
+"""
+from __future__ import annotations
+
+import datetime
+from typing import Any, Iterable, Mapping, NamedTuple
+
+from .history import epoch_interval, interval_start
+from .lazy import LazyModule
+from .score import StackedScores, WindowScore  # noqa: F401 - Part of the engine
+
+np = LazyModule("numpy")
+
+
+def normalise_price(prices: np.ndarray) -> np.ndarray:
+    """Normalises prices to (max - P) / (max - min), 1 if all prices are
+    equal, keeping unknown prices as NaN"""
+    prices = np.asarray(prices, dtype=float)
+    known = ~np.isnan(prices)
+    if not known.any():
+        return np.full(prices.shape, np.nan)
+    high, low = prices[known].max(), prices[known].min()
+    if high == low:
+        return np.where(known, 1.0, np.nan)
+    return (high - prices) / (high - low)
+
+
+def normalise_energy(energy: np.ndarray) -> np.ndarray:
+    """Normalises the energy along the last axis to sum up to 1, NaN without
+    energy usage"""
+    energy = np.asarray(energy, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return energy / energy.sum(axis=-1, keepdims=True)
+
+
+def interval_values(values: Mapping[int, float], first: int, count: int) -> np.ndarray:
+    """Returns values by interval, e.g. published prices, as an array of count
+    intervals from first, NaN where missing"""
+    return np.array(
+        [values.get(interval, np.nan) for interval in range(first, first + count)],
+        dtype=float,
+    )
+
+
+class EnergyDeltas(NamedTuple):
+    """Hourly energy usage calculated from total energy readings"""
+
+    usage: np.ndarray  # Energy used during each hour, NaN if not available
+    valid: np.ndarray  # The usage of the hour could be calculated
+    reset: np.ndarray  # The energy sensor was reset or rolled over during the hour
+    missing: np.ndarray  # The reading of the hour or the hour before is missing
+
+
+def calculate_hourly_energy_deltas(
+    readings: np.ndarray, held: np.ndarray | None = None
+) -> EnergyDeltas:
+    """Calculate energy usage per hour from contiguous hourly total readings
+
+    The last axis is the hours, so several energy sensors can be calculated at
+    once by stacking their readings. Readings that are None are given as NaN,
+    and held marks which hours have a reading at all. The first hour never
+    gets a usage since the reading of the hour before is unknown.
+    """
+    readings = np.asarray(readings, dtype=float)
+    if held is None:
+        held = np.ones(readings.shape, dtype=bool)
+    previous = np.full(readings.shape, np.nan)
+    previous[..., 1:] = readings[..., :-1]
+    previous_held = np.zeros(readings.shape, dtype=bool)
+    previous_held[..., 1:] = held[..., :-1]
+
+    missing = ~(held & previous_held)
+    valid = ~missing & ~np.isnan(readings)
+    # A reading after None, or declining, means the energy sensor is resetting
+    with np.errstate(invalid="ignore"):
+        reset = valid & (np.isnan(previous) | (readings < previous))
+    usage = np.where(reset, readings, readings - previous)
+    usage[~valid] = np.nan
+    return EnergyDeltas(usage, valid, reset, missing)
+
+
+def usage_above_treshold(
+    first: int, readings: np.ndarray, held: np.ndarray, treshold: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the intervals and the energy usage of the intervals with usage
+    above treshold, from the total readings of contiguous intervals starting
+    at the first"""
+    deltas = calculate_hourly_energy_deltas(readings, held)
+    with np.errstate(invalid="ignore"):
+        used = deltas.valid & (deltas.usage >= treshold)
+    intervals = np.arange(first, first + len(readings))
+    return intervals[used], deltas.usage[used]
+
+
+def calculate_energy_usage(energy_dict: dict) -> float:
+    """Calculate energy usage based on two consecutive energy readings"""
+    if len(energy_dict) == 2 and all(
+        isinstance(value, float) for value in energy_dict.values()
+    ):
+        earliest = energy_dict[min(energy_dict)]
+        latest = energy_dict[max(energy_dict)]
+        if latest >= earliest:  # Check totalling sensor
+            return latest - earliest
+        else:
+            return latest
+    else:
+        return None
+
+
+class IntervalEnergy(NamedTuple):
+    """Energy used during a completed interval, and the price of the interval"""
+
+    interval: int  # Epoch interval
+    energy: float
+    price: float | None  # The last price seen during the interval, if any
+
+
+class EnergyAggregator:
+    """Coalesces the total energy readings of a frequently reporting meter into
+    the energy used per interval
+
+    Only the reading before and the energy of the current interval are kept,
+    so adding a reading is O(1) and the memory is fixed however often the
+    meter reports. The usage between two readings is split over the intervals
+    they span in proportion to the time spent in each, so energy used across
+    the start of an interval is given to the right interval. A declining
+    reading means the meter was reset, like in calculate_energy_usage.
+
+    The intervals are the local intervals of the time zone, numbered by
+    epoch_interval like the history.
+    """
+
+    def __init__(
+        self, minutes: int = 60, tz: datetime.tzinfo = datetime.timezone.utc
+    ) -> None:
+        self._minutes = minutes
+        self._tz = tz
+        self._interval: int | None = None
+        self._energy = 0.0
+        self._price: float | None = None
+        self.reading: tuple[float, float] | None = None  # (timestamp, total)
+
+    def add(
+        self, timestamp: float, total: float, price: float | None = None
+    ) -> list[IntervalEnergy]:
+        """Adds a total energy reading and the price at the time of it, returns
+        the intervals completed by it, oldest first"""
+        interval = epoch_interval(
+            datetime.datetime.fromtimestamp(timestamp, self._tz), self._minutes
+        )
+        if self.reading is None:
+            # The first reading is only a starting point
+            self._interval, self._price = interval, price
+            self.reading = (timestamp, total)
+            return []
+        if timestamp <= self.reading[0]:
+            return []
+        last_timestamp, last_total = self.reading
+        self.reading = (timestamp, total)
+        usage = total - last_total if total >= last_total else total
+
+        completed = []
+        if interval != self._interval:
+            span = timestamp - last_timestamp
+            for current in range(self._interval, interval):
+                # The part of the usage before the end of the interval
+                start, end = self._start(current), self._start(current + 1)
+                share = usage * (end - max(last_timestamp, start)) / span
+                completed.append(
+                    IntervalEnergy(current, self._energy + share, self._price)
+                )
+                self._energy, self._price = 0.0, None
+            usage *= (timestamp - self._start(interval)) / span
+            self._interval = interval
+        self._energy += usage
+        if price is not None:
+            self._price = price
+        return completed
+
+    def _start(self, interval: int) -> float:
+        """Returns the timestamp of the start of an interval"""
+        return interval_start(interval, self._minutes, self._tz).timestamp()
+
+
+def window_result(window: WindowScore, length: int) -> tuple[int | None, float]:
+    """Returns the score in percent and the quality of a window of the given
+    number of intervals, the score None without energy usage"""
+    quality = round(min(window.price_count, window.energy_count) / length, 2)
+    if quality == 0 or window.score is None:
+        return None, quality
+    return int(window.score * 100), quality
+
+
+def accumulate(total: float | None, value: float, new_day: bool) -> float:
+    """Adds a value to a daily total, which starts again on a new day"""
+    if new_day or total is None:
+        return round(value, 2)
+    return round(total + value, 2)
+
+
+class SavingsCosts(NamedTuple):
+    """Costs of the energy used today at the average, minimum and maximum
+    price of today"""
+
+    average: float
+    minimum: float
+    maximum: float
+
+
+class DayPrices:
+    """Running count, sum, minimum and maximum of the prices of the intervals
+    of a day, so the savings costs take the same work however many intervals
+    the day has
+
+    Intervals are keyed by their start timestamp. The price of the current
+    interval may still change, so it is only added to the aggregates when a
+    later interval is set.
+    """
+
+    def __init__(
+        self,
+        count: int = 0,
+        total: float = 0.0,
+        minimum: float | None = None,
+        maximum: float | None = None,
+        key: float | None = None,
+        price: float | None = None,
+    ) -> None:
+        self._count = count
+        self._total = total
+        self._minimum = minimum
+        self._maximum = maximum
+        self.key = key  # The current interval
+        self.price = price
+
+    @classmethod
+    def from_prices(cls, prices: Iterable[tuple[float, float]]) -> DayPrices:
+        """Returns the aggregates of the prices by interval key"""
+        day_prices = cls()
+        for key, price in sorted(prices):
+            day_prices.set(key, price)
+        return day_prices
+
+    def as_dict(self) -> dict[str, Any]:
+        """Returns the aggregates to store, given to the constructor again"""
+        return {
+            "count": self._count,
+            "total": self._total,
+            "minimum": self._minimum,
+            "maximum": self._maximum,
+            "key": self.key,
+            "price": self.price,
+        }
+
+    @property
+    def count(self) -> int:
+        """The number of intervals with a price"""
+        return self._count + (self.price is not None)
+
+    def set(self, key: float, price: float) -> None:
+        """Sets the price of the current interval, or of a later one"""
+        if self.key is not None and key != self.key:
+            self._add(self.price)
+        self.key, self.price = key, price
+
+    def _add(self, price: float) -> None:
+        self._count += 1
+        self._total += price
+        self._minimum = price if self._minimum is None else min(self._minimum, price)
+        self._maximum = price if self._maximum is None else max(self._maximum, price)
+
+    def costs(self, energy: float) -> SavingsCosts:
+        """Returns the costs of the energy at the average, minimum and maximum
+        price of the day"""
+        total, minimum, maximum = self._total, self._minimum, self._maximum
+        if self.price is not None:
+            total += self.price
+            minimum = self.price if minimum is None else min(minimum, self.price)
+            maximum = self.price if maximum is None else max(maximum, self.price)
+        return SavingsCosts(
+            round(total / self.count * energy, 2),
+            round(minimum * energy, 2),
+            round(maximum * energy, 2),
+        )
+
+
+def minimum_cost(
+    energy: np.ndarray, prices: np.ndarray, max_shift: float | None = None
+) -> float:
+    """Returns the lowest cost of the energy used during the intervals of a
+    day at their prices, if up to max_shift of the energy of every interval
+    could have been used during other intervals instead
+
+    Every interval keeps at least its energy less max_shift and can take up
+    to max_shift more, and the energy in between is filled into the cheapest
+    intervals first, with one sort of the prices. Without max_shift all the
+    energy could have been used at the lowest price.
+    """
+    if len(prices) == 0:
+        return 0.0
+    return round(float(_minimum_costs(energy, prices, max_shift)), 2)
+
+
+def _minimum_costs(
+    energy: np.ndarray, prices: np.ndarray, max_shift: float | None
+) -> np.ndarray:
+    """Returns the minimum costs of the energy along the last axis, so many
+    energy profiles share the one sort of the prices"""
+    energy = np.asarray(energy, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    if max_shift is None:
+        return prices.min() * energy.sum(axis=-1)
+    lower = np.maximum(energy - max_shift, 0)
+    order = np.argsort(prices, kind="stable")
+    capacity = (energy + max_shift - lower)[..., order]
+    # Each interval takes what is left after the cheaper intervals are full
+    left = (energy.sum(axis=-1) - lower.sum(axis=-1))[..., np.newaxis] - (
+        np.cumsum(capacity, axis=-1) - capacity
+    )
+    filled = np.clip(left, 0, capacity)
+    return lower @ prices + filled @ prices[order]
+
+
+def day_costs(
+    day_prices: DayPrices,
+    energy_today: float,
+    energy: Mapping[Any, float],
+    prices: Mapping[Any, float],
+    max_shift: float | None = None,
+) -> SavingsCosts:
+    """Returns the costs of the energy used today at the average, minimum and
+    maximum price of the day
+
+    With max_shift, the minimum cost is the minimum_cost of the energy of each
+    interval at its price, by the keys of the prices. Energy of intervals
+    without a price has no cost, like in the Cost sensor.
+    """
+    costs = day_prices.costs(energy_today)
+    if max_shift is None:
+        return costs
+    return costs._replace(
+        minimum=minimum_cost(
+            [energy.get(key, 0.0) for key in prices],
+            list(prices.values()),
+            max_shift,
+        )
+    )
+
+
+class ScheduleResults(NamedTuple):
+    """What each of a number of energy profiles would get at the same prices"""
+
+    score: np.ndarray  # EnergyScore between 0 and 1, NaN without energy usage
+    cost: np.ndarray
+    potential_savings: np.ndarray
+
+
+def simulate_schedules(
+    profiles: np.ndarray,
+    prices: np.ndarray,
+    treshold: float = 0,
+    max_shift: float | None = None,
+) -> ScheduleResults:
+    """Returns the EnergyScore, cost and potential savings of every row of
+    profiles, the energy used during the intervals of the prices
+
+    The prices are normalised with normalise_price and the energy of each
+    profile with normalise_energy, so all profiles are scored at once as one
+    matrix product. Intervals without a price are NaN, and energy below
+    treshold does not count for the score, like in the sensor.
+    """
+    profiles = np.atleast_2d(np.asarray(profiles, dtype=float))
+    prices = np.asarray(prices, dtype=float)
+    priced = ~np.isnan(prices)
+    # Energy used while there is no price scores nothing
+    normalised = np.nan_to_num(normalise_price(prices))
+    scored = np.where(profiles >= treshold, profiles, 0)
+    score = normalise_energy(scored) @ normalised
+
+    cost = profiles[:, priced] @ prices[priced]
+    savings = cost - _minimum_costs(profiles[:, priced], prices[priced], max_shift)
+    return ScheduleResults(
+        score, np.round(cost, 2), np.round(np.maximum(savings, 0), 2)
+    )
+
+
+class PriceWindows:
+    """Cheapest windows of a vector of prices, NaN where not known
+
+    The prefix sums of the prices and of the number of known prices are built
+    once, so the sum of any window is a difference of two of them, and every
+    search is O(n) over the intervals from start to stop. Kept until new
+    prices arrive.
+    """
+
+    def __init__(self, prices: np.ndarray) -> None:
+        self.prices = np.asarray(prices, dtype=float)
+        priced = ~np.isnan(self.prices)
+        self._sums = np.concatenate(
+            ([0.0], np.cumsum(np.where(priced, self.prices, 0)))
+        )
+        self._priced = np.concatenate(([0], np.cumsum(priced)))
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def contiguous(
+        self, length: int, start: int = 0, stop: int | None = None
+    ) -> tuple[int, float] | None:
+        """Returns the index of the first interval and the average price of
+        the cheapest length consecutive intervals with known prices from start
+        to stop, None if there are none"""
+        stop = len(self) if stop is None else stop
+        if length <= 0 or stop - start < length:
+            return None
+        sums = (
+            self._sums[start + length : stop + 1]
+            - self._sums[start : stop - length + 1]
+        )
+        priced = (
+            self._priced[start + length : stop + 1]
+            - self._priced[start : stop - length + 1]
+        ) == length
+        if not priced.any():
+            return None
+        best = int(np.argmin(np.where(priced, sums, np.inf)))
+        return start + best, float(sums[best]) / length
+
+    def cheapest(
+        self, length: int, start: int = 0, stop: int | None = None
+    ) -> tuple[np.ndarray, float] | None:
+        """Returns the indices, in order, and the average price of the
+        cheapest length intervals with known prices from start to stop, which
+        need not be consecutive, None if there are fewer"""
+        prices = self.prices[start:stop]
+        indices = np.flatnonzero(~np.isnan(prices))
+        if length <= 0 or len(indices) < length:
+            return None
+        # A partition instead of a sort keeps it O(n)
+        chosen = np.sort(indices[np.argpartition(prices[indices], length - 1)[:length]])
+        return start + chosen, float(prices[chosen].sum()) / length
+
+
+def potential_savings(cost: float, minimum_cost: float) -> float:
+    """Returns what could have been saved by using all energy at the lowest
+    price"""
+    return round(cost - minimum_cost, 2) if not cost - minimum_cost < 0 else 0
+
+
+def day_quality(price_count: int, minute_of_day: int, interval: int) -> float:
+    """Returns the share of the intervals of the day so far that have a price"""
+    intervals_today = minute_of_day // interval + 1
+    return round(price_count / intervals_today, 2)
@@ -0,0 +1,171 @@
+"""Hourly history ring buffer for EnergyScore"""
+from __future__ import annotations
+
+import datetime
+import math
+from typing import Iterator
+
+from .lazy import LazyModule
+
+np = LazyModule("numpy")
+
+# The minimum of int64, marking slots without an hour
+_EMPTY = -(2**63)
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+
+def _offset(time: datetime.datetime, seconds: int) -> float:
+    """Returns the part of the UTC offset of a TZ aware datetime that is not a
+    whole number of intervals of the given seconds"""
+    return time.utcoffset().total_seconds() % seconds
+
+
+def epoch_hour(time: datetime.datetime) -> int:
+    """Returns the epoch hour of the local hour a TZ aware datetime belongs to"""
+    return epoch_interval(time, 60)
+
+
+def epoch_interval(time: datetime.datetime, minutes: int) -> int:
+    """Returns the epoch index of the local interval of the given minutes a TZ
+    aware datetime belongs to, the epoch hour for 60 minutes
+
+    The intervals are counted from the UTC epoch shifted by the part of the
+    offset of the zone that is not a whole interval, e.g. 30 minutes for the
+    hours of India, so they start at the start of the local intervals. In
+    zones with whole hour offsets they are the intervals of the UTC epoch.
+    """
+    seconds = minutes * 60
+    return int((time.timestamp() + _offset(time, seconds)) // seconds)
+
+
+def interval_start(
+    interval: int, minutes: int, tz: datetime.tzinfo
+) -> datetime.datetime:
+    """Returns the start of an epoch interval of the given minutes in a time
+    zone, the inverse of epoch_interval"""
+    seconds = minutes * 60
+    start = datetime.datetime.fromtimestamp(interval * seconds, tz)
+    return datetime.datetime.fromtimestamp(
+        interval * seconds - _offset(start, seconds), tz
+    )
+
+
+class HourlyHistory:
+    """Fixed-capacity ring buffer of hourly values indexed by epoch hour
+
+    Keeps the values of the last `capacity` hours up to and including the
+    newest hour that has been set, so adding a new hour and dropping the
+    oldest one is O(1). Missing values (None) are stored as NaN.
+
+    The hours and values arrays can be given to keep the history in existing
+    storage, e.g. a memory mapped file. Otherwise they are allocated when the
+    first hour is set. The history works the same for shorter intervals
+    numbered by epoch_interval. The version counts the changes of the
+    values, so what is derived from them is only rebuilt after a change.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        hours: np.ndarray | None = None,
+        values: np.ndarray | None = None,
+    ) -> None:
+        self.capacity = capacity
+        self.newest: int | None = None
+        self.version = 0
+        if hours is None or values is None:
+            hours = values = None
+        elif (newest := int(hours.max())) != _EMPTY:
+            self.newest = newest
+        self._hours = hours
+        self._values = values
+
+    def __contains__(self, hour: int) -> bool:
+        return (
+            self.newest is not None
+            and self.newest - self.capacity < hour <= self.newest
+            and self._hours[hour % self.capacity] == hour
+        )
+
+    def __len__(self) -> int:
+        if self.newest is None:
+            return 0
+        return int(np.count_nonzero(self._hours > self.newest - self.capacity))
+
+    def get(self, hour: int, default: float | None = None) -> float | None:
+        """Returns the value of an hour, or default if the hour is not held"""
+        if hour not in self:
+            return default
+        value = self._values[hour % self.capacity]
+        return None if np.isnan(value) else float(value)
+
+    def set(self, hour: int, value: float | None) -> None:
+        """Sets the value of an hour, dropping hours that fall out of the window"""
+        if self.newest is not None and hour <= self.newest - self.capacity:
+            return
+        if self._hours is None:
+            self._hours = np.full(self.capacity, _EMPTY, dtype=np.int64)
+            self._values = np.full(self.capacity, np.nan)
+        slot = hour % self.capacity
+        value = np.nan if value is None else value
+        old = self._values[slot]
+        if self._hours[slot] != hour or (
+            old != value and not (np.isnan(old) and np.isnan(value))
+        ):
+            self.version += 1
+        self._hours[slot] = hour
+        self._values[slot] = value
+        if self.newest is None or hour > self.newest:
+            self.newest = hour
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the held hours and their values in chronological order"""
+        if self.newest is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        shift = -((self.newest + 1) % self.capacity)
+        hours = np.roll(self._hours, shift)
+        valid = hours > self.newest - self.capacity
+        return hours[valid], np.roll(self._values, shift)[valid]
+
+    def window(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns every hour of the window with its value and whether it is held
+
+        The arrays are contiguous and in chronological order, ending at the
+        newest hour. Hours that are not held have the value NaN.
+        """
+        if self.newest is None:
+            return (
+                np.empty(0, dtype=np.int64),
+                np.empty(0),
+                np.empty(0, dtype=bool),
+            )
+        hours = np.arange(self.newest - self.capacity + 1, self.newest + 1)
+        slots = hours % self.capacity
+        held = self._hours[slots] == hours
+        values = np.where(held, self._values[slots], np.nan)
+        return hours, values, held
+
+    def slice(self, start: int, count: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the values of count hours from start, NaN if not held, and
+        whether they are held"""
+        if self._hours is None:
+            return np.full(count, np.nan), np.zeros(count, dtype=bool)
+        hours = np.arange(start, start + count)
+        slots = hours % self.capacity
+        held = self._hours[slots] == hours
+        if self.newest is not None:
+            # Hours before the window may still be in slots not reused yet
+            held &= hours > self.newest - self.capacity
+        return np.where(held, self._values[slots], np.nan), held
+
+    def values(self, start: int, count: int) -> list[float | None]:
+        """Returns the values of count hours from start, None if not held"""
+        values, _ = self.slice(start, count)
+        return [None if math.isnan(value) else value for value in values.tolist()]
+
+    def items(self) -> Iterator[tuple[int, float | None]]:
+        """Iterates over (hour, value) pairs in chronological order"""
+        hours, values = self.arrays()
+        for hour, value in zip(hours.tolist(), values.tolist()):
+            yield hour, None if math.isnan(value) else value
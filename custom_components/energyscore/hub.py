@@ -0,0 +1,182 @@
+"""Scoring of the EnergyScore sensors sharing a price entity"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+
+from .const import DOMAIN
+from .lazy import LazyModule
+from .score import StackedScores, WindowScore
+
+if TYPE_CHECKING:
+    from .sensor import EnergyScore
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+np = LazyModule("numpy")
+
+DATA_PRICE_HUBS = f"{DOMAIN}_price_hubs"
+
+
+@callback
+def async_get_price_hub(
+    hass: HomeAssistant, price_entity: str, interval: int = 60
+) -> PriceHub:
+    """Returns the hub of a price entity and interval length, creating it for
+    the first sensor"""
+    hubs: dict[tuple[str, int], PriceHub] = hass.data.setdefault(DATA_PRICE_HUBS, {})
+    if (price_entity, interval) not in hubs:
+        hubs[(price_entity, interval)] = PriceHub(hass, price_entity, interval)
+    return hubs[(price_entity, interval)]
+
+
+class PriceHub:
+    """Scores all EnergyScore sensors using the same price entity at once
+
+    The hourly energy usage of every member is a column of one StackedScores,
+    so the prices are only kept once, and all windows of all members are
+    calculated in one vectorized operation per update. The scores are handed
+    out to every member, and members whose scores changed write their state.
+    Members joining or leaving, or filling their histories, rebuild the scores
+    from their histories once after the updates that are due, so the sensors
+    set up and updated together at startup only build them once. The hours of
+    the scores are the epoch intervals of the members.
+
+    Without Home Assistant, e.g. offline in the replay, there is no event loop
+    to rebuild the scores later, so they are rebuilt right away.
+    """
+
+    def __init__(
+        self, hass: HomeAssistant | None, price_entity: str, interval: int
+    ) -> None:
+        self.hass = hass
+        self.interval = interval
+        self.price_entity = price_entity
+        self._members: list[EnergyScore] = []
+        self._pair_meters: list[int] = []
+        self._pair_lengths: list[int] = []
+        self._rebuild: asyncio.Handle | None = None
+        self._scores = StackedScores(0, 1)
+        self._stale = False
+        self._updated: list[EnergyScore] = []
+
+    @callback
+    def async_add_member(self, member: EnergyScore) -> CALLBACK_TYPE:
+        """Adds a sensor to the hub, returns a callback removing it again"""
+        self._members.append(member)
+        # The members keep their restored states until they are updated
+        self._stale = True
+
+        @callback
+        def _remove_member() -> None:
+            self._members.remove(member)
+            if member in self._updated:
+                self._updated.remove(member)
+            if self._members:
+                self._stale = True
+            elif self.hass is not None:
+                self.hass.data[DATA_PRICE_HUBS].pop(
+                    (self.price_entity, self.interval), None
+                )
+
+        return _remove_member
+
+    @callback
+    def async_invalidate(self, member: EnergyScore | None = None) -> None:
+        """Rebuilds the scores from the histories of the members once, after
+        the updates that are due, e.g. when members filled missing intervals,
+        and then writes the state of the member"""
+        self._stale = True
+        if self.hass is None:
+            # Offline members have no states to write
+            self.async_rebuild()
+            return
+        if member is not None and member not in self._updated:
+            self._updated.append(member)
+        if self._rebuild is None:
+            self._rebuild = self.hass.loop.call_soon(self._async_rebuild_stale)
+
+    @callback
+    def async_rebuild(self) -> None:
+        """Builds the scores of all members from their histories"""
+        self._stale = False
+        self._pair_meters = []
+        self._pair_lengths = []
+        for meter, member in enumerate(self._members):
+            for length in member.score_lengths:
+                self._pair_meters.append(meter)
+                self._pair_lengths.append(length)
+        horizon = max(member.history_length for member in self._members)
+        _LOGGER.debug(
+            "%s - Scoring %s sensors together", self.price_entity, len(self._members)
+        )
+        self._scores = StackedScores(len(self._members), horizon)
+
+        newest = max(
+            (
+                member.newest_interval
+                for member in self._members
+                if member.newest_interval is not None
+            ),
+            default=None,
+        )
+        if newest is not None:
+            first = newest - horizon + 1
+            # The price of an interval is taken from the first member holding it
+            prices = np.full(horizon, np.nan)
+            found = np.zeros(horizon, dtype=bool)
+            for member in self._members:
+                values, held = member.price_history.slice(first, horizon)
+                prices = np.where(held & ~found, values, prices)
+                found |= held
+            usage = np.column_stack(
+                [member.interval_usage(first, newest) for member in self._members]
+            )
+            self._scores.load(first, prices, usage)
+        # The members keep their restored states until they are updated
+        self._hand_out_scores()
+
+    @callback
+    def async_update(
+        self, member: EnergyScore, interval: int, price: float, energy: float
+    ) -> None:
+        """Sets the price and the energy usage of a member, and scores all"""
+        if self._stale:
+            # The rebuild reads the update from the histories of the member
+            self.async_invalidate(member)
+            return
+        self._scores.update(interval, price, {self._members.index(member): energy})
+        for changed in self._hand_out_scores():
+            if changed is not member:
+                changed.async_scores_changed()
+
+    @callback
+    def _async_rebuild_stale(self) -> None:
+        """Rebuilds the scores once for the changes since they became stale,
+        and writes the states of the members changed meanwhile"""
+        self._rebuild = None
+        updated, self._updated = self._updated, []
+        if not self._stale or not self._members:
+            return
+        self.async_rebuild()
+        # Their states were written with the stale scores
+        for member in updated:
+            member.async_scores_changed()
+
+    def _hand_out_scores(self) -> list[EnergyScore]:
+        """Calculates the windows of all members and hands out the scores,
+        returns the members whose scores changed"""
+        results = self._scores.windows(self._pair_meters, self._pair_lengths)
+        scores: list[dict[int, WindowScore]] = [{} for _ in self._members]
+        for meter, length, result in zip(
+            self._pair_meters, self._pair_lengths, results
+        ):
+            scores[meter][length] = result
+        return [
+            member
+            for member, member_scores in zip(self._members, scores)
+            if member.set_window_scores(member_scores)
+        ]
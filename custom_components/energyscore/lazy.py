@@ -0,0 +1,22 @@
+"""Lazy imports of heavy dependencies of EnergyScore"""
+from __future__ import annotations
+
+import importlib
+from types import ModuleType
+from typing import Any
+
+
+class LazyModule(ModuleType):
+    """Module that is only imported when one of its attributes is first used
+
+    Keeps importing the integration cheap when Home Assistant starts, e.g.
+    NumPy is loaded by the first calculation instead. The attributes of the
+    module are copied to the proxy once imported, so later uses are plain
+    attribute lookups. The import is done under the import lock, so the first
+    use may be in any thread.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
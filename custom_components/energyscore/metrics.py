@@ -0,0 +1,70 @@
+"""Runtime metrics of the updates of an EnergyScore entry"""
+from __future__ import annotations
+
+from collections import deque
+from contextlib import contextmanager
+import math
+import time
+from typing import Iterator
+
+# Number of update durations the percentiles are taken from
+DURATION_SAMPLES = 100
+
+
+class UpdateMetrics:
+    """Durations and outcomes of the updates of an entry
+
+    An update is the fetch of the source states by the coordinator and the
+    processing of them by the EnergyScore sensor, which are timed separately
+    and recorded as one duration, in milliseconds.
+    """
+
+    def __init__(self, samples: int = DURATION_SAMPLES) -> None:
+        self.durations: deque[float] = deque(maxlen=samples)
+        self.failed = 0
+        self.skipped = 0
+        self._fetch_duration = 0.0
+
+    @property
+    def last_duration(self) -> float | None:
+        """The duration of the last update"""
+        return round(self.durations[-1], 3) if self.durations else None
+
+    @property
+    def p95_duration(self) -> float | None:
+        """The 95th percentile of the durations of the recent updates"""
+        if not self.durations:
+            return None
+        durations = sorted(self.durations)
+        return round(durations[math.ceil(0.95 * len(durations)) - 1], 3)
+
+    @contextmanager
+    def time_fetch(self) -> Iterator[None]:
+        """Times the fetch of the source states, added to the next update"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._fetch_duration = (time.perf_counter() - start) * 1000
+
+    @contextmanager
+    def time_update(self) -> Iterator[None]:
+        """Times the processing of the fetched source states, counting it as
+        failed if it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.durations.append(
+                self._fetch_duration + (time.perf_counter() - start) * 1000
+            )
+            self._fetch_duration = 0.0
+
+    def skip(self) -> None:
+        """Counts an update without usable source states"""
+        self.skipped += 1
+        self.durations.append(self._fetch_duration)
+        self._fetch_duration = 0.0
@@ -0,0 +1,10 @@
+"""Recorder platform for EnergyScore"""
+from homeassistant.core import HomeAssistant, callback
+
+from .const import HISTORY
+
+
+@callback
+def exclude_attributes(hass: HomeAssistant) -> set[str]:
+    """Exclude the bulky history of the EnergyScore from being recorded"""
+    return {HISTORY}
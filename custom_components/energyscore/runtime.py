@@ -0,0 +1,133 @@
+"""Runtime state of all EnergyScore sensors kept in one storage file"""
+from __future__ import annotations
+
+import datetime
+import logging
+from typing import Any, Callable, Iterable
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt
+
+from .const import DOMAIN
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+DATA_RUNTIME_STORE = f"{DOMAIN}_runtime_store"
+
+# Version of the runtime state file, changes are migrated in RuntimeStore
+RUNTIME_STORE_VERSION = 1
+RUNTIME_STORE_KEY = f"{DOMAIN}.runtime_state"
+
+# Seconds from the first change until the runtime state is written
+SAVE_DELAY = 60
+
+
+def to_timestamp(time: datetime.datetime | str | None) -> float | None:
+    """Returns a time, or a time string of the attributes, as a timestamp"""
+    if isinstance(time, str):
+        time = dt.parse_datetime(time)
+    return None if time is None else time.timestamp()
+
+
+def from_timestamp(timestamp: float | None) -> datetime.datetime | None:
+    """Returns a timestamp as a local time"""
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, dt.DEFAULT_TIME_ZONE)
+
+
+def times_to_list(values: dict[datetime.datetime, Any]) -> list[list]:
+    """Returns values by time as [timestamp, value] pairs for the file"""
+    return [[time.timestamp(), value] for time, value in values.items()]
+
+
+def times_from_list(pairs: list[list]) -> dict[datetime.datetime, Any]:
+    """Returns [timestamp, value] pairs as values by local time"""
+    return {from_timestamp(timestamp): value for timestamp, value in pairs}
+
+
+class RuntimeStore:
+    """Runtime state of the sensors of all entries, by unique id
+
+    Loaded once when the integration is set up, so the sensors are restored
+    from values that are ready to use, instead of each parsing the attributes
+    of its restored state. Sensors without a stored state, e.g. the first
+    time after an upgrade, restore their state as before. The states of the
+    added sensors are collected when the file is written, a while after they
+    change and when Home Assistant stops.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._store: Store = Store(hass, RUNTIME_STORE_VERSION, RUNTIME_STORE_KEY)
+        self._states: dict[str, dict[str, Any]] = {}
+        self._sensors: dict[str, Callable[[], dict[str, Any]]] = {}
+        self._save_scheduled = False
+
+    async def async_load(self) -> None:
+        """Reads the runtime states of the last run"""
+        try:
+            data = await self._store.async_load()
+        except HomeAssistantError:
+            _LOGGER.warning("Could not read the runtime state, restoring per sensor")
+            data = None
+        self._states = data or {}
+
+    @callback
+    def async_get(self, unique_id: str) -> dict[str, Any] | None:
+        """Returns the stored state of a sensor, None if not stored"""
+        return self._states.get(unique_id)
+
+    @callback
+    def async_add_sensor(
+        self, unique_id: str, state_fn: Callable[[], dict[str, Any]]
+    ) -> CALLBACK_TYPE:
+        """Adds a sensor whose state is returned by state_fn, returns a
+        callback removing it again"""
+        self._sensors[unique_id] = state_fn
+
+        @callback
+        def _remove_sensor() -> None:
+            # Kept for when the sensor is added again, e.g. on reload
+            self._states[unique_id] = self._sensors.pop(unique_id)()
+
+        return _remove_sensor
+
+    @callback
+    def async_remove(self, unique_ids: Iterable[str]) -> None:
+        """Forgets the states of the sensors of a removed entry"""
+        for unique_id in unique_ids:
+            self._states.pop(unique_id, None)
+        self.async_schedule_save()
+
+    @callback
+    def async_schedule_save(self) -> None:
+        """Writes the states after the save delay, if not scheduled already"""
+        if not self._save_scheduled:
+            self._save_scheduled = True
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> dict[str, dict[str, Any]]:
+        self._save_scheduled = False
+        return {
+            **self._states,
+            **{unique_id: state_fn() for unique_id, state_fn in self._sensors.items()},
+        }
+
+
+async def async_load_runtime_store(hass: HomeAssistant) -> RuntimeStore:
+    """Loads the runtime store once for all entries"""
+    if DATA_RUNTIME_STORE not in hass.data:
+        store = RuntimeStore(hass)
+        await store.async_load()
+        hass.data[DATA_RUNTIME_STORE] = store
+    return hass.data[DATA_RUNTIME_STORE]
+
+
+@callback
+def async_get_runtime_store(hass: HomeAssistant) -> RuntimeStore | None:
+    """Returns the runtime store, None if the integration was not set up"""
+    return hass.data.get(DATA_RUNTIME_STORE)
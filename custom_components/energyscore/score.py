@@ -0,0 +1,260 @@
+"""Incremental EnergyScore calculation"""
+from __future__ import annotations
+
+from bisect import bisect_right
+import math
+from operator import itemgetter
+from typing import Mapping, NamedTuple, Sequence
+
+from .lazy import LazyModule
+
+np = LazyModule("numpy")
+
+_HOUR = itemgetter(0)
+
+
+def _extrema(hours: np.ndarray, prices: np.ndarray, ufunc) -> list[tuple[int, float]]:
+    """Returns the monotonic deque of the prices more extreme than all later
+    prices, the maxima with np.maximum and the minima with np.minimum"""
+    if not len(prices):
+        return []
+    # The most extreme of every price and the prices after it
+    later = ufunc.accumulate(prices[::-1])[::-1]
+    kept = np.append(ufunc(prices[:-1], later[1:]) != later[1:], True)
+    return list(zip(hours[kept].tolist(), prices[kept].tolist()))
+
+
+class WindowScore(NamedTuple):
+    """The score of a window with the number of hours it is based on"""
+
+    score: float | None  # Between 0 and 1, None without energy usage
+    price_count: int
+    energy_count: int
+
+
+class StackedScores:
+    """Keeps the EnergyScores of energy meters sharing one price up to date
+
+    With prices normalised as (max - P) / (max - min) and energy usage
+    normalised to sum up to one, the score over the hours having both a price
+    and an energy usage is
+
+        (max * ΣE' - Σ(P * E)) / ((max - min) * ΣE)
+
+    where ΣE' only sums the energy usage of hours that also have a price. All
+    windows end at the current hour and share one history of completed hours,
+    with the sums of every meter in a column of the same rows. The sums of a
+    window are the difference of two prefix sums, and the price extrema of any
+    window are found in the same monotonic deques, since these hold the extrema
+    of every window ending at the current hour. Adding an hour is O(1)
+    amortised per meter, and the windows of all meters are read in one
+    vectorized operation. The current hour, which changes with every update,
+    is only added on top when reading the windows, so the first row and the
+    price extrema of the completed hours of a window are cached until the hour
+    changes.
+    """
+
+    def __init__(self, meters: int, horizon: int) -> None:
+        self.current: int | None = None
+        self._completed: dict[int, tuple[int, float, float]] = {}
+        self.horizon = horizon  # The longest window
+        self.meters = meters
+        self._count = 0
+        self._energy = np.full(meters, np.nan)
+        self._hours = np.empty(horizon + 1, dtype=np.int64)
+        self._max: list[tuple[int, float]] = []
+        self._min: list[tuple[int, float]] = []
+        self._price = math.nan
+        # Prefix sums of the price counts, and of energy, energy with price,
+        # price * energy and the energy counts of every meter, before each hour
+        self._price_counts = np.zeros(horizon + 2, dtype=np.int64)
+        self._sums = np.zeros((horizon + 2, 4, meters))
+
+    def update(self, hour: int, price: float, energy: Mapping[int, float]) -> None:
+        """Sets the price and the energy usage of some meters of an hour, NaN if
+        not available
+
+        The other meters keep their usage of the hour. Updates of hours older
+        than the current hour are ignored.
+        """
+        if self.current is not None:
+            if hour < self.current:
+                return
+            if hour > self.current:
+                self._complete()
+                self._evict(hour - self.horizon)
+                self._energy[:] = np.nan
+        self.current = hour
+        self._price = price
+        for meter, usage in energy.items():
+            self._energy[meter] = usage
+
+    def load(self, first: int, prices: np.ndarray, energy: np.ndarray) -> None:
+        """Sets the prices and the energy usage of every meter of consecutive
+        hours from first at once, NaN if not available, the last hour being
+        the current hour
+
+        Only for scores without hours yet, e.g. rebuilt from histories. The
+        prefix sums and the price extrema of all hours are calculated in
+        vectorized operations instead of one update per hour. Hours out of
+        the longest window are left out.
+        """
+        prices = np.asarray(prices, dtype=float)
+        energy = np.asarray(energy, dtype=float).reshape(len(prices), self.meters)
+        if (skip := len(prices) - self.horizon) > 0:
+            first, prices, energy = first + skip, prices[skip:], energy[skip:]
+        if not len(prices):
+            return
+
+        count = len(prices) - 1
+        hours = np.arange(first, first + count, dtype=np.int64)
+        completed = prices[:-1]
+        has_price = ~np.isnan(completed)
+        has_energy = ~np.isnan(energy[:-1])
+        usage = np.where(has_energy, energy[:-1], 0.0)
+        shared = np.where(has_price[:, None], usage, 0.0)
+        self._hours[:count] = hours
+        self._price_counts[1 : count + 1] = np.cumsum(has_price)
+        self._sums[1 : count + 1] = np.cumsum(
+            np.stack(
+                [
+                    usage,
+                    shared,
+                    np.where(has_price, completed, 0.0)[:, None] * shared,
+                    has_energy,
+                ],
+                axis=1,
+            ),
+            axis=0,
+        )
+        self._count = count
+        self._completed.clear()
+        self._max = _extrema(hours[has_price], completed[has_price], np.maximum)
+        self._min = _extrema(hours[has_price], completed[has_price], np.minimum)
+        self.current = first + count
+        self._price = float(prices[-1])
+        self._energy[:] = energy[-1]
+
+    def windows(self, meters: Sequence[int], hours: Sequence[int]) -> list[WindowScore]:
+        """Returns the scores of the windows of the given number of hours of the
+        given meters"""
+        if self.current is None or not len(meters):
+            return [WindowScore(None, 0, 0) for _ in meters]
+        meters = np.asarray(meters, dtype=np.intp)
+        first, max_price, min_price = (
+            np.array(values)
+            for values in zip(*(self._completed_window(window) for window in hours))
+        )
+        energy, shared, price_energy, energy_count = (
+            self._sums[self._count, :, meters] - self._sums[first, :, meters]
+        ).T
+        price_count = self._price_counts[self._count] - self._price_counts[first]
+
+        current_energy = self._energy[meters]
+        has_energy = ~np.isnan(current_energy)
+        usage = np.where(has_energy, current_energy, 0.0)
+        energy = energy + usage
+        energy_count = energy_count + has_energy
+        if not math.isnan(self._price):
+            price_count = price_count + 1
+            max_price = np.fmax(max_price, self._price)
+            min_price = np.fmin(min_price, self._price)
+            shared = shared + usage
+            price_energy = price_energy + self._price * usage
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            spread = max_price - min_price
+            score = np.where(
+                spread > 0,
+                (max_price * shared - price_energy) / (spread * energy),
+                shared / energy,
+            )
+        score = np.where(np.isnan(max_price), 0.0, score)
+        no_usage = (energy_count == 0) | (energy == 0)
+        return [
+            WindowScore(None if empty else value, prices, energies)
+            for value, prices, energies, empty in zip(
+                score.tolist(),
+                price_count.tolist(),
+                energy_count.astype(int).tolist(),
+                no_usage.tolist(),
+            )
+        ]
+
+    def _completed_window(self, hours: int) -> tuple[int, float, float]:
+        """Returns the first row and the price extrema of the completed hours of
+        a window, NaN without prices"""
+        if (completed := self._completed.get(hours)) is None:
+            oldest = self.current - hours
+            completed = (
+                int(np.searchsorted(self._hours[: self._count], oldest, side="right")),
+                *(
+                    extrema[index][1]
+                    if (index := bisect_right(extrema, oldest, key=_HOUR))
+                    < len(extrema)
+                    else math.nan
+                    for extrema in (self._max, self._min)
+                ),
+            )
+            self._completed[hours] = completed
+        return completed
+
+    def _complete(self) -> None:
+        """Adds the current hour to the prefix sums and price extrema"""
+        hour, price = self.current, self._price
+        has_price = not math.isnan(price)
+        has_energy = ~np.isnan(self._energy)
+        usage = np.where(has_energy, self._energy, 0.0)
+        if self._count + 1 == len(self._sums):
+            self._grow()
+        self._hours[self._count] = hour
+        self._price_counts[self._count + 1] = (
+            self._price_counts[self._count] + has_price
+        )
+        row = self._sums[self._count + 1]
+        row[:] = self._sums[self._count]
+        row[0] += usage
+        if has_price:
+            row[1] += usage
+            row[2] += price * usage
+        row[3] += has_energy
+        self._count += 1
+        # Windows end at the new hour from now on
+        self._completed.clear()
+        if has_price:
+            while self._max and self._max[-1][1] <= price:
+                self._max.pop()
+            self._max.append((hour, price))
+            while self._min and self._min[-1][1] >= price:
+                self._min.pop()
+            self._min.append((hour, price))
+
+    def _grow(self) -> None:
+        """Makes room for another hour, dropping the hours out of every window
+        if at least half of them are, or else doubling the size"""
+        oldest = self.current - self.horizon
+        stale = int(np.searchsorted(self._hours[: self._count], oldest, side="right"))
+        if stale and stale * 2 >= self._count:
+            self._count -= stale
+            self._hours[: self._count] = self._hours[stale : stale + self._count]
+            self._price_counts[: self._count + 1] = self._price_counts[
+                stale : stale + self._count + 1
+            ]
+            self._sums[: self._count + 1] = self._sums[stale : stale + self._count + 1]
+            return
+        size = 2 * len(self._hours)
+        self._hours = np.resize(self._hours, size)
+        self._price_counts = np.resize(self._price_counts, size + 1)
+        self._sums = np.resize(self._sums, (size + 1, 4, self.meters))
+
+    def _evict(self, oldest: int) -> None:
+        """Drops the price extrema up to and including the oldest hour
+
+        The lists are only shortened once half of them is out of every window,
+        so the copying stays O(1) amortised. The prefix sums are dropped when
+        room is needed.
+        """
+        for extrema in (self._max, self._min):
+            stale = bisect_right(extrema, oldest, key=_HOUR)
+            if stale and stale * 2 >= len(extrema):
+                del extrema[:stale]
@@ -1,54 +1,111 @@
 """Sensor platform for energyscore."""
+from __future__ import annotations
+
+from dataclasses import dataclass
 import datetime
 import logging
+import math
 from typing import Any, Callable
 
 from homeassistant.components.sensor import (
     PLATFORM_SCHEMA,
+    SensorDeviceClass,
     SensorEntity,
+    SensorEntityDescription,
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import (
+    ATTR_STATE,
+    ATTR_UNIT_OF_MEASUREMENT,
     CONF_NAME,
     CONF_UNIQUE_ID,
     STATE_UNAVAILABLE,
     STATE_UNKNOWN,
+    EntityCategory,
+    UnitOfInformation,
+    UnitOfTime,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.entity import DeviceInfo, get_unit_of_measurement
 import homeassistant.helpers.entity_registry as er
+from homeassistant.helpers.json import json_bytes
 from homeassistant.helpers.restore_state import RestoreEntity
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.util import dt
-import numpy as np
 import voluptuous as vol
 
 from .const import (
+    ATTRIBUTE_HOURS,
+    CONF_BACKFILL,
+    CONF_COALESCE,
     CONF_ENERGY_ENTITY,
+    CONF_EVENT_DRIVEN,
+    CONF_INTERVAL,
+    CONF_MAX_SHIFTABLE_POWER,
+    CONF_PRICE_ATTRIBUTES,
     CONF_PRICE_ENTITY,
     CONF_ROLLING_HOURS,
+    CONF_SCORE_WINDOWS,
     CONF_TRESHOLD,
     COST_AVG,
     COST_MAX,
     COST_MIN,
+    DAY_ENERGY,
+    DAY_PRICES,
     DOMAIN,
     ENERGY,
     ENERGY_TODAY,
+    HISTORY,
+    HISTORY_START,
+    HISTORY_STEP,
     ICON,
     ICON_COST,
+    ICON_DIAGNOSTIC,
     ICON_SAVINGS,
+    INTERVALS,
     LAST_ENERGY,
     LAST_UPDATED,
+    MAX_ROLLING_HOURS,
     PRICES,
     QUALITY,
+    SCORE,
+    SCORE_WINDOWS,
+    SCORES,
+)
+from .coordinator import EnergyScoreCoordinator, SourceData, interval_prices
+from .engine import (
+    DayPrices,
+    IntervalEnergy,
+    PriceWindows,
+    accumulate,
+    calculate_energy_usage,
+    day_costs,
+    day_quality,
+    interval_values,
+    potential_savings,
+    usage_above_treshold,
+    window_result,
 )
+from .history import TIME_FORMAT, HourlyHistory, epoch_interval, interval_start
+from .hub import PriceHub, async_get_price_hub
+from .lazy import LazyModule
+from .runtime import (
+    RuntimeStore,
+    async_get_runtime_store,
+    from_timestamp,
+    times_from_list,
+    times_to_list,
+    to_timestamp,
+)
+from .score import WindowScore
+from .store import HistoryStore, history_path
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
-# Time between updating data
-SCAN_INTERVAL = datetime.timedelta(minutes=10)
+np = LazyModule("numpy")
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
@@ -58,7 +115,20 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Required(CONF_UNIQUE_ID): cv.string,
         vol.Optional(CONF_TRESHOLD, default=0): vol.Coerce(float),
         vol.Optional(CONF_ROLLING_HOURS, default=24): vol.All(
-            int, vol.Range(min=2, max=168)
+            int, vol.Range(min=2, max=MAX_ROLLING_HOURS)
+        ),
+        vol.Optional(CONF_EVENT_DRIVEN, default=False): cv.boolean,
+        vol.Optional(CONF_SCORE_WINDOWS, default=[]): vol.All(
+            cv.ensure_list, [vol.In(SCORE_WINDOWS)]
+        ),
+        vol.Optional(CONF_BACKFILL, default=False): cv.boolean,
+        vol.Optional(CONF_PRICE_ATTRIBUTES, default=False): cv.boolean,
+        vol.Optional(CONF_INTERVAL, default=60): vol.All(
+            vol.Coerce(int), vol.In(INTERVALS)
+        ),
+        vol.Optional(CONF_COALESCE, default=False): cv.boolean,
+        vol.Optional(CONF_MAX_SHIFTABLE_POWER, default=0): vol.All(
+            vol.Coerce(float), vol.Range(min=0)
         ),
     }
 )
@@ -75,13 +145,35 @@ async def async_setup_entry(
     config = hass.data[DOMAIN][config_entry.entry_id]
     energy_treshold = config_entry.options.get(CONF_TRESHOLD)
     rolling_hours = config_entry.options.get(CONF_ROLLING_HOURS)
+    event_driven = config_entry.options.get(CONF_EVENT_DRIVEN)
+    score_windows = config_entry.options.get(CONF_SCORE_WINDOWS, [])
+    backfill = config_entry.options.get(CONF_BACKFILL, False)
+    price_attributes = config_entry.options.get(CONF_PRICE_ATTRIBUTES, False)
+    interval = config_entry.options.get(CONF_INTERVAL, 60)
+    coalesce = config_entry.options.get(CONF_COALESCE, False)
+    max_shiftable_power = config_entry.options.get(CONF_MAX_SHIFTABLE_POWER, 0)
     _LOGGER.debug("Config: %s", config)
     _LOGGER.debug("Options: %s", config_entry.options)
 
+    coordinator = EnergyScoreCoordinator(
+        hass, config, event_driven, price_attributes, interval, coalesce
+    )
+    cost = Cost(coordinator, config)
     sensors = [
-        EnergyScore(hass, config, energy_treshold, rolling_hours),
-        Cost(hass, config),
-        PotentialSavings(hass, config),
+        EnergyScore(
+            coordinator,
+            config,
+            energy_treshold,
+            rolling_hours,
+            score_windows,
+            backfill,
+        ),
+        cost,
+        PotentialSavings(coordinator, config, cost, max_shiftable_power),
+    ]
+    sensors += [
+        EnergyScoreDiagnostic(coordinator, config, sensors[0], description)
+        for description in DIAGNOSTIC_SENSORS
     ]
     async_add_entities(sensors, update_before_add=False)
 
@@ -95,97 +187,90 @@ async def async_setup_platform(
     """Set up sensors from YAML config"""
     energy_treshold = config[CONF_TRESHOLD]
     rolling_hours = config[CONF_ROLLING_HOURS]
+    event_driven = config[CONF_EVENT_DRIVEN]
+    score_windows = config[CONF_SCORE_WINDOWS]
+    backfill = config[CONF_BACKFILL]
+    price_attributes = config[CONF_PRICE_ATTRIBUTES]
+    interval = config[CONF_INTERVAL]
+    coalesce = config[CONF_COALESCE]
+    max_shiftable_power = config[CONF_MAX_SHIFTABLE_POWER]
     _LOGGER.debug("Config: %s", config)
+    coordinator = EnergyScoreCoordinator(
+        hass, config, event_driven, price_attributes, interval, coalesce
+    )
+    cost = Cost(coordinator, config)
     sensors = [
-        EnergyScore(hass, config, energy_treshold, rolling_hours),
-        Cost(hass, config),
-        PotentialSavings(hass, config),
+        EnergyScore(
+            coordinator,
+            config,
+            energy_treshold,
+            rolling_hours,
+            score_windows,
+            backfill,
+        ),
+        cost,
+        PotentialSavings(coordinator, config, cost, max_shiftable_power),
+    ]
+    sensors += [
+        EnergyScoreDiagnostic(coordinator, config, sensors[0], description)
+        for description in DIAGNOSTIC_SENSORS
     ]
     async_add_entities(sensors, update_before_add=False)
 
 
-def normalise_price(price_dict) -> dict:
-    """Normalises price dict"""
-    if price_dict == {}:
-        return {}
-    max_value = max(price_dict.values())
-    min_value = min(price_dict.values())
-    if max_value == min_value:
-        return {key: 1 for key, value in price_dict.items()}
-    return {
-        key: (max_value - value) / (max_value - min_value)
-        for key, value in price_dict.items()
-    }
-
-
-def normalise_energy(energy_dict) -> dict:
-    """Normalises energy dict to sum up to 1"""
-    if energy_dict == {}:
-        return {}
-    sum_values = sum(energy_dict.values())
-    return {key: value / sum_values for key, value in energy_dict.items()}
-
-
-def calculate_hourly_energy_usage(energy_dict: dict) -> dict:
-    """Calculate energy usage per hour from total"""
-    energy_usage = {}
-    for key, value in energy_dict.items():
-        previous = key - datetime.timedelta(hours=1)
-        if previous in energy_dict and energy_dict[key] is not None:
-            # Check if the energy sensor is resetting
-            if energy_dict[previous] is None or (value < energy_dict[previous]):
-                energy_usage[key] = value
-            else:
-                energy_usage[key] = value - energy_dict[previous]
-        elif previous in energy_dict and energy_dict[key] is not None:
-            energy_usage[key] = value
-    return energy_usage
-
-
-def calculate_energy_usage(energy_dict: dict) -> float:
-    """Calculate energy usage based on two consecutive energy readings"""
-    if len(energy_dict) == 2 and all(
-        isinstance(value, float) for value in energy_dict.values()
-    ):
-        earliest = energy_dict[min(energy_dict)]
-        latest = energy_dict[max(energy_dict)]
-        if latest >= earliest:  # Check totalling sensor
-            return latest - earliest
-        else:
-            return latest
-    else:
-        return None
-
-
-class EnergyScore(SensorEntity, RestoreEntity):
+class EnergyScore(CoordinatorEntity, SensorEntity, RestoreEntity):
     """EnergyScore Sensor class"""
 
     _attr_state_class = SensorStateClass.MEASUREMENT
     _attr_native_unit_of_measurement = "%"
 
-    def __init__(self, hass, config, energy_treshold, rolling_hours):
+    def __init__(
+        self,
+        coordinator,
+        config,
+        energy_treshold,
+        rolling_hours,
+        score_windows=(),
+        backfill=False,
+    ):
+        super().__init__(coordinator)
         self._attr_icon: str = ICON
         self._attr_unique_id = config.get(CONF_UNIQUE_ID)
 
-        self._energy = None
+        self._backfill = backfill
+        # The histories are kept by interval, and windows are given in hours
+        self._interval = coordinator.interval
+        self._per_hour = 60 // self._interval
+        # All windows are calculated from the same history
+        self._windows = {window: SCORE_WINDOWS[window] for window in score_windows}
+        self._length = max([rolling_hours, *self._windows.values()]) * self._per_hour
         self._energy_entity = config[CONF_ENERGY_ENTITY]
-        self.hass = hass  # TODO: needed?
+        # One extra interval of energy is kept to calculate the usage of the oldest
+        self._energy_history = HourlyHistory(self._length + 1)
+        self._flushed_interval: int | None = None
+        self._hub: PriceHub | None = None
         self._name = f"{config[CONF_NAME]} EnergyScore"
-        self._norm_energy = np.array(None)
-        self._norm_prices = np.array(None)
-        self._price = None
         self._price_entity = config[CONF_PRICE_ENTITY]
+        self._price_history = HourlyHistory(self._length + 1)
+        self._price_windows: tuple[tuple, int, PriceWindows] | None = None
         self._rolling_hours = rolling_hours
         self._state = 100
-        self._treshold = energy_treshold
+        self._store: HistoryStore | None = None
+        self._runtime: RuntimeStore | None = None
+        # The treshold is given for an hour
+        self._treshold = energy_treshold / self._per_hour
+        self._update_listeners: list[CALLBACK_TYPE] = []
+        self._window_scores: dict[int, WindowScore] = {}
         self.attr = {
             CONF_ENERGY_ENTITY: self._energy_entity,
             CONF_PRICE_ENTITY: self._price_entity,
             QUALITY: 0,
-            ENERGY: {},
-            PRICES: {},
             LAST_UPDATED: None,
         }
+        if self._windows:
+            self.attr[SCORES] = {
+                window: {SCORE: None, QUALITY: 0} for window in self._windows
+            }
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -208,46 +293,240 @@ class EnergyScore(SensorEntity, RestoreEntity):
 
     @property
     def extra_state_attributes(self):
-        return self.attr
+        # The histories are only converted to the attribute format when written,
+        # and longer histories are only kept in the store
+        return {**self.attr, HISTORY: self._history_attribute()}
+
+    def _history_attribute(self) -> dict:
+        """Returns the recent history as aligned energy and price lists
+
+        The start is the epoch interval of the first values, and the step the
+        length of the intervals in hours.
+        """
+        start = None
+        energy: list[float | None] = []
+        prices: list[float | None] = []
+        if (newest := self.newest_interval) is not None:
+            count = min(self._rolling_hours, ATTRIBUTE_HOURS) * self._per_hour + 1
+            start = newest - count + 1
+            _energy, _energy_held = self._energy_history.slice(start, count)
+            _prices, _prices_held = self._price_history.slice(start, count)
+            # Leading intervals without any values are left out
+            first = int(np.argmax(_energy_held | _prices_held))
+            start += first
+            energy, prices = (
+                [None if math.isnan(value) else value for value in values.tolist()]
+                for values in (_energy[first:], _prices[first:])
+            )
+        return {
+            HISTORY_START: start,
+            HISTORY_STEP: self._interval / 60,
+            ENERGY: energy,
+            PRICES: prices,
+        }
 
     async def async_added_to_hass(self) -> None:
-        """Restore last state"""
+        """Load the history store and restore last state"""
         _LOGGER.debug("Trying to restore: %s", self._name)
         await super().async_added_to_hass()
-        if (
+        if self._attr_unique_id is not None:
+            store = HistoryStore(
+                history_path(self.hass, self._attr_unique_id, self._interval),
+                self._length + 1,
+            )
+            try:
+                await self.hass.async_add_executor_job(store.load)
+            except OSError:
+                _LOGGER.exception(
+                    "%s - Could not open the history store, keeping history in memory",
+                    self._name,
+                )
+            else:
+                self._store = store
+                self._energy_history = store.energy
+                self._price_history = store.price
+        if (runtime := async_get_runtime_store(self.hass)) is not None and (
+            self._attr_unique_id is not None
+        ):
+            self._runtime = runtime
+            stored = runtime.async_get(self._attr_unique_id)
+            self.async_on_remove(
+                runtime.async_add_sensor(self._attr_unique_id, self.runtime_state)
+            )
+        else:
+            stored = None
+        if stored is not None and self._store is not None:
+            # The history is in the store, and the rest ready to use
+            self._restore_runtime(stored)
+            _LOGGER.debug("Restored %s from the runtime state", self._name)
+        elif (
             last_state := await self.async_get_last_state()
         ) and last_state.state not in (STATE_UNKNOWN, STATE_UNAVAILABLE):
             self._state = last_state.state
-            for attribute in [ENERGY, PRICES, LAST_UPDATED, QUALITY]:
+            for attribute in [LAST_UPDATED, QUALITY]:
                 if attribute in last_state.attributes:
                     self.attr[attribute] = last_state.attributes[attribute]
+            for window, score in last_state.attributes.get(SCORES, {}).items():
+                if window in self._windows:
+                    self.attr[SCORES][window] = score
+            # The store is filled from the attributes the first time
+            self._restore_history(last_state.attributes)
             _LOGGER.debug("Restored %s", self._name)
         else:
             _LOGGER.debug("Was not able to restore %s", self._name)
 
-    def process_new_data(self):
-        """Processes the update data"""
-        now = dt.now().replace(
-            minute=0, second=0, microsecond=0
-        )  # TZ aware datetime obj based on user settings
-
-        # Parse datetimes from strings
-        for i in [ENERGY, PRICES]:
-            self.attr[i] = {
-                dt.parse_datetime(key): value
-                for key, value in self.attr[i].items()
-                if isinstance(key, str)
-            }
+        # Sensors sharing the price entity are scored together
+        self.async_on_remove(
+            self.async_join_price_hub(
+                async_get_price_hub(self.hass, self._price_entity, self._interval)
+            )
+        )
+
+        if self._backfill:
+            self.hass.async_create_task(self._async_backfill())
+
+    async def _async_backfill(self) -> None:
+        """Fills missing intervals of the history from the recorder statistics"""
+        now = epoch_interval(dt.now(), self._interval)
+        missing = [
+            interval
+            for interval in range(now - self._length, now)
+            if interval not in self._energy_history
+            or interval not in self._price_history
+        ]
+        if not missing:
+            return
+        if "recorder" not in self.hass.config.components:
+            _LOGGER.warning(
+                "%s - Cannot backfill the history without the recorder", self._name
+            )
+            return
+        # Imported when enabled, the recorder is slow to import
+        from .backfill import async_interval_statistics
+
+        try:
+            energy = await async_interval_statistics(
+                self.hass,
+                self._energy_entity,
+                "state",
+                missing[0],
+                missing[-1],
+                self._interval,
+            )
+            prices = await async_interval_statistics(
+                self.hass,
+                self._price_entity,
+                "mean",
+                missing[0],
+                missing[-1],
+                self._interval,
+            )
+        except Exception:
+            _LOGGER.exception(
+                "%s - Could not backfill the history from the recorder statistics",
+                self._name,
+            )
+            return
+
+        # Live updates may have set intervals in the meantime
+        for statistics, history in [
+            (energy, self._energy_history),
+            (prices, self._price_history),
+        ]:
+            for interval, value in statistics.items():
+                if missing[0] <= interval <= missing[-1] and interval not in history:
+                    history.set(interval, value)
+        _LOGGER.debug(
+            "%s - Backfilled %s intervals of energy and %s intervals of prices",
+            self._name,
+            len(energy),
+            len(prices),
+        )
+        if energy or prices:
+            self._hub.async_invalidate(self)
+
+    def runtime_state(self) -> dict[str, Any]:
+        """Returns the state to keep in the runtime store"""
+        return {
+            ATTR_STATE: self._state,
+            LAST_UPDATED: to_timestamp(self.attr[LAST_UPDATED]),
+            QUALITY: self.attr[QUALITY],
+            SCORES: self.attr.get(SCORES, {}),
+        }
+
+    def _restore_runtime(self, stored: dict[str, Any]) -> None:
+        """Restores the state kept in the runtime store"""
+        if stored[ATTR_STATE] is None:
+            return
+        self._state = stored[ATTR_STATE]
+        self.attr[LAST_UPDATED] = from_timestamp(stored[LAST_UPDATED])
+        self.attr[QUALITY] = stored[QUALITY]
+        for window, score in stored[SCORES].items():
+            if window in self._windows:
+                self.attr[SCORES][window] = score
+
+    def _restore_history(self, attributes) -> None:
+        """Restores the intervals that are not in the history from the
+        attributes"""
+        histories = [(ENERGY, self._energy_history), (PRICES, self._price_history)]
+        if (history := attributes.get(HISTORY)) and (
+            start := history.get(HISTORY_START)
+        ) is not None:
+            if history.get(HISTORY_STEP, 1) != self._interval / 60:
+                # Written with another interval length
+                return
+            last = start + max(
+                len(history.get(ENERGY, [])), len(history.get(PRICES, []))
+            )
+            if all(
+                intervals.newest is not None and intervals.newest >= last - 1
+                for _, intervals in histories
+            ):
+                # The store was written with the attributes, and holds them
+                return
+            for attribute, intervals in histories:
+                for index, value in enumerate(history.get(attribute, [])):
+                    # Intervals without values are left out, as they were not held
+                    interval = start + index
+                    if value is not None and interval not in intervals:
+                        intervals.set(interval, value)
+            return
+
+        # Attributes written by hour before the history attribute was introduced
+        for attribute, intervals in histories:
+            for key, value in attributes.get(attribute, {}).items():
+                if isinstance(key, str):
+                    interval = epoch_interval(dt.parse_datetime(key), self._interval)
+                    if interval not in intervals:
+                        intervals.set(interval, value)
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Close the history store"""
+        await super().async_will_remove_from_hass()
+        if self._store is not None:
+            await self.hass.async_add_executor_job(self._store.close)
+            self._store = None
+
+    @callback
+    def async_join_price_hub(self, hub: PriceHub) -> CALLBACK_TYPE:
+        """Scores the sensor together with the other members of a price hub,
+        returns a callback leaving it again"""
+        self._hub = hub
+        return hub.async_add_member(self)
+
+    def process_new_data(
+        self, data: SourceData, now: datetime.datetime | None = None
+    ) -> int:
+        """Processes the update data at the given local time, the current
+        time if not given, and returns the new EnergyScore"""
+        # Based on the user's time zone settings
+        now = epoch_interval(now or dt.now(), self._interval)
 
         # Add new data, need to check declining energy first
-        previous = now - datetime.timedelta(hours=1)
-        if (
-            previous in self.attr[ENERGY]
-            and self.attr[ENERGY][previous] is not None
-            and self._energy.state < self.attr[ENERGY][previous]
-        ):
-            _state_class = self._energy.attributes.get("state_class")
-            _last_reset = self._energy.attributes.get("last_reset")
+        previous = self._energy_history.get(now - 1)
+        if previous is not None and data.energy < previous:
+            _state_class = data.energy_attributes.get("state_class")
+            _last_reset = data.energy_attributes.get("last_reset")
             if _last_reset is not None:
                 _last_reset = dt.parse_datetime(_last_reset).replace(
                     minute=0, second=0, microsecond=0
@@ -257,7 +536,7 @@ class EnergyScore(SensorEntity, RestoreEntity):
             if _state_class == "total_increasing" or (
                 _state_class == "total" and _last_reset is not None
             ):
-                self.attr[ENERGY][now] = self._energy.state
+                self._energy_history.set(now, data.energy)
             else:
                 if _state_class == "total":
                     _warn_text = """, but there is no last_reset attribute to confirm that the sensor is expected to decline the value."""
@@ -269,127 +548,263 @@ class EnergyScore(SensorEntity, RestoreEntity):
                     _state_class,
                     _warn_text,
                 )
-                self.attr[ENERGY][now] = None
+                self._energy_history.set(now, None)
         else:
-            self.attr[ENERGY][now] = self._energy.state
-        self.attr[PRICES][now] = self._price.state
+            self._energy_history.set(now, data.energy)
+        # Old data falls out of the histories as the new interval is set
+        self._price_history.set(now, data.price)
 
-        # Calculate energy data per hour from total:
-        _energy_usage = calculate_hourly_energy_usage(self.attr[ENERGY])
+        # Published prices fill the intervals missed while not running
+        filled = False
+        for interval, price in data.prices.items():
+            if (
+                now - self._length < interval < now
+                and interval not in self._price_history
+            ):
+                self._price_history.set(interval, price)
+                filled = True
+        if filled:
+            _LOGGER.debug("%s - Filled missing prices from attributes", self._name)
+            self._hub.async_invalidate()
+
+        # Only the usage of the current interval changes, earlier ones are kept
+        _, _usage = self._energy_usage(now, now)
+        _energy = float(_usage[0]) if len(_usage) else math.nan
+        self._hub.async_update(self, now, data.price, _energy)
+        _LOGGER.debug("%s - Calculated energy usage: %s", self._name, _energy)
+
+        return self._current_score()
+
+    def _energy_usage(self, first: int, last: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the intervals from first to last with energy usage above
+        treshold"""
+        _readings, _held = self._energy_history.slice(first - 1, last - first + 2)
+        return usage_above_treshold(first - 1, _readings, _held, self._treshold)
 
-        # Remove all energy usage below treshold:
-        _energy_usage = {k: v for k, v in _energy_usage.items() if v >= self._treshold}
+    @property
+    def history_length(self) -> int:
+        """The number of intervals of history the windows need"""
+        return self._length
 
-        # Clean out old data:
-        def cutoff(data: dict, hours: int) -> dict:
-            """Cuts off old energy and price data"""
-            cut_hours = now - datetime.timedelta(hours=hours)
-            return {time: value for (time, value) in data.items() if time > cut_hours}
+    @property
+    def newest_interval(self) -> int | None:
+        """The newest interval in the histories, None if they are empty"""
+        return max(
+            (
+                history.newest
+                for history in (self._price_history, self._energy_history)
+                if history.newest is not None
+            ),
+            default=None,
+        )
 
-        _energy_usage = cutoff(_energy_usage, self._rolling_hours)
-        self.attr[PRICES] = cutoff(self.attr[PRICES], self._rolling_hours)
-        self.attr[ENERGY] = cutoff(self.attr[ENERGY], self._rolling_hours + 1)
+    @property
+    def held_samples(self) -> int:
+        """The number of energy readings and prices held in the histories"""
+        return len(self._energy_history) + len(self._price_history)
 
-        _LOGGER.debug(
-            "%s - Calculated energy usage: %s",
-            self._name,
-            [round(val, 2) for key, val in _energy_usage.items()],
-        )
+    @property
+    def price_history(self) -> HourlyHistory:
+        """The hourly prices"""
+        return self._price_history
 
-        # Calculate quality and break out if applicable
-        q = min(len(self.attr[PRICES]), len(_energy_usage)) / self._rolling_hours
-        self.attr[QUALITY] = round(q, 2)
+    @property
+    def score_lengths(self) -> list[int]:
+        """The number of intervals of every window scored, the rolling hours
+        first"""
+        return [
+            hours * self._per_hour
+            for hours in [self._rolling_hours, *self._windows.values()]
+        ]
+
+    @property
+    def energy_treshold(self) -> float:
+        """The energy usage of an interval below which it is not scored"""
+        return self._treshold
+
+    def simulation_prices(self, source: str, count: int) -> tuple[int, np.ndarray]:
+        """Returns the first interval and the prices of count intervals, NaN
+        if not known, to score energy profiles against
+
+        The source is the history, ending at the current interval, or the
+        prices of today or tomorrow published in the attributes of the price
+        entity, from local midnight.
+        """
+        if source == "history":
+            first = epoch_interval(dt.now(), self._interval) - count + 1
+            prices, _ = self._price_history.slice(first, count)
+            return first, prices
+        date = dt.now().date() + datetime.timedelta(days=source == "tomorrow")
+        first = epoch_interval(dt.start_of_local_day(date), self._interval)
+        state = self.hass.states.get(self._price_entity)
+        published = (
+            interval_prices(state.attributes, self._interval, source) if state else {}
+        )
+        return first, interval_values(published, first, count)
+
+    def price_windows(self) -> tuple[int, PriceWindows]:
+        """Returns the first interval and the cheapest windows of the price
+        history followed by the prices of today and tomorrow published in the
+        attributes of the price entity, NaN if not known
+
+        Kept until the history or the published prices change.
+        """
+        state = self.hass.states.get(self._price_entity)
+        # The state is replaced, not changed, when new prices are published
+        key = (self._price_history, self._price_history.version, state)
+        if self._price_windows is not None and self._price_windows[0] == key:
+            return self._price_windows[1:]
+        intervals, prices, _ = self._price_history.window()
+        if len(intervals):
+            first, newest = int(intervals[0]), int(intervals[-1])
+        else:
+            first = epoch_interval(dt.now(), self._interval)
+            newest = first - 1
+        published: dict[int, float] = {}
+        if state:
+            for day in ("today", "tomorrow"):
+                published.update(interval_prices(state.attributes, self._interval, day))
+        ahead = interval_values(
+            published, newest + 1, max(published, default=newest) - newest
+        )
+        self._price_windows = (
+            key,
+            first,
+            PriceWindows(np.concatenate((prices, ahead))),
+        )
+        _LOGGER.debug("%s - Built the price windows", self._name)
+        return self._price_windows[1:]
+
+    def interval_usage(self, first: int, last: int) -> np.ndarray:
+        """Returns the energy usage above treshold of the intervals from first
+        to last, NaN for intervals without it"""
+        _intervals, _usage = self._energy_usage(first, last)
+        usage = np.full(last - first + 1, np.nan)
+        usage[_intervals - first] = _usage
+        return usage
+
+    def set_window_scores(self, scores: dict[int, WindowScore]) -> bool:
+        """Sets the scores of the windows, returns if any of them changed"""
+        changed = scores != self._window_scores
+        self._window_scores = scores
+        return changed
+
+    @callback
+    def async_scores_changed(self) -> None:
+        """Writes the state when the scores changed by an update of another
+        sensor sharing the price entity"""
+        self._state = self._current_score()
+        self.async_write_ha_state()
+
+    def _current_score(self) -> int:
+        """Calculates the quality and the score of every window"""
+        for window, hours in self._windows.items():
+            score, quality = self._window_score(hours)
+            self.attr[SCORES][window] = {SCORE: score, QUALITY: quality}
+
+        score, self.attr[QUALITY] = self._window_score(self._rolling_hours)
         _LOGGER.debug("%s - Quality: %s", self._name, self.attr[QUALITY])
-        if self.attr[QUALITY] == 0 or len(set(self.attr[ENERGY].values())) == 1:
+        return score
+
+    def _window_score(self, hours: int) -> tuple[int, float]:
+        """Returns the score and quality of the window of the given hours"""
+        length = hours * self._per_hour
+        window = self._window_scores.get(length, WindowScore(None, 0, 0))
+        score, quality = window_result(window, length)
+        if score is None:
             _LOGGER.debug(
                 "%s - Not able to calculate energy use in the last %s hours",
                 self._name,
-                self._rolling_hours,
+                hours,
             )
             # TODO: Check if it is actually possible to have quality = 0
             # and if so, should the return really be 100?
-            return 100
+            return 100, quality
+        _LOGGER.debug("%s - Score of %s hours: %s", self._name, hours, window.score)
 
-        # Normalise and intersect the data
-        _norm_prices = normalise_price(self.attr[PRICES])
-        _norm_energies = normalise_energy(_energy_usage)
-        _intersection = self.attr[PRICES].keys() & _energy_usage.keys()
-        _price_array = np.array([_norm_prices[x] for x in _intersection])
-        _energy_array = np.array([_norm_energies[x] for x in _intersection])
-        _LOGGER.debug("%s - Norm prices: %s", self._name, np.round(_price_array, 2))
-        _LOGGER.debug("%s - Norm energy: %s", self._name, np.round(_energy_array, 2))
+        return score, quality
 
-        # Calculate the energyscore
-        _score = np.dot(_price_array, _energy_array)
-        _LOGGER.debug("%s - Score: %s", self._name, _score)
-
-        return int(_score * 100)
-
-    async def async_update(self):
-        """Updates the sensor"""
-
-        # Below can be moved to an update handler
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Updates the sensor with the new source data"""
+        if self.coordinator.data is None:
+            self.coordinator.metrics.skip()
+            self._async_notify_update_listeners()
+            return
         try:
-            self._price = self.hass.states.get(self._price_entity)
-            self._energy = self.hass.states.get(self._energy_entity)
-
-            if self._price.state in [STATE_UNAVAILABLE, STATE_UNKNOWN]:
-                _LOGGER.info("%s - Price data is %s", self._name, self._price.state)
-                self._price = False
-            if self._energy.state in [STATE_UNAVAILABLE, STATE_UNKNOWN]:
-                _LOGGER.info("%s - Energy data is %s", self._name, self._energy.state)
-                self._energy = False
-            if not self._price or not self._energy:
-                return
-
-            self._price.state = round(float(self._price.state), 2)
-            self._energy.state = round(float(self._energy.state), 2)
-
-        except ValueError:
-            _LOGGER.exception("%s - Possibly non-numeric source state", self._name)
+            with self.coordinator.metrics.time_update():
+                self._state = self.process_new_data(self.coordinator.data)
         except Exception:
-            _LOGGER.exception("%s - Could not fetch price and energy data", self._name)
+            _LOGGER.exception(
+                "%s - Could not process the updated data and produce the new EnergyScore",
+                self._name,
+            )
         else:
-            try:
-                self._state = self.process_new_data()
-            except Exception:
-                _LOGGER.exception(
-                    "%s - Could not process the updated data and produce the new EnergyScore",
-                    self._name,
-                )
-            else:
-                self.attr[LAST_UPDATED] = dt.now()
+            self.attr[LAST_UPDATED] = dt.now()
+        self.async_write_ha_state()
+        if self._runtime is not None:
+            self._runtime.async_schedule_save()
+
+        # The completed intervals are written to disk once every interval
+        if self._store is not None and self._flushed_interval != self.newest_interval:
+            self._flushed_interval = self.newest_interval
+            self.hass.async_add_executor_job(self._store.flush)
+        self._async_notify_update_listeners()
+
+    @callback
+    def async_add_update_listener(
+        self, update_callback: CALLBACK_TYPE
+    ) -> CALLBACK_TYPE:
+        """Listen for updates, also those skipped, returns a callback to stop
+        listening"""
+        self._update_listeners.append(update_callback)
+        return lambda: self._update_listeners.remove(update_callback)
+
+    @callback
+    def _async_notify_update_listeners(self) -> None:
+        """Pushes the update, e.g. to the diagnostic sensors"""
+        for update_callback in list(self._update_listeners):
+            update_callback()
+
+
+def _parse_times(values: dict) -> dict:
+    """Returns a dict of restored values by time string with the times parsed"""
+    return {
+        dt.parse_datetime(key) if isinstance(key, str) else key: value
+        for key, value in values.items()
+    }
 
-                # Datatimes needs to be converted to strings in state attributes
-                self.attr[PRICES] = {
-                    key.strftime("%Y-%m-%dT%H:%M:%S%z"): val
-                    for key, val in self.attr[PRICES].items()
-                }
-                self.attr[ENERGY] = {
-                    key.strftime("%Y-%m-%dT%H:%M:%S%z"): val
-                    for key, val in self.attr[ENERGY].items()
-                }
 
+def _format_times(values: dict) -> dict:
+    """Returns a dict of values by time with the times as strings, as they
+    need to be in state attributes"""
+    return {
+        key if isinstance(key, str) else key.strftime(TIME_FORMAT): value
+        for key, value in values.items()
+    }
 
-class Cost(SensorEntity, RestoreEntity):
+
+class Cost(CoordinatorEntity, SensorEntity, RestoreEntity):
     """Current day cost sensor class"""
 
     _attr_state_class = SensorStateClass.TOTAL_INCREASING
 
-    def __init__(self, hass: HomeAssistant, config):
+    def __init__(self, coordinator, config):
+        super().__init__(coordinator)
         self._attr_icon: str = ICON_COST
         self._attr_unit_of_measurement = None
         self._attr_unique_id = f"{config.get(CONF_UNIQUE_ID)}_cost"
+        self._cost_listeners: list[CALLBACK_TYPE] = []
         self._energy_entity = config[CONF_ENERGY_ENTITY]
         self._name = f"{config[CONF_NAME]} Cost"
         self._price_entity = config[CONF_PRICE_ENTITY]
         self._state = None
         self.attr = {LAST_ENERGY: {}, LAST_UPDATED: None}
         self.config = config
-        self.energy = None
+        self.completed_intervals: list[IntervalEnergy] = []
         self.energy_usage = None
-        self.hass = hass
-        self.price = None
+        self._runtime: RuntimeStore | None = None
+        self._times_parsed = True
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -412,15 +827,19 @@ class Cost(SensorEntity, RestoreEntity):
 
     @property
     def extra_state_attributes(self):
-        return self.attr
+        # The times are only formatted when the state is written
+        return {**self.attr, LAST_ENERGY: _format_times(self.attr[LAST_ENERGY])}
 
     @property
     def unit_of_measurement(self) -> str:
-        """Return the unit of measurement."""
-        return self.get_uom()
+        """Return the unit of measurement, only resolved again when invalidated"""
+        if not self.coordinator.cost_unit_valid:
+            self.get_uom()
+        return self._attr_unit_of_measurement
 
     def get_uom(self) -> str:
         """Finds the unit of measurement based on source entities"""
+        self.coordinator.cost_unit_valid = True
         entity_reg = er.async_get(self.hass)
         if entity_reg.async_is_registered(
             self._price_entity
@@ -447,6 +866,20 @@ class Cost(SensorEntity, RestoreEntity):
         """Restore last state if same date"""
         _LOGGER.debug("Trying to restore %s", self._name)
         await super().async_added_to_hass()
+        if not self._restore_from_runtime_store():
+            await self._async_restore_last_state()
+        if (aggregator := self.coordinator.energy_aggregator) is not None:
+            self.async_on_remove(
+                self.coordinator.async_add_energy_listener(self._handle_energy_update)
+            )
+            # Energy used while not running is given to the first intervals
+            self._parse_restored_times()
+            if aggregator.reading is None and self.attr[LAST_ENERGY]:
+                time = max(self.attr[LAST_ENERGY])
+                aggregator.add(time.timestamp(), float(self.attr[LAST_ENERGY][time]))
+
+    async def _async_restore_last_state(self) -> None:
+        """Restores the state and attributes of the last run"""
         if (
             (last_state := await self.async_get_last_state())
             and last_state.state not in (STATE_UNKNOWN, STATE_UNAVAILABLE)
@@ -467,24 +900,72 @@ class Cost(SensorEntity, RestoreEntity):
             )
             if self.attr[LAST_UPDATED].date() == dt.now().date():
                 self._state = float(last_state.state)
+                # Kept as restored until the first update
                 self.attr[LAST_ENERGY] = last_state.attributes[LAST_ENERGY]
+                self._times_parsed = False
                 _LOGGER.debug("Restored %s", self._name)
             else:
                 self._state = 0
 
-    def process_new_data(self):
-        """Processes the update data"""
-        now = dt.now()
-
-        # Parse datetimes from strings
-        self.attr[LAST_ENERGY] = {
-            dt.parse_datetime(key): value
-            for key, value in self.attr[LAST_ENERGY].items()
-            if isinstance(key, str)
+    @callback
+    def _restore_from_runtime_store(self) -> bool:
+        """Adds the sensor to the runtime store, returns if it was restored
+        from it"""
+        if (runtime := async_get_runtime_store(self.hass)) is None or (
+            self.config.get(CONF_UNIQUE_ID) is None
+        ):
+            return False
+        self._runtime = runtime
+        stored = runtime.async_get(self._attr_unique_id)
+        self.async_on_remove(
+            runtime.async_add_sensor(self._attr_unique_id, self.runtime_state)
+        )
+        if stored is None:
+            return False
+        if self._attr_unit_of_measurement is None:
+            self._attr_unit_of_measurement = stored[ATTR_UNIT_OF_MEASUREMENT]
+        if stored[ATTR_STATE] is not None and stored[LAST_UPDATED] is not None:
+            self.attr[LAST_UPDATED] = from_timestamp(stored[LAST_UPDATED])
+            if self.attr[LAST_UPDATED].date() == dt.now().date():
+                self._state = stored[ATTR_STATE]
+                self.attr[LAST_ENERGY] = times_from_list(stored[LAST_ENERGY])
+            else:
+                self._state = 0
+        _LOGGER.debug("Restored %s from the runtime state", self._name)
+        return True
+
+    def runtime_state(self) -> dict[str, Any]:
+        """Returns the state to keep in the runtime store"""
+        self._parse_restored_times()
+        return {
+            ATTR_STATE: self._state,
+            ATTR_UNIT_OF_MEASUREMENT: self._attr_unit_of_measurement,
+            LAST_UPDATED: to_timestamp(self.attr[LAST_UPDATED]),
+            LAST_ENERGY: times_to_list(self.attr[LAST_ENERGY]),
         }
 
+    def _parse_restored_times(self) -> None:
+        """Parses the datetimes of the restored attributes once"""
+        if not self._times_parsed:
+            self.attr[LAST_ENERGY] = _parse_times(self.attr[LAST_ENERGY])
+            self._times_parsed = True
+
+    @callback
+    def async_add_cost_listener(self, update_callback: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        """Listen for updates of the cost, returns a callback to stop listening"""
+        self._cost_listeners.append(update_callback)
+        return lambda: self._cost_listeners.remove(update_callback)
+
+    def process_new_data(
+        self, data: SourceData, now: datetime.datetime | None = None
+    ) -> None:
+        """Processes the update data at the given local time, the current
+        time if not given"""
+        now = now or dt.now()
+        self._parse_restored_times()
+
         # Add current energy
-        self.attr[LAST_ENERGY][now] = self.energy.state
+        self.attr[LAST_ENERGY][now] = data.energy
         _LOGGER.debug(
             "Cost calc for %s - Last energy: %s", self.name, self.attr[LAST_ENERGY]
         )
@@ -498,16 +979,12 @@ class Cost(SensorEntity, RestoreEntity):
         if self.energy_usage is None:
             return
 
-        cost = self.price.state * self.energy_usage
-
-        # Check new date
-        if (
-            min(self.attr[LAST_ENERGY]).date() != max(self.attr[LAST_ENERGY]).date()
-            or self._state is None
-        ):
-            self._state = round(cost, 2)
-        else:
-            self._state = round(self._state + cost, 2)
+        # The cost starts again on a new date
+        self._state = accumulate(
+            self._state,
+            data.price * self.energy_usage,
+            min(self.attr[LAST_ENERGY]).date() != max(self.attr[LAST_ENERGY]).date(),
+        )
         _LOGGER.debug("%s - Cost: %s", self._name, self._state)
 
         # Clean old data
@@ -519,54 +996,86 @@ class Cost(SensorEntity, RestoreEntity):
 
         return
 
-    async def async_update(self):
-        """Updates the sensor"""
+    def process_intervals(self, intervals: list[IntervalEnergy]) -> None:
+        """Adds the cost of the coalesced energy of completed intervals, each
+        at the price of its own interval
+
+        The last updated time is the start of the last interval added, so the
+        cost starts again with the first interval of a new date.
+        """
+        self._parse_restored_times()
+        minutes = self.coordinator.interval
+        for completed in intervals:
+            start = interval_start(completed.interval, minutes, dt.DEFAULT_TIME_ZONE)
+            if completed.price is None:
+                _LOGGER.debug("%s - No price for %s", self._name, start)
+            self._state = accumulate(
+                self._state,
+                0 if completed.price is None else completed.price * completed.energy,
+                self.attr[LAST_UPDATED] is None
+                or start.date() != self.attr[LAST_UPDATED].date(),
+            )
+            self.attr[LAST_UPDATED] = start
+        _LOGGER.debug("%s - Cost: %s", self._name, self._state)
 
-        if self._attr_unit_of_measurement is None:
-            self.get_uom()
+        # The last reading, to start from after a restart
+        time, total = self.coordinator.energy_aggregator.reading
+        self.attr[LAST_ENERGY] = {from_timestamp(time): total}
 
+    @callback
+    def _handle_energy_update(self, intervals: list[IntervalEnergy]) -> None:
+        """Updates the sensor with the coalesced energy of completed intervals"""
         _LOGGER.debug("The cost for %s are being updated", self._name)
-        try:
-            self.price = self.hass.states.get(self._price_entity)
-            self.energy = self.hass.states.get(self._energy_entity)
-
-            if self.price.state in [STATE_UNAVAILABLE, STATE_UNKNOWN]:
-                _LOGGER.info("%s - Price data is %s", self._name, self.price.state)
-                self.price = False
-            if self.energy.state in [STATE_UNAVAILABLE, STATE_UNKNOWN]:
-                _LOGGER.info("%s - Energy data is %s", self._name, self.energy.state)
-                self.energy = False
-            if not self.price or not self.energy:
-                return
+        self.process_intervals(intervals)
+        self.completed_intervals = intervals
+        self._async_write_cost()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Updates the sensor with the new source data"""
+        if self.coordinator.data is None:
+            return
+        if self.coordinator.energy_aggregator is not None:
+            # Updated by the energy of completed intervals instead
+            return
 
-            self.price.state = round(float(self.price.state), 2)
-            self.energy.state = round(float(self.energy.state), 2)
+        _LOGGER.debug("The cost for %s are being updated", self._name)
+        self.process_new_data(self.coordinator.data)
+        self.attr[LAST_UPDATED] = dt.now()
+        self._async_write_cost()
 
-        except ValueError:
-            _LOGGER.exception("%s - Possibly non-numeric source state", self._name)
-        except Exception:
-            _LOGGER.exception("%s - Could not fetch price and energy data", self._name)
-        else:
-            self.process_new_data()
+    @callback
+    def _async_write_cost(self) -> None:
+        """Writes the state and pushes the updated cost"""
+        self.async_write_ha_state()
+        if self._runtime is not None:
+            self._runtime.async_schedule_save()
 
-            # Datetimes needs to be converted to strings in state attributes
-            self.attr[LAST_ENERGY] = {
-                key.strftime("%Y-%m-%dT%H:%M:%S%z"): val
-                for key, val in self.attr[LAST_ENERGY].items()
-            }
-            self.attr[LAST_UPDATED] = dt.now()
+        # Pushes the updated cost, e.g. to the Potential Savings sensor
+        for update_callback in list(self._cost_listeners):
+            update_callback()
 
 
 class PotentialSavings(SensorEntity, RestoreEntity):
-    """Current day savings sensor class"""
+    """Current day savings sensor class
+
+    Updated by the cost sensor right after it has processed new source data,
+    or the coalesced energy of completed intervals.
 
+    With a max shiftable power, the minimum cost is the lowest cost the energy
+    used during each interval of today could have had, if at most that power
+    had been used during other intervals instead. Else all energy could have
+    been used at the lowest price of today.
+    """
+
+    _attr_should_poll = False
     _attr_state_class = SensorStateClass.MEASUREMENT
 
-    def __init__(self, hass, config):
+    def __init__(self, coordinator, config, cost: Cost, max_shiftable_power: float = 0):
         self._attr_icon: str = ICON_SAVINGS
         self._attr_unit_of_measurement = None
         self._attr_unique_id = f"{config.get(CONF_UNIQUE_ID)}_potential_savings"
-        self._hass = hass
+        self._cost = cost
         self._name = f"{config[CONF_NAME]} Potential Savings"
         self._state = None
         self.attr = {
@@ -580,14 +1089,17 @@ class PotentialSavings(SensorEntity, RestoreEntity):
             QUALITY: None,
         }
         self.config = config
-        self.cost_uid = f"{config.get(CONF_UNIQUE_ID)}_cost"
-        self.cost = None
-        self.cost_entity = None
-        self.energy = None
-        self.energy_entity = config[CONF_ENERGY_ENTITY]
-        self.price = None
-        self.price_entity = config[CONF_PRICE_ENTITY]
-        self.score_uid = config.get(CONF_UNIQUE_ID)
+        self.coordinator = coordinator
+        self._day_energy: dict[datetime.datetime, float] = {}
+        self._day_prices = DayPrices()
+        # The energy of an interval that could have been used in others
+        self._max_shift = (
+            max_shiftable_power * coordinator.interval / 60
+            if max_shiftable_power
+            else None
+        )
+        self._runtime: RuntimeStore | None = None
+        self._times_parsed = True
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -610,7 +1122,12 @@ class PotentialSavings(SensorEntity, RestoreEntity):
 
     @property
     def extra_state_attributes(self):
-        return self.attr
+        # The times are only formatted when the state is written
+        return {
+            **self.attr,
+            LAST_ENERGY: _format_times(self.attr[LAST_ENERGY]),
+            PRICES: _format_times(self.attr[PRICES] or {}),
+        }
 
     @property
     def unit_of_measurement(self) -> str:
@@ -621,6 +1138,11 @@ class PotentialSavings(SensorEntity, RestoreEntity):
         """Restore last state if same date"""
         _LOGGER.debug("Trying to restore %s", self._name)
         await super().async_added_to_hass()
+        self.async_on_remove(
+            self._cost.async_add_cost_listener(self._handle_cost_update)
+        )
+        if self._restore_from_runtime_store():
+            return
         if (
             (last_state := await self.async_get_last_state())
             and last_state.state not in (STATE_UNKNOWN, STATE_UNAVAILABLE)
@@ -653,67 +1175,156 @@ class PotentialSavings(SensorEntity, RestoreEntity):
                 ]:
                     if attribute in last_state.attributes:
                         self.attr[attribute] = last_state.attributes[attribute]
+                # The times are kept as restored until the first update
+                self._times_parsed = False
             else:
                 self._state = 0
             _LOGGER.debug("Restored %s", self._name)
 
-    def process_new_data(self):
-        """Processes the update data"""
-        # Fist part similar to cost sensor. Simplify?
-        now = dt.now()
-
-        # Parse datetimes from strings
-        for i in [LAST_ENERGY, PRICES]:
-            if self.attr[i] is not None:
-                self.attr[i] = {
-                    dt.parse_datetime(key): value
-                    for key, value in self.attr[i].items()
-                    if isinstance(key, str)
-                }
-
-        # Reset cost if last update was another day
-        last_cost = self.cost.attributes.get("last_updated")
-        if last_cost is not None and last_cost.date() != now.date():
-            self.cost.state = 0
-            _LOGGER.debug("%s - Updated cost to 0", self._name)
-
-        # Find current day prices
-        self.attr[PRICES][
-            now.replace(minute=0, second=0, microsecond=0)
-        ] = self.price.state
-        self.attr[PRICES] = {
-            time: value
-            for (time, value) in self.attr[PRICES].items()
-            if time.date() == now.date()
+    @callback
+    def _restore_from_runtime_store(self) -> bool:
+        """Adds the sensor to the runtime store, returns if it was restored
+        from it"""
+        if (runtime := async_get_runtime_store(self.hass)) is None or (
+            self.config.get(CONF_UNIQUE_ID) is None
+        ):
+            return False
+        self._runtime = runtime
+        stored = runtime.async_get(self._attr_unique_id)
+        self.async_on_remove(
+            runtime.async_add_sensor(self._attr_unique_id, self.runtime_state)
+        )
+        if stored is None:
+            return False
+        if self._attr_unit_of_measurement is None:
+            self._attr_unit_of_measurement = stored[ATTR_UNIT_OF_MEASUREMENT]
+        if stored[ATTR_STATE] is not None and stored[LAST_UPDATED] is not None:
+            self.attr[LAST_UPDATED] = from_timestamp(stored[LAST_UPDATED])
+            if self.attr[LAST_UPDATED].date() == dt.now().date():
+                self._state = stored[ATTR_STATE]
+                for attribute in [COST_AVG, COST_MIN, COST_MAX, ENERGY_TODAY, QUALITY]:
+                    self.attr[attribute] = stored[attribute]
+                for attribute in [LAST_ENERGY, PRICES]:
+                    self.attr[attribute] = times_from_list(stored[attribute])
+                if DAY_PRICES in stored:
+                    self._day_prices = DayPrices(**stored[DAY_PRICES])
+                else:
+                    self._rebuild_day_prices()
+                self._day_energy = times_from_list(stored.get(DAY_ENERGY, []))
+                self._attribute_restored_energy()
+            else:
+                self._state = 0
+        _LOGGER.debug("Restored %s from the runtime state", self._name)
+        return True
+
+    def runtime_state(self) -> dict[str, Any]:
+        """Returns the state to keep in the runtime store"""
+        self._parse_restored_times()
+        return {
+            ATTR_STATE: self._state,
+            ATTR_UNIT_OF_MEASUREMENT: self._attr_unit_of_measurement,
+            LAST_UPDATED: to_timestamp(self.attr[LAST_UPDATED]),
+            **{
+                attribute: self.attr[attribute]
+                for attribute in [COST_AVG, COST_MIN, COST_MAX, ENERGY_TODAY, QUALITY]
+            },
+            **{
+                attribute: times_to_list(self.attr[attribute])
+                for attribute in [LAST_ENERGY, PRICES]
+            },
+            DAY_ENERGY: times_to_list(self._day_energy),
+            DAY_PRICES: self._day_prices.as_dict(),
         }
 
+    def _parse_restored_times(self) -> None:
+        """Parses the datetimes of the restored attributes once"""
+        if not self._times_parsed:
+            for i in [LAST_ENERGY, PRICES]:
+                self.attr[i] = _parse_times(self.attr[i] or {})
+            self._rebuild_day_prices()
+            self._attribute_restored_energy()
+            self._times_parsed = True
+
+    def _rebuild_day_prices(self) -> None:
+        """Aggregates the restored prices of today, which is only needed
+        once"""
+        self._day_prices = DayPrices.from_prices(
+            (time.timestamp(), price) for time, price in self.attr[PRICES].items()
+        )
+
+    def _attribute_restored_energy(self) -> None:
+        """Gives the energy of today restored without the energy by interval,
+        e.g. from the state attributes, to the interval of the last update"""
+        if not self._day_energy and self.attr[ENERGY_TODAY] and self.attr[PRICES]:
+            self._day_energy = {max(self.attr[PRICES]): self.attr[ENERGY_TODAY]}
+
+    def _new_day(self, start: datetime.datetime) -> bool:
+        """Starts the prices and energy by interval again if the interval
+        starting at start is of a new date, returns if it is"""
+        if (
+            self._day_prices.key is None
+            or from_timestamp(self._day_prices.key).date() == start.date()
+        ):
+            return False
+        self.attr[PRICES] = {}
+        self._day_energy = {}
+        self._day_prices = DayPrices()
+        return True
+
+    def _set_price(self, start: datetime.datetime, price: float) -> None:
+        """Sets the price of the interval starting at start"""
+        self._new_day(start)
+        self.attr[PRICES][start] = price
+        self._day_prices.set(start.timestamp(), price)
+
+    def _add_energy(self, start: datetime.datetime, energy: float) -> None:
+        """Adds energy used during the interval starting at start"""
+        self._day_energy[start] = self._day_energy.get(start, 0.0) + energy
+
+    def _costs(self) -> None:
+        """Calculates the costs of the energy used today"""
+        self.attr[COST_AVG], self.attr[COST_MIN], self.attr[COST_MAX] = day_costs(
+            self._day_prices,
+            self.attr[ENERGY_TODAY],
+            self._day_energy,
+            self.attr[PRICES],
+            self._max_shift,
+        )
+
+    def process_new_data(
+        self,
+        data: SourceData,
+        cost: float | None,
+        now: datetime.datetime | None = None,
+    ) -> None:
+        """Processes the update data at the given local time, the current
+        time if not given"""
+        # Fist part similar to cost sensor. Simplify?
+        now = now or dt.now()
+        self._parse_restored_times()
+
+        # Keep current day prices by interval, and their running aggregates
+        interval = self.coordinator.interval
+        start = now.replace(
+            minute=now.minute - now.minute % interval, second=0, microsecond=0
+        )
+        self._set_price(start, data.price)
+
         # Calculate energy usage
-        self.attr[LAST_ENERGY][now] = self.energy.state
+        self.attr[LAST_ENERGY][now] = data.energy
         energy_usage = calculate_energy_usage(self.attr[LAST_ENERGY])
         _LOGGER.debug("%s - Energy usage: %s", self._name, energy_usage)
-        if energy_usage is None or len(self.attr[PRICES]) == 0:
+        if energy_usage is None or self._day_prices.count == 0 or cost is None:
             return
-        if (
-            min(self.attr[LAST_ENERGY]).date() != max(self.attr[LAST_ENERGY]).date()
-            or self.attr[ENERGY_TODAY] is None
-        ):
-            self.attr[ENERGY_TODAY] = round(energy_usage, 2)
-        else:
-            self.attr[ENERGY_TODAY] = round(self.attr[ENERGY_TODAY] + energy_usage, 2)
+        self.attr[ENERGY_TODAY] = accumulate(
+            self.attr[ENERGY_TODAY],
+            energy_usage,
+            min(self.attr[LAST_ENERGY]).date() != max(self.attr[LAST_ENERGY]).date(),
+        )
+        self._add_energy(start, energy_usage)
 
         # Calculate costs
-        self.attr[COST_AVG] = round(
-            sum(self.attr[PRICES].values())
-            / len(self.attr[PRICES].values())
-            * self.attr[ENERGY_TODAY],
-            2,
-        )
-        self.attr[COST_MIN] = round(
-            min(self.attr[PRICES].values()) * self.attr[ENERGY_TODAY], 2
-        )
-        self.attr[COST_MAX] = round(
-            max(self.attr[PRICES].values()) * self.attr[ENERGY_TODAY], 2
-        )
+        self._costs()
         _LOGGER.debug(
             "%s - Calculated costs - Avg: %s, Max: %s, Min: %s",
             self._name,
@@ -723,15 +1334,13 @@ class PotentialSavings(SensorEntity, RestoreEntity):
         )
 
         # Compare min and actual cost to get potential
-        self._state = (
-            round(self.cost.state - self.attr[COST_MIN], 2)
-            if not self.cost.state - self.attr[COST_MIN] < 0
-            else 0
-        )
+        self._state = potential_savings(cost, self.attr[COST_MIN])
         _LOGGER.debug("%s - Potential Savings: %s", self._name, self._state)
 
         # Calculate quality
-        self.attr[QUALITY] = round(len(self.attr[PRICES]) / (now.hour + 1), 2)
+        self.attr[QUALITY] = day_quality(
+            self._day_prices.count, now.hour * 60 + now.minute, interval
+        )
 
         # Clean old data
         self.attr[LAST_ENERGY] = {
@@ -740,57 +1349,152 @@ class PotentialSavings(SensorEntity, RestoreEntity):
             if time == now
         }
 
-    async def async_update(self):
-        """Updates the potential sensor"""
-        _LOGGER.debug("The savings for %s are being updated", self._name)
-
-        try:
-            # Get Cost entity and unit of measurement
-            entity_reg = er.async_get(self._hass)
-            self.cost_entity = entity_reg.async_get_entity_id(
-                "sensor", DOMAIN, self.cost_uid
-            )
-            self._attr_unit_of_measurement = get_unit_of_measurement(
-                self.hass, self.cost_entity
+    def process_intervals(
+        self, intervals: list[IntervalEnergy], cost: float | None
+    ) -> None:
+        """Adds the coalesced energy and the prices of completed intervals"""
+        self._parse_restored_times()
+        minutes = self.coordinator.interval
+        start = None
+        for completed in intervals:
+            start = interval_start(completed.interval, minutes, dt.DEFAULT_TIME_ZONE)
+            # The prices are of the date of the intervals
+            new_day = self._new_day(start)
+            if completed.price is not None:
+                self._set_price(start, completed.price)
+            self.attr[ENERGY_TODAY] = accumulate(
+                self.attr[ENERGY_TODAY], completed.energy, new_day
             )
+            self._add_energy(start, completed.energy)
+        if start is None or self._day_prices.count == 0 or cost is None:
+            return
 
-            # Update source states
-            self.cost = self.hass.states.get(self.cost_entity)
-            self.energy = self.hass.states.get(self.energy_entity)
-            self.price = self.hass.states.get(self.price_entity)
-
-            for sensor in [self.cost, self.energy, self.price]:
-                if sensor.state in [STATE_UNAVAILABLE, STATE_UNKNOWN]:
-                    _LOGGER.info(
-                        "%s - Potential data cannot be updated, state is %s for %s",
-                        self.name,
-                        sensor.state,
-                        sensor.entity_id,
-                    )
-                    return
-                sensor.state = float(sensor.state)
+        self._costs()
+        self._state = potential_savings(cost, self.attr[COST_MIN])
+        _LOGGER.debug("%s - Potential Savings: %s", self._name, self._state)
+        self.attr[QUALITY] = day_quality(
+            self._day_prices.count, start.hour * 60 + start.minute, minutes
+        )
 
-            _LOGGER.debug(
-                "The cost used in savings for %s is: %s, and is last updated: %s",
-                self._name,
-                self.cost.state,
-                self.cost.attributes.get("last_updated"),
-            )
+    @callback
+    def _handle_cost_update(self) -> None:
+        """Updates the potential sensor with the new cost and source data"""
+        _LOGGER.debug("The savings for %s are being updated", self._name)
+        self._attr_unit_of_measurement = self._cost.unit_of_measurement
+        _LOGGER.debug(
+            "The cost used in savings for %s is: %s", self._name, self._cost.state
+        )
 
-        except ValueError:
-            _LOGGER.exception("%s - Possibly non-numeric source state", self._name)
+        if self.coordinator.energy_aggregator is not None:
+            self.process_intervals(self._cost.completed_intervals, self._cost.state)
         else:
-            self.process_new_data()
+            self.process_new_data(self.coordinator.data, self._cost.state)
+        self.attr[LAST_UPDATED] = dt.now().strftime(TIME_FORMAT)
+        self.async_write_ha_state()
+        if self._runtime is not None:
+            self._runtime.async_schedule_save()
+
+
+@dataclass
+class DiagnosticSensorEntityDescription(SensorEntityDescription):
+    """Describes a diagnostic sensor of the updates of an EnergyScore entry"""
+
+    value_fn: Callable[[EnergyScore], Any] = lambda energyscore: None
+
+
+DIAGNOSTIC_SENSORS = (
+    DiagnosticSensorEntityDescription(
+        key="last_update_duration",
+        name="Last Update Duration",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda energyscore: energyscore.coordinator.metrics.last_duration,
+    ),
+    DiagnosticSensorEntityDescription(
+        key="p95_update_duration",
+        name="P95 Update Duration",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda energyscore: energyscore.coordinator.metrics.p95_duration,
+    ),
+    DiagnosticSensorEntityDescription(
+        key="history_samples",
+        name="History Samples",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda energyscore: energyscore.held_samples,
+    ),
+    DiagnosticSensorEntityDescription(
+        key="attribute_size",
+        name="Attribute Size",
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        state_class=SensorStateClass.MEASUREMENT,
+        # Only serialised when the diagnostic sensor is enabled
+        value_fn=lambda energyscore: len(
+            json_bytes(energyscore.extra_state_attributes)
+        ),
+    ),
+    DiagnosticSensorEntityDescription(
+        key="skipped_updates",
+        name="Skipped Updates",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda energyscore: energyscore.coordinator.metrics.skipped,
+    ),
+    DiagnosticSensorEntityDescription(
+        key="failed_updates",
+        name="Failed Updates",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda energyscore: energyscore.coordinator.metrics.failed,
+    ),
+)
 
-            # Datetimes needs to be converted to strings in state attributes
-            self.attr[LAST_ENERGY] = {
-                key.strftime("%Y-%m-%dT%H:%M:%S%z"): val
-                for key, val in self.attr[LAST_ENERGY].items()
-            }
 
-            self.attr[PRICES] = {
-                key.strftime("%Y-%m-%dT%H:%M:%S%z"): val
-                for key, val in self.attr[PRICES].items()
-            }
+class EnergyScoreDiagnostic(SensorEntity):
+    """Diagnostic sensor of the runtime of the updates of an entry
+
+    Disabled by default, and updated by the EnergyScore sensor right after it
+    has processed new source data.
+    """
 
-            self.attr[LAST_UPDATED] = dt.now().strftime("%Y-%m-%dT%H:%M:%S%z")
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_should_poll = False
+    entity_description: DiagnosticSensorEntityDescription
+
+    def __init__(
+        self,
+        coordinator,
+        config,
+        energyscore: EnergyScore,
+        description: DiagnosticSensorEntityDescription,
+    ):
+        self.entity_description = description
+        self._attr_icon: str = ICON_DIAGNOSTIC
+        self._attr_name = f"{config[CONF_NAME]} {description.name}"
+        self._attr_unique_id = f"{config.get(CONF_UNIQUE_ID)}_{description.key}"
+        self._energyscore = energyscore
+        self.config = config
+        self.coordinator = coordinator
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return the device info accosiated with the entity"""
+        return DeviceInfo(
+            identifiers={(DOMAIN, self.config.get(CONF_UNIQUE_ID))},
+            name=self.config[CONF_NAME],
+            manufacturer=DOMAIN,
+        )
+
+    @property
+    def native_value(self) -> Any:
+        """Return the metric of the entry"""
+        return self.entity_description.value_fn(self._energyscore)
+
+    async def async_added_to_hass(self) -> None:
+        """Follow the updates of the EnergyScore sensor"""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            self._energyscore.async_add_update_listener(self.async_write_ha_state)
+        )
@@ -0,0 +1,227 @@
+"""Services of EnergyScore"""
+from __future__ import annotations
+
+import logging
+import math
+from typing import Any, Awaitable, Callable
+
+from homeassistant.components.sensor import DOMAIN as SENSOR_DOMAIN
+from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.core import HomeAssistant, ServiceCall, callback
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.util import dt
+import voluptuous as vol
+
+from .const import CONF_MAX_SHIFTABLE_POWER, DOMAIN, QUALITY, SCORE
+from .engine import simulate_schedules
+from .history import epoch_interval, interval_start
+from .lazy import LazyModule
+
+try:
+    from homeassistant.core import SupportsResponse
+except ImportError:  # Service responses are new in Home Assistant 2023.7
+    SupportsResponse = None
+
+np = LazyModule("numpy")
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+ATTR_AVERAGE_PRICE = "average_price"
+ATTR_CONTIGUOUS = "contiguous"
+ATTR_END = "end"
+ATTR_HOURS = "hours"
+ATTR_NON_CONTIGUOUS = "non_contiguous"
+ATTR_PRICES = "prices"
+ATTR_PROFILES = "profiles"
+ATTR_RESULTS = "results"
+ATTR_START = "start"
+ATTR_STARTS = "starts"
+
+# Fired with the results when they are not returned as a service response
+EVENT_CHEAPEST_WINDOW = f"{DOMAIN}_cheapest_window"
+EVENT_SIMULATED = f"{DOMAIN}_simulated"
+
+PRICE_SOURCES = ["history", "today", "tomorrow"]
+WINDOW_PRICES = ["upcoming", "history"]
+
+SERVICE_CHEAPEST_WINDOW = "cheapest_window"
+SERVICE_SIMULATE = "simulate"
+
+CHEAPEST_WINDOW_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_ENTITY_ID): cv.entity_id,
+        vol.Required(ATTR_HOURS): vol.All(
+            vol.Coerce(float), vol.Range(min=0, min_included=False)
+        ),
+        vol.Optional(ATTR_PRICES, default="upcoming"): vol.In(WINDOW_PRICES),
+    }
+)
+
+SIMULATE_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_ENTITY_ID): cv.entity_id,
+        # Converted to one matrix at once, instead of validating every value
+        vol.Required(ATTR_PROFILES): vol.All(cv.ensure_list, [list]),
+        vol.Optional(ATTR_PRICES, default="history"): vol.In(PRICE_SOURCES),
+        vol.Optional(CONF_MAX_SHIFTABLE_POWER, default=0): vol.All(
+            vol.Coerce(float), vol.Range(min=0)
+        ),
+    }
+)
+
+
+def _profiles(profiles: list[list]) -> np.ndarray:
+    """Returns the energy profiles as the rows of a matrix"""
+    try:
+        matrix = np.array(profiles, dtype=float)
+    except (TypeError, ValueError) as error:
+        raise HomeAssistantError(
+            "The profiles must be lists of numbers of the same length"
+        ) from error
+    if matrix.ndim != 2 or matrix.shape[1] == 0:
+        raise HomeAssistantError(
+            "The profiles must be lists of numbers of the same length"
+        )
+    return matrix
+
+
+def _energyscore_sensor(hass: HomeAssistant, entity_id: str):
+    """Returns the EnergyScore sensor of an entity id"""
+    # Imported when called, the sensor platform is loaded by then
+    from .sensor import EnergyScore
+
+    component = hass.data.get(SENSOR_DOMAIN)
+    sensor = component.get_entity(entity_id) if component else None
+    if not isinstance(sensor, EnergyScore):
+        raise HomeAssistantError(f"{entity_id} is not an EnergyScore sensor")
+    return sensor
+
+
+def _interval_start(interval: int, minutes: int) -> str:
+    return interval_start(interval, minutes, dt.DEFAULT_TIME_ZONE).isoformat()
+
+
+@callback
+def _async_register(
+    hass: HomeAssistant,
+    service: str,
+    event_type: str,
+    handler: Callable[[ServiceCall], Awaitable[dict[str, Any]]],
+    schema: vol.Schema,
+) -> None:
+    """Registers a service returning its results as a response, or firing
+    them as an event when no response is asked for"""
+
+    async def _async_handle(call: ServiceCall) -> dict[str, Any]:
+        response = await handler(call)
+        if not getattr(call, "return_response", False):
+            hass.bus.async_fire(
+                event_type, {ATTR_ENTITY_ID: call.data[ATTR_ENTITY_ID], **response}
+            )
+        return response
+
+    if SupportsResponse is None:
+        hass.services.async_register(DOMAIN, service, _async_handle, schema)
+    else:
+        hass.services.async_register(
+            DOMAIN,
+            service,
+            _async_handle,
+            schema,
+            supports_response=SupportsResponse.OPTIONAL,
+        )
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Registers the services of EnergyScore"""
+
+    async def _async_simulate(call: ServiceCall) -> dict[str, Any]:
+        """Scores candidate energy profiles of an EnergyScore sensor, all at
+        once, against its price history or the published prices"""
+        entity_id = call.data[ATTR_ENTITY_ID]
+        sensor = _energyscore_sensor(hass, entity_id)
+
+        profiles = _profiles(call.data[ATTR_PROFILES])
+        first, prices = sensor.simulation_prices(
+            call.data[ATTR_PRICES], profiles.shape[1]
+        )
+        priced = int(np.count_nonzero(~np.isnan(prices)))
+        if priced == 0:
+            raise HomeAssistantError(
+                f"No {call.data[ATTR_PRICES]} prices for {entity_id} to simulate"
+            )
+        minutes = sensor.coordinator.interval
+        max_shiftable_power = call.data[CONF_MAX_SHIFTABLE_POWER]
+        results = simulate_schedules(
+            profiles,
+            prices,
+            sensor.energy_treshold,
+            max_shiftable_power * minutes / 60 if max_shiftable_power else None,
+        )
+        response = {
+            ATTR_START: _interval_start(first, minutes),
+            QUALITY: round(priced / len(prices), 2),
+            ATTR_RESULTS: [
+                {
+                    SCORE: None if math.isnan(score) else int(score * 100),
+                    "cost": cost,
+                    "potential_savings": savings,
+                }
+                for score, cost, savings in zip(
+                    results.score.tolist(),
+                    results.cost.tolist(),
+                    results.potential_savings.tolist(),
+                )
+            ],
+        }
+        _LOGGER.debug(
+            "%s - Simulated %s profiles", sensor.name, len(response[ATTR_RESULTS])
+        )
+        return response
+
+    async def _async_cheapest_window(call: ServiceCall) -> dict[str, Any]:
+        """Finds the cheapest consecutive, and not necessarily consecutive,
+        intervals for hours of energy use in the upcoming published prices or
+        the price history of an EnergyScore sensor"""
+        sensor = _energyscore_sensor(hass, call.data[ATTR_ENTITY_ID])
+        minutes = sensor.coordinator.interval
+        length = math.ceil(call.data[ATTR_HOURS] * 60 / minutes)
+        first, windows = sensor.price_windows()
+        # The current interval is both upcoming and in the history
+        current = epoch_interval(dt.now(), minutes) - first
+        if call.data[ATTR_PRICES] == "upcoming":
+            start, stop = max(current, 0), len(windows)
+        else:
+            start, stop = 0, min(current + 1, len(windows))
+
+        response: dict[str, Any] = {ATTR_CONTIGUOUS: None, ATTR_NON_CONTIGUOUS: None}
+        if (contiguous := windows.contiguous(length, start, stop)) is not None:
+            index, average = contiguous
+            response[ATTR_CONTIGUOUS] = {
+                ATTR_START: _interval_start(first + index, minutes),
+                ATTR_END: _interval_start(first + index + length, minutes),
+                ATTR_AVERAGE_PRICE: round(average, 2),
+            }
+        if (cheapest := windows.cheapest(length, start, stop)) is not None:
+            indices, average = cheapest
+            response[ATTR_NON_CONTIGUOUS] = {
+                ATTR_STARTS: [
+                    _interval_start(first + index, minutes)
+                    for index in indices.tolist()
+                ],
+                ATTR_AVERAGE_PRICE: round(average, 2),
+            }
+        return response
+
+    _async_register(
+        hass, SERVICE_SIMULATE, EVENT_SIMULATED, _async_simulate, SIMULATE_SCHEMA
+    )
+    _async_register(
+        hass,
+        SERVICE_CHEAPEST_WINDOW,
+        EVENT_CHEAPEST_WINDOW,
+        _async_cheapest_window,
+        CHEAPEST_WINDOW_SCHEMA,
+    )
@@ -0,0 +1,139 @@
+"""Disk backed hourly history for EnergyScore"""
+from __future__ import annotations
+
+import logging
+import os
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import STORAGE_DIR
+from homeassistant.util import slugify
+
+from .const import DOMAIN
+from .history import _EMPTY, HourlyHistory
+from .lazy import LazyModule
+
+np = LazyModule("numpy")
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+# Version of the record layout, part of the file name. The files of older
+# layouts are removed when a history is loaded, not migrated with the entry
+STORE_VERSION = 1
+
+# Layout of the records, NumPy types are given by name to not import it early
+_FIELDS = [
+    ("energy_hour", "<i8"),
+    ("energy", "<f8"),
+    ("price_hour", "<i8"),
+    ("price", "<f8"),
+]
+
+
+def history_path(hass: HomeAssistant, unique_id: str, interval: int = 60) -> str:
+    """Returns the path of the history file of an EnergyScore, with intervals
+    of the given minutes"""
+    name = f"{DOMAIN}.{slugify(unique_id)}.history"
+    if interval != 60:
+        name += f".{interval}min"
+    return hass.config.path(STORAGE_DIR, f"{name}.v{STORE_VERSION}.npy")
+
+
+class HistoryStore:
+    """Hourly energy and price history kept in a memory mapped NumPy file
+
+    The file holds a ring of `capacity` records indexed by epoch hour, like
+    HourlyHistory, so an update only writes the records of its own hour. Pages
+    are only read from disk when used, and written back by the OS. The methods
+    do blocking I/O and are run in the executor.
+    """
+
+    def __init__(self, path: str, capacity: int) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.energy: HourlyHistory | None = None
+        self.price: HourlyHistory | None = None
+        self._records: np.memmap | None = None
+
+    def load(self) -> None:
+        """Opens the history file, creating or resizing it if needed, and
+        removes the files of older layouts"""
+        for old_path in _old_paths(self.path):
+            if os.path.exists(old_path):
+                _LOGGER.info("Removing %s of an older history layout", old_path)
+                remove_history(old_path)
+        records = None
+        if os.path.exists(self.path):
+            try:
+                records = np.load(self.path, mmap_mode="r+")
+            except (OSError, ValueError):
+                _LOGGER.warning("Could not read %s, starting a new history", self.path)
+            else:
+                if records.dtype != np.dtype(_FIELDS) or records.ndim != 1:
+                    _LOGGER.warning(
+                        "Unexpected layout of %s, starting a new history", self.path
+                    )
+                    records = None
+        if records is None or len(records) != self.capacity:
+            records = self._create(records)
+
+        self._records = records
+        self.energy = HourlyHistory(
+            self.capacity, records["energy_hour"], records["energy"]
+        )
+        self.price = HourlyHistory(
+            self.capacity, records["price_hour"], records["price"]
+        )
+
+    def flush(self) -> None:
+        """Writes the changed records to disk"""
+        if self._records is not None:
+            self._records.flush()
+
+    def close(self) -> None:
+        """Flushes and releases the history file"""
+        self.flush()
+        self._records = self.energy = self.price = None
+
+    def _create(self, old: np.memmap | None) -> np.memmap:
+        """Writes a new history file, keeping the hours of an old one"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        records = np.lib.format.open_memmap(
+            temp_path, mode="w+", dtype=_FIELDS, shape=(self.capacity,)
+        )
+        for hour_field, value_field in [
+            ("energy_hour", "energy"),
+            ("price_hour", "price"),
+        ]:
+            records[hour_field] = _EMPTY
+            records[value_field] = np.nan
+            if old is not None:
+                history = HourlyHistory(
+                    self.capacity, records[hour_field], records[value_field]
+                )
+                old_history = HourlyHistory(
+                    len(old), np.array(old[hour_field]), np.array(old[value_field])
+                )
+                for hour, value in old_history.items():
+                    history.set(hour, value)
+        records.flush()
+        del records
+        os.replace(temp_path, self.path)
+        return np.load(self.path, mmap_mode="r+")
+
+
+def _old_paths(path: str) -> list[str]:
+    """Returns the paths of the files of older layouts of a history file"""
+    suffix = f".v{STORE_VERSION}.npy"
+    if not path.endswith(suffix):
+        return []
+    base = path[: -len(suffix)]
+    return [f"{base}.v{version}.npy" for version in range(1, STORE_VERSION)]
+
+
+def remove_history(path: str) -> None:
+    """Removes a history file, blocking so run in the executor"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
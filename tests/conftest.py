@@ -1,10 +1,27 @@
 """pytest fixtures."""
+import os
+
 import pytest
+from pytest_homeassistant_custom_component import common
+
+
+@pytest.fixture(autouse=True)
+def isolated_config_dir(tmp_path, monkeypatch):
+    """Keep files written to the config dir, like history stores, per test."""
+    monkeypatch.setattr(
+        common,
+        "get_test_config_dir",
+        lambda *add_path: os.path.join(tmp_path, *add_path),
+    )
 
 
 @pytest.fixture(autouse=True)
-def auto_enable_custom_integrations(enable_custom_integrations):
+def auto_enable_custom_integrations(request, isolated_config_dir):
     """Enable custom integrations defined in the test dir."""
+    if "recorder_mock" in request.fixturenames:
+        # The recorder database has to be prepared before hass is set up
+        request.getfixturevalue("recorder_db_url")
+    request.getfixturevalue("enable_custom_integrations")
     yield
 
 
@@ -1,16 +1,9 @@
 """Constants for EnergyScore testing"""
 
 # Normalisation functions
-PRICE_DICT = [
-    {"a": 2, "b": 4, "c": 3.15, "d": 2.22},
-    {"a": 1.0, "b": 0.0, "c": 0.42500000000000004, "d": 0.8899999999999999},
-]
-SAME_PRICE_DICT = [{"a": 2.3, "b": 2.3, "c": 2.3}, {"a": 1, "b": 1, "c": 1}]
-ENERGY_DICT = [
-    {"a": 3, "b": 0, "c": 4, "d": 3},
-    {"a": 0.3, "b": 0.0, "c": 0.4, "d": 0.3},
-]
-EMPTY_DICT = [{}, {}]
+PRICES = [[2, 4, 3.15, 2.22], [1.0, 0.0, 0.425, 0.89]]
+SAME_PRICES = [[2.3, 2.3, 2.3], [1, 1, 1]]
+ENERGY = [[3, 0, 4, 3], [0.3, 0.0, 0.4, 0.3]]
 
 # Configs
 VALID_CONFIG = {
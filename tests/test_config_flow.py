@@ -62,14 +62,18 @@ async def test_flow_creates_config_entry(hass):
     state = hass.states.get("sensor.ui_energyscore")
     assert state
     assert state.state == "100"
-    assert len(state.attributes) == 10
+    assert len(state.attributes) == 9
     assert state.attributes.get("unit_of_measurement") == "%"
     assert state.attributes.get("state_class") == SensorStateClass.MEASUREMENT
     assert state.attributes.get("energy_entity") == "sensor.energy_ui"
     assert state.attributes.get("price_entity") == "sensor.price_ui"
     assert state.attributes.get("quality") == 0
-    assert state.attributes.get("total_energy") == {}
-    assert state.attributes.get("price") == {}
+    assert state.attributes.get("history") == {
+        "start": None,
+        "step": 1,
+        "total_energy": [],
+        "price": [],
+    }
     assert state.attributes.get("last_updated") is None
     assert state.attributes.get("icon") == "mdi:speedometer"
     assert state.attributes.get("friendly_name") == "UI EnergyScore"
@@ -136,3 +140,11 @@ async def test_options_flow_add_treshold(hass):
 
     energy_treshold = config_entry.options.get("energy_treshold")
     assert energy_treshold == 2.3
+    assert config_entry.options.get("event_driven") is False
+    assert config_entry.options.get("score_windows") == []
+    assert config_entry.options.get("backfill") is False
+    assert config_entry.options.get("price_attributes") is False
+    assert config_entry.options.get("interval") == 60
+    assert config_entry.options.get("coalesce_energy") is False
+    assert config_entry.options.get("max_shiftable_power") == 0
+    assert config_entry.version == 10
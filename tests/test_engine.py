@@ -0,0 +1,277 @@
+"""Engine tests for EnergyScore"""
+
+import datetime
+import subprocess
+import sys
+
+from homeassistant.util import dt
+import numpy as np
+import pytest
+
+from custom_components.energyscore.engine import (
+    DayPrices,
+    EnergyAggregator,
+    PriceWindows,
+    WindowScore,
+    accumulate,
+    calculate_hourly_energy_deltas,
+    day_quality,
+    interval_values,
+    minimum_cost,
+    normalise_energy,
+    normalise_price,
+    potential_savings,
+    simulate_schedules,
+    usage_above_treshold,
+    window_result,
+)
+from custom_components.energyscore.history import epoch_interval, interval_start
+
+from .const import ENERGY, PRICES, SAME_PRICES
+
+
+def test_normalisation() -> None:
+    """Test the normalisation functions"""
+    assert np.allclose(normalise_price(PRICES[0]), PRICES[1])
+    assert normalise_price([]).tolist() == []
+    assert normalise_price(SAME_PRICES[0]).tolist() == SAME_PRICES[1]
+    assert np.allclose(normalise_energy(ENERGY[0]), ENERGY[1])
+    assert normalise_energy([]).tolist() == []
+
+    # Unknown prices stay unknown, and rows of energy sum up to one each
+    normalised = normalise_price([2.0, np.nan, 4.0])
+    assert normalised[0] == 1.0 and np.isnan(normalised[1]) and normalised[2] == 0
+    assert np.isnan(normalise_price([np.nan])).all()
+    assert normalise_energy([[1, 3], [2, 2]]).tolist() == [[0.25, 0.75], [0.5, 0.5]]
+    assert np.isnan(normalise_energy([0, 0])).all()
+
+
+def test_interval_values() -> None:
+    """Test the values by interval as an array"""
+    values = interval_values({10: 1.0, 12: 3.0}, 9, 5)
+    assert np.isnan(values[[0, 2, 4]]).all()
+    assert values[[1, 3]].tolist() == [1.0, 3.0]
+    assert len(interval_values({}, 0, 0)) == 0
+
+
+def test_hourly_energy_deltas() -> None:
+    """Test the hourly energy usage calculated from total readings"""
+    nan = np.nan
+    readings = np.array(
+        [
+            [1.0, 2.5, 2.0, nan, 4.0, 5.0, 7.0],
+            [3.0, 3.0, 4.0, 5.0, 6.0, 6.5, 6.0],
+        ]
+    )
+    held = np.array(
+        [
+            [True, True, True, True, True, False, True],
+            [True, True, True, True, True, True, True],
+        ]
+    )
+    deltas = calculate_hourly_energy_deltas(readings, held)
+
+    # Declining, after None and after a missing hour
+    np.testing.assert_array_equal(deltas.usage[0], [nan, 1.5, 2.0, nan, 4.0, nan, nan])
+    np.testing.assert_array_equal(
+        deltas.reset[0], [False, False, True, False, True, False, False]
+    )
+    np.testing.assert_array_equal(
+        deltas.missing[0], [True, False, False, False, False, True, True]
+    )
+    np.testing.assert_array_equal(
+        deltas.valid[0], [False, True, True, False, True, False, False]
+    )
+    np.testing.assert_array_equal(deltas.usage[1], [nan, 0.0, 1.0, 1.0, 1.0, 0.5, 6.0])
+
+    # A single sensor gives the same result as when stacked
+    single = calculate_hourly_energy_deltas(readings[0], held[0])
+    np.testing.assert_array_equal(single.usage, deltas.usage[0])
+
+
+def test_usage_above_treshold() -> None:
+    """Test that only intervals with usage above the treshold are returned"""
+    readings = np.array([1.0, 2.5, 2.7, 4.0, np.nan])
+    held = np.array([True, True, True, True, False])
+    intervals, usage = usage_above_treshold(10, readings, held, 1.0)
+    np.testing.assert_array_equal(intervals, [11, 13])
+    np.testing.assert_allclose(usage, [1.5, 1.3])
+
+
+def test_window_result() -> None:
+    """Test the score and quality of a window"""
+    assert window_result(WindowScore(0.426, 12, 18), 24) == (42, 0.5)
+    assert window_result(WindowScore(None, 24, 24), 24) == (None, 1.0)
+    assert window_result(WindowScore(0.5, 0, 24), 24) == (None, 0)
+
+
+def test_cost_and_savings() -> None:
+    """Test the daily cost, potential savings and quality"""
+    assert accumulate(None, 1.234, False) == 1.23
+    assert accumulate(1.23, 1.0, False) == 2.23
+    assert accumulate(1.23, 1.0, True) == 1.0
+
+    costs = DayPrices.from_prices([(0, 1.0), (3600, 2.0), (7200, 4.5)]).costs(2.0)
+    assert costs == (5.0, 2.0, 9.0)
+    assert costs.minimum == 2.0
+    assert potential_savings(4.5, costs.minimum) == 2.5
+    assert potential_savings(1.5, costs.minimum) == 0
+
+    # 3 of the 4 quarters of the first hour of the day
+    assert day_quality(3, 59, 15) == 0.75
+    assert day_quality(12, 11 * 60 + 30, 60) == 1.0
+
+
+def test_minimum_cost() -> None:
+    """Test the lowest cost with at most some energy of every interval moved"""
+    energy, prices = [1.0, 0.0, 2.0], [3.0, 1.0, 2.0]
+    # All energy at the lowest price, the actual cost, and in between
+    assert minimum_cost(energy, prices) == 3.0
+    assert minimum_cost(energy, prices, 0) == 7.0
+    assert minimum_cost(energy, prices, 1) == 5.0
+    assert minimum_cost(energy, prices, 10) == 3.0
+    assert minimum_cost([], []) == 0.0
+
+
+def test_simulate_schedules() -> None:
+    """Test scoring many energy profiles as one matrix"""
+    prices = [1.0, 2.0, 3.0, np.nan]
+    profiles = [[1, 0, 0, 0], [0, 0, 1, 0], [0, 0, 0, 0], [1, 1, 1, 1], [0, 2, 3, 0]]
+    results = simulate_schedules(profiles, prices)
+    assert results.score[:2].tolist() == [1.0, 0.0]
+    assert np.isnan(results.score[2])
+    # Energy without a price counts like in the sensor
+    assert results.score[3] == 0.375
+    assert results.cost.tolist() == [1.0, 3.0, 0.0, 6.0, 13.0]
+    assert results.potential_savings.tolist() == [0.0, 2.0, 0.0, 3.0, 8.0]
+
+    # The same normalisation as the price and energy of the sensor
+    price, energy = normalise_price(prices[:3]), normalise_energy(profiles[4][:3])
+    assert np.isclose(results.score[4], price @ energy)
+
+    # Energy below the treshold is not scored, and only some can be moved
+    results = simulate_schedules(profiles, prices, treshold=1.5, max_shift=1)
+    assert np.isnan(results.score[3])
+    assert results.potential_savings.tolist() == [0.0, 2.0, 0.0, 2.0, 2.0]
+
+
+def test_price_windows() -> None:
+    """Test finding the cheapest windows from the prefix sums"""
+    windows = PriceWindows([3.0, 1.0, 2.0, np.nan, 0.5, 0.5, 4.0])
+    assert windows.contiguous(2) == (4, 0.5)
+    # Windows with an unknown price are skipped
+    assert windows.contiguous(3) == (4, 5 / 3)
+    assert windows.contiguous(2, start=0, stop=4) == (1, 1.5)
+    assert windows.contiguous(4) is None
+    assert windows.contiguous(3, start=1, stop=6) is None
+
+    indices, average = windows.cheapest(3)
+    assert indices.tolist() == [1, 4, 5]
+    assert average == 2 / 3
+    indices, average = windows.cheapest(2, start=2)
+    assert indices.tolist() == [4, 5]
+    assert windows.cheapest(7) is None
+
+    # Brute force over random prices
+    prices = np.random.default_rng(1).random(50)
+    windows = PriceWindows(prices)
+    sums = [prices[index : index + 5].sum() for index in range(46)]
+    index, average = windows.contiguous(5)
+    assert index == int(np.argmin(sums))
+    assert np.isclose(average, min(sums) / 5)
+    indices, _ = windows.cheapest(5)
+    assert indices.tolist() == sorted(np.argsort(prices)[:5].tolist())
+
+
+def test_day_prices() -> None:
+    """Test the running aggregates of the prices of a day"""
+    day_prices = DayPrices()
+    assert day_prices.count == 0
+    for key, price in [(0, 1.0), (3600, 4.5), (3600, 2.0), (7200, 1.5)]:
+        day_prices.set(key, price)
+    # The price of an interval can change until the next interval
+    assert day_prices.count == 3
+    assert day_prices.costs(2.0) == (3.0, 2.0, 4.0)
+
+    stored = DayPrices(**day_prices.as_dict())
+    assert stored.as_dict() == day_prices.as_dict()
+    rebuilt = DayPrices.from_prices([(7200, 1.5), (0, 1.0), (3600, 2.0)])
+    assert rebuilt.as_dict() == day_prices.as_dict()
+
+
+def test_energy_aggregator() -> None:
+    """Test coalescing energy readings into the usage of each interval"""
+    aggregator = EnergyAggregator(60)
+    # The first reading is only a starting point
+    assert aggregator.add(3600 * 10 + 600, 10.0 + 600 / 3600, 1.0) == []
+    for second in range(900, 3600, 10):
+        assert aggregator.add(3600 * 10 + second, 10.0 + second / 3600, 1.0) == []
+    assert aggregator.reading == (3600 * 10 + 3590, 10.0 + 3590 / 3600)
+
+    # The usage across the start of an interval is split between the intervals
+    (completed,) = aggregator.add(3600 * 11 + 10, 11.0 + 10 / 3600, 2.0)
+    assert completed.interval == 10
+    assert round(completed.energy, 6) == round(1.0 - 600 / 3600, 6)
+    assert completed.price == 1.0
+
+    # Intervals without readings get their share of the usage, but no price
+    completed = aggregator.add(3600 * 13 + 1810, 14.0, None)
+    assert [interval for interval, _, _ in completed] == [11, 12]
+    assert [round(energy, 2) for _, energy, _ in completed] == [1.2, 1.2]
+    assert [price for _, _, price in completed] == [2.0, None]
+
+    # A declining reading is a reset meter, and earlier readings are ignored
+    aggregator.add(3600 * 13 + 2000, 0.5)
+    assert aggregator.add(3600 * 13 + 1900, 0.7) == []
+    (completed,) = aggregator.add(3600 * 14, 0.5)
+    assert round(completed.energy, 2) == 1.1
+
+
+def test_energy_aggregator_local_intervals() -> None:
+    """Test that the energy is coalesced by the local intervals of the zone"""
+    kolkata = dt.get_time_zone("Asia/Kolkata")
+    aggregator = EnergyAggregator(60, kolkata)
+    hour = datetime.datetime(2022, 9, 18, 10, tzinfo=kolkata)
+    for minute, total in [(20, 1.0), (40, 2.0)]:
+        time = hour + datetime.timedelta(minutes=minute)
+        assert aggregator.add(time.timestamp(), total, 1.0) == []
+
+    # The usage up to 11:00 local is of the interval of 10:00 local
+    time = hour + datetime.timedelta(minutes=80)
+    (completed,) = aggregator.add(time.timestamp(), 4.0, 2.0)
+    assert completed.interval == epoch_interval(hour, 60)
+    assert interval_start(completed.interval, 60, kolkata) == hour
+    assert completed.energy == pytest.approx(2.0)
+
+
+def test_engine_without_home_assistant() -> None:
+    """Test that the engine is imported without Home Assistant"""
+    code = (
+        "import sys; sys.modules['homeassistant'] = None; "
+        "import custom_components.energyscore.engine"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_numpy_imported_on_first_use() -> None:
+    """Test that NumPy is not imported with the platform, only when used"""
+    code = (
+        "import sys; import custom_components.energyscore.sensor; "
+        "assert 'numpy' not in sys.modules; "
+        "from custom_components.energyscore.engine import minimum_cost; "
+        "assert minimum_cost([1.0, 3.0], [2.0, 1.0]) == 4.0; "
+        "assert 'numpy' in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_recorder_imported_for_backfill() -> None:
+    """Test that the recorder is not imported with the platform, only to
+    backfill"""
+    code = (
+        "import sys; import custom_components.energyscore.sensor; "
+        "assert 'homeassistant.components.recorder' not in sys.modules; "
+        "import custom_components.energyscore.backfill; "
+        "assert 'homeassistant.components.recorder' in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
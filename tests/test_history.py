@@ -0,0 +1,104 @@
+"""Hourly history tests for EnergyScore"""
+
+import datetime
+
+from homeassistant.util import dt
+
+from custom_components.energyscore.history import (
+    HourlyHistory,
+    epoch_hour,
+    epoch_interval,
+    interval_start,
+)
+
+
+def test_epoch_hour() -> None:
+    """Test that epoch hours follow the local hours, also in odd time zones"""
+    for time_zone in ["US/Pacific", "Asia/Kolkata", "Asia/Kathmandu"]:
+        tzinfo = dt.get_time_zone(time_zone)
+        time = datetime.datetime(2022, 9, 18, 13, 42, 10, tzinfo=tzinfo)
+        start = time.replace(minute=0, second=0)
+        assert epoch_hour(start) == epoch_hour(time)
+        assert epoch_hour(start - datetime.timedelta(seconds=1)) == epoch_hour(time) - 1
+        assert epoch_hour(start + datetime.timedelta(hours=1)) == epoch_hour(time) + 1
+
+
+def test_epoch_interval() -> None:
+    """Test that intervals follow the local hours, also in odd time zones"""
+    for time_zone in ["US/Pacific", "Asia/Kolkata", "Asia/Kathmandu"]:
+        tzinfo = dt.get_time_zone(time_zone)
+        time = datetime.datetime(2022, 9, 18, 13, 42, 10, tzinfo=tzinfo)
+        assert epoch_interval(time, 60) == epoch_hour(time)
+        hour = time.replace(minute=0, second=0)
+        assert epoch_interval(time, 15) == epoch_interval(hour, 15) + 2
+        assert epoch_interval(time, 30) == epoch_interval(hour, 30) + 1
+
+
+def test_interval_start() -> None:
+    """Test that intervals start at the start of the local intervals, also in
+    zones with half hour offsets"""
+    kolkata = dt.get_time_zone("Asia/Kolkata")
+    time = datetime.datetime(2022, 9, 18, 10, 20, tzinfo=kolkata)
+    assert interval_start(epoch_hour(time), 60, kolkata) == time.replace(minute=0)
+
+    for time_zone in ["Asia/Kolkata", "Asia/Kathmandu", "America/St_Johns"]:
+        tzinfo = dt.get_time_zone(time_zone)
+        time = datetime.datetime(2022, 9, 18, 13, 42, 10, tzinfo=tzinfo)
+        for minutes in (15, 30, 60):
+            start = interval_start(epoch_interval(time, minutes), minutes, tzinfo)
+            assert start == time.replace(
+                minute=time.minute // minutes * minutes, second=0
+            )
+            assert epoch_interval(start, minutes) == epoch_interval(time, minutes)
+
+    # The repeated hour at the end of daylight saving time is an hour of its own
+    pacific = dt.get_time_zone("US/Pacific")
+    first = datetime.datetime(2022, 11, 6, 1, 30, tzinfo=pacific)
+    second = first.replace(fold=1)
+    assert epoch_hour(second) == epoch_hour(first) + 1
+    assert interval_start(epoch_hour(second), 60, pacific) == second.replace(minute=0)
+
+
+def test_history_capacity() -> None:
+    """Test that the history only keeps the newest hours within capacity"""
+    history = HourlyHistory(3)
+    assert len(history) == 0
+    assert list(history.items()) == []
+    assert history.values(100, 2) == [None, None]
+
+    for hour in range(100, 104):
+        history.set(hour, hour / 10)
+    assert len(history) == 3
+    assert 100 not in history
+    assert history.get(100) is None
+    assert list(history.items()) == [(101, 10.1), (102, 10.2), (103, 10.3)]
+
+    # Too old hours are ignored, and skipped hours drop out of the window
+    history.set(99, 9.9)
+    assert 99 not in history
+    history.set(105, None)
+    assert list(history.items()) == [(103, 10.3), (105, None)]
+    assert 105 in history
+    assert history.get(105, 0) is None
+
+    # Only changed values count as a new version
+    version = history.version
+    history.set(105, None)
+    history.set(103, 10.3)
+    assert history.version == version
+    history.set(103, 10.4)
+    history.set(106, None)
+    assert history.version == version + 2
+
+
+def test_history_window_arrays() -> None:
+    """Test the contiguous window arrays with the held hours mask"""
+    history = HourlyHistory(4)
+    history.set(10, 1.0)
+    history.set(12, None)
+    history.set(13, 3.0)
+    hours, values, held = history.window()
+    assert hours.tolist() == [10, 11, 12, 13]
+    assert held.tolist() == [True, False, True, True]
+    assert values[0] == 1.0 and values[3] == 3.0
+    assert all(value != value for value in values[1:3])
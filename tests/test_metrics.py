@@ -0,0 +1,40 @@
+"""Update metrics tests for EnergyScore"""
+
+import pytest
+
+from custom_components.energyscore.metrics import UpdateMetrics
+
+
+def test_update_metrics() -> None:
+    """Test that fetches and processing are recorded as one update"""
+    metrics = UpdateMetrics(samples=20)
+    assert metrics.last_duration is None
+    assert metrics.p95_duration is None
+
+    for _ in range(25):
+        with metrics.time_fetch():
+            pass
+        with metrics.time_update():
+            pass
+    # Only the recent updates are kept
+    assert len(metrics.durations) == 20
+    assert metrics.last_duration >= 0
+    assert metrics.p95_duration >= 0
+
+    with metrics.time_fetch():
+        pass
+    metrics.skip()
+    with pytest.raises(ValueError):
+        with metrics.time_update():
+            raise ValueError
+    assert metrics.skipped == 1
+    assert metrics.failed == 1
+    assert len(metrics.durations) == 20
+
+
+def test_p95_duration() -> None:
+    """Test the percentile of the update durations"""
+    metrics = UpdateMetrics()
+    metrics.durations.extend(range(1, 101))
+    assert metrics.p95_duration == 95
+    assert metrics.last_duration == 100
@@ -0,0 +1,121 @@
+"""Recorder replay tests for EnergyScore"""
+
+import csv
+import datetime
+import json
+import sqlite3
+
+from homeassistant.util import dt
+import pytest
+
+from tools.replay import main
+
+START = datetime.datetime(2022, 9, 18, 20, 5, tzinfo=datetime.timezone.utc)
+
+# Energy and price at the start of every hour
+HOURS = [(10.0, 1.0), (11.0, 2.0), (13.0, 1.0), (14.0, 3.0), (14.5, 1.0)]
+
+
+@pytest.fixture(name="database")
+def database_fixture(tmp_path):
+    """A recorder database with states by entity id and timestamp"""
+    path = tmp_path / "home-assistant_v2.db"
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        """
+        CREATE TABLE state_attributes (
+            attributes_id INTEGER PRIMARY KEY, shared_attrs TEXT
+        );
+        CREATE TABLE states (
+            state_id INTEGER PRIMARY KEY,
+            entity_id TEXT,
+            state TEXT,
+            attributes TEXT,
+            last_updated_ts FLOAT,
+            attributes_id INTEGER
+        );
+        """
+    )
+    connection.execute(
+        "INSERT INTO state_attributes VALUES (1, ?)",
+        (json.dumps({"state_class": "total_increasing"}),),
+    )
+    for hour, (energy, price) in enumerate(HOURS):
+        time = (START + datetime.timedelta(hours=hour)).timestamp()
+        connection.execute(
+            "INSERT INTO states (entity_id, state, last_updated_ts, attributes_id) "
+            "VALUES ('sensor.energy', ?, ?, 1), ('sensor.price', ?, ?, NULL)",
+            (str(energy), time, str(price), time),
+        )
+    connection.execute(
+        "INSERT INTO states (entity_id, state, last_updated_ts) "
+        "VALUES ('sensor.energy', 'unavailable', ?)",
+        ((START + datetime.timedelta(hours=2, minutes=30)).timestamp(),),
+    )
+    connection.commit()
+    connection.close()
+    yield str(path)
+    dt.set_default_time_zone(datetime.timezone.utc)
+
+
+def _replay(database, tmp_path, *args) -> list[dict]:
+    output = tmp_path / "replay.csv"
+    assert (
+        main(
+            [
+                database,
+                "--energy-entity",
+                "sensor.energy",
+                "--price-entity",
+                "sensor.price",
+                "--output",
+                str(output),
+                *args,
+            ]
+        )
+        == 0
+    )
+    with open(output, newline="") as file:
+        return list(csv.DictReader(file))
+
+
+def test_replay(database, tmp_path) -> None:
+    """Test that the recorded states are scored hour by hour"""
+    rows = _replay(database, tmp_path, "--time-zone", "Europe/Oslo")
+    assert [row["hour"] for row in rows] == [
+        f"2022-09-18T{hour}:00:00+02:00" for hour in [22, 23]
+    ] + [f"2022-09-19T0{hour}:00:00+02:00" for hour in range(3)]
+    assert [row["quality"] for row in rows] == ["0.0", "0.04", "0.08", "0.12", "0.17"]
+    assert [row["score"] for row in rows] == ["100", "0", "66", "62", "66"]
+    # The cost starts again at midnight
+    assert [row["cost"] for row in rows] == ["0.0", "2.0", "2.0", "5.0", "5.5"]
+    assert [row["potential_savings"] for row in rows][-1] == "2.0"
+
+
+def test_replay_options(database, tmp_path) -> None:
+    """Test replaying with other options and a part of the states"""
+    rows = _replay(
+        database,
+        tmp_path,
+        "--rolling-hours",
+        "2",
+        "--energy-treshold",
+        "1.5",
+        "--event-driven",
+        "--start",
+        "2022-09-18T21:00:00+00:00",
+    )
+    # Usage of less than 1.5 is below the treshold
+    assert [row["quality"] for row in rows] == ["0.0", "0.5", "0.5", "0.0"]
+    # The cost is updated by the state changes, and the first has no usage
+    assert [row["cost"] for row in rows] == ["", "2.0", "5.0", "0.5"]
+
+
+def test_replay_invalid_rolling_hours(database, tmp_path, capsys) -> None:
+    """Test that rolling hours out of range are refused with a short message"""
+    with pytest.raises(SystemExit):
+        _replay(database, tmp_path, "--rolling-hours", "1")
+    error = capsys.readouterr().err
+    assert error.endswith("argument --rolling-hours: 1 is not from 2 to 8760\n")
+    # The hours allowed are not listed one by one
+    assert len(error) < 1000
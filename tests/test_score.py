@@ -0,0 +1,131 @@
+"""Incremental score tests for EnergyScore"""
+
+import math
+
+import numpy as np
+import pytest
+
+from custom_components.energyscore.engine import normalise_energy, normalise_price
+from custom_components.energyscore.score import StackedScores, WindowScore
+
+
+def window(scores: StackedScores, hours: int) -> WindowScore:
+    """The score of a window of the first meter"""
+    return scores.windows([0], [hours])[0]
+
+
+def reference_score(prices: dict, energy: dict) -> float:
+    """The score calculated from scratch with the normalisation functions"""
+    hours = sorted(prices.keys() | energy.keys())
+    norm_prices = normalise_price([prices.get(hour, math.nan) for hour in hours])
+    norm_energy = normalise_energy([energy.get(hour, 0.0) for hour in hours])
+    # Hours without a price do not add to the score
+    return float(np.nansum(norm_prices * norm_energy))
+
+
+@pytest.mark.parametrize("windows", [[1], [3], [24], [24, 3, 168]])
+def test_stacked_scores_match_reference(windows: list) -> None:
+    """Test the incremental scores against the full recalculation"""
+    rng = np.random.default_rng(sum(windows))
+    scores = StackedScores(1, max(windows))
+    prices = {}
+    energy = {}
+    hour = 1000
+    for _ in range(1000):
+        # Mostly updates of the current hour, sometimes skipping hours
+        hour += int(rng.choice([0, 0, 1, 1, 2, 5]))
+        price = float(rng.uniform(-0.5, 3)) if rng.random() > 0.1 else math.nan
+        usage = float(rng.uniform(0, 2)) if rng.random() > 0.2 else math.nan
+        scores.update(hour, price, {0: usage})
+
+        for values, value in [(prices, price), (energy, usage)]:
+            values.pop(hour, None)
+            if not math.isnan(value):
+                values[hour] = value
+
+        for hours in windows:
+            window_prices = {k: v for k, v in prices.items() if k > hour - hours}
+            window_energy = {k: v for k, v in energy.items() if k > hour - hours}
+            result = window(scores, hours)
+            assert result.price_count == len(window_prices)
+            assert result.energy_count == len(window_energy)
+            if not window_energy:
+                assert result.score is None
+            else:
+                assert result.score == pytest.approx(
+                    reference_score(window_prices, window_energy), abs=1e-9
+                )
+
+
+def test_stacked_scores_same_prices() -> None:
+    """Test that equal prices give the share of energy used while priced"""
+    scores = StackedScores(1, 4)
+    assert window(scores, 4).score is None
+    scores.update(1, 1.0, {0: 1.0})
+    scores.update(2, math.nan, {0: 3.0})
+    scores.update(3, 1.0, {0: math.nan})
+    assert window(scores, 4).score == pytest.approx(0.25)
+
+    # Updates of earlier hours are ignored
+    scores.update(2, 1.0, {0: 3.0})
+    assert window(scores, 4).score == pytest.approx(0.25)
+
+
+def test_stacked_scores_meters_separate() -> None:
+    """Test that meters sharing a price score as if they were separate"""
+    rng = np.random.default_rng(3)
+    windows = [2, 5, 24]
+    stacked = StackedScores(len(windows), max(windows))
+    separate = [StackedScores(1, hours) for hours in windows]
+    hour = 0
+    usage = {}
+    for _ in range(300):
+        step = int(rng.choice([0, 1, 1, 3]))
+        if step:
+            usage = {}
+        hour += step
+        price = float(rng.uniform(0, 2)) if rng.random() > 0.1 else math.nan
+        # Only some of the meters are updated at a time
+        energy = {
+            meter: float(rng.uniform(0, 1)) if rng.random() > 0.2 else math.nan
+            for meter in range(len(windows))
+            if rng.random() > 0.3
+        }
+        stacked.update(hour, price, energy)
+        usage.update(energy)
+        for meter, scores in enumerate(separate):
+            scores.update(hour, price, {0: usage.get(meter, math.nan)})
+
+        results = stacked.windows(range(len(windows)), windows)
+        for result, scores, hours in zip(results, separate, windows):
+            expected = window(scores, hours)
+            assert result.price_count == expected.price_count
+            assert result.energy_count == expected.energy_count
+            assert result.score == pytest.approx(expected.score, abs=1e-9)
+
+
+def test_stacked_scores_load() -> None:
+    """Test that loading hours at once scores like updating them one by one"""
+    rng = np.random.default_rng(5)
+    hours, meters, windows = 60, 3, [2, 7, 24, 48]
+    prices = rng.uniform(0, 3, hours).round(1)
+    prices[rng.random(hours) < 0.2] = math.nan
+    energy = rng.uniform(0, 2, (hours, meters))
+    energy[rng.random((hours, meters)) < 0.2] = math.nan
+
+    updated, loaded = StackedScores(meters, 48), StackedScores(meters, 48)
+    for hour in range(hours):
+        updated.update(100 + hour, prices[hour], dict(enumerate(energy[hour])))
+    loaded.load(100, prices, energy)
+
+    pairs = [(meter, length) for meter in range(meters) for length in windows]
+    for _ in range(30):
+        expected = updated.windows(*zip(*pairs))
+        for result, reference in zip(loaded.windows(*zip(*pairs)), expected):
+            assert result.price_count == reference.price_count
+            assert result.energy_count == reference.energy_count
+            assert result.score == pytest.approx(reference.score, abs=1e-9)
+        # Both go on the same with later hours
+        hour, price = updated.current + 1, float(rng.uniform(0, 3))
+        for scores in (updated, loaded):
+            scores.update(hour, price, {0: 1.0})
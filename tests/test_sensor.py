@@ -5,14 +5,15 @@ Neat testing in groups: https://github.com/home-assistant/core/blob/dev/tests/co
 
 import copy
 import datetime
-import pytest
+from unittest.mock import patch
 
 from freezegun import freeze_time
 from homeassistant.components import sensor
-from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN
+from homeassistant.components.recorder.statistics import async_import_statistics
+from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN, EntityCategory
 from homeassistant.core import HomeAssistant, State
-import homeassistant.helpers.entity_registry as er
 from homeassistant.helpers.entity import get_unit_of_measurement
+import homeassistant.helpers.entity_registry as er
 from homeassistant.helpers.restore_state import (
     DATA_RESTORE_STATE_TASK,
     RestoreStateData,
@@ -20,27 +21,26 @@ from homeassistant.helpers.restore_state import (
 )
 from homeassistant.setup import async_setup_component
 from homeassistant.util import dt
-from pytest_homeassistant_custom_component.common import (
-    async_fire_time_changed,
+import pytest
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+from pytest_homeassistant_custom_component.components.recorder.common import (
+    async_wait_recording_done,
 )
 
 from custom_components.energyscore import config_flow
-from custom_components.energyscore.const import ENERGY, PRICES, QUALITY
-from custom_components.energyscore.sensor import (
+from custom_components.energyscore.const import (
+    ENERGY,
+    HISTORY,
+    PRICES,
+    QUALITY,
+    REFRESH_COOLDOWN,
     SCAN_INTERVAL,
-    normalise_energy,
-    normalise_price,
+    SCORES,
 )
+from custom_components.energyscore.history import epoch_hour, epoch_interval
+from custom_components.energyscore.hub import DATA_PRICE_HUBS
 
-from .const import (
-    EMPTY_DICT,
-    ENERGY_DICT,
-    PRICE_DICT,
-    SAME_PRICE_DICT,
-    VALID_CONFIG,
-    VALID_CONFIG_2,
-    TEST_PARAMS,
-)
+from .const import TEST_PARAMS, VALID_CONFIG, VALID_CONFIG_2
 
 
 async def test_new_config(hass: HomeAssistant, caplog) -> None:
@@ -54,14 +54,18 @@ async def test_new_config(hass: HomeAssistant, caplog) -> None:
     state = hass.states.get("sensor.my_mock_es_energyscore")
     assert state
     assert state.state == "100"
-    assert len(state.attributes) == 10
+    assert len(state.attributes) == 9
     assert state.attributes.get("unit_of_measurement") == "%"
     assert state.attributes.get("state_class") == sensor.SensorStateClass.MEASUREMENT
     assert state.attributes.get("energy_entity") == "sensor.energy"
     assert state.attributes.get("price_entity") == "sensor.electricity_price"
     assert state.attributes.get("quality") == 0
-    assert state.attributes.get("total_energy") == {}
-    assert state.attributes.get("price") == {}
+    assert state.attributes.get("history") == {
+        "start": None,
+        "step": 1,
+        "total_energy": [],
+        "price": [],
+    }
     assert state.attributes.get("last_updated") is None
     assert state.attributes.get("icon") == "mdi:speedometer"
     assert state.attributes.get("friendly_name") == "My Mock ES EnergyScore"
@@ -138,18 +142,6 @@ async def test_unique_id(hass: HomeAssistant, caplog) -> None:
     assert "required key not provided @ data['unique_id']" in caplog.text
 
 
-def test_normalisation() -> None:
-    """Test the normalisation function"""
-    assert normalise_price(PRICE_DICT[0]) == PRICE_DICT[1]
-    assert normalise_price(EMPTY_DICT[0]) == EMPTY_DICT[1]
-    assert normalise_price(SAME_PRICE_DICT[0]) == SAME_PRICE_DICT[1]
-    assert normalise_energy(ENERGY_DICT[0]) == ENERGY_DICT[1]
-    assert normalise_energy(EMPTY_DICT[0]) == EMPTY_DICT[1]
-
-
-# TODO: Test energy_calc functions
-
-
 async def test_update_energyscore_sensor(hass: HomeAssistant, caplog) -> None:
     """Test the update of energyscore by moving time"""
 
@@ -180,23 +172,25 @@ async def test_update_energyscore_sensor(hass: HomeAssistant, caplog) -> None:
             frozen_datetime.tick(delta=datetime.timedelta(hours=1))
 
         # Check that old data is purged:
-        assert "2022-09-18T13:00:00-0700" in state.attributes.get("total_energy")
-        assert "2022-09-18T13:00:00-0700" in state.attributes.get("price")
+        first_hour = epoch_hour(dt.parse_datetime("2022-09-18T13:00:00-0700"))
+        assert state.attributes[HISTORY]["start"] == first_hour
+        assert state.attributes[HISTORY][ENERGY] == [0.2, 1.0, 2.0]
         frozen_datetime.tick(delta=datetime.timedelta(hours=21))
         hass.states.async_set("sensor.energy", 178.3)
         hass.states.async_set("sensor.electricity_price", 1.32)
         async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
         await hass.async_block_till_done()
         state = hass.states.get("sensor.my_mock_es_energyscore")
-        assert "2022-09-18T13:00:00-0700" not in state.attributes.get("price")
-        # 1 extra hour of energy data is kept to be able to calculate energy usage
+        # 1 extra hour of data is kept to be able to calculate energy usage
+        assert state.attributes[HISTORY]["start"] == first_hour
+        assert len(state.attributes[HISTORY][PRICES]) == 25
         frozen_datetime.tick(delta=datetime.timedelta(hours=1))
         hass.states.async_set("sensor.energy", 190)
         hass.states.async_set("sensor.electricity_price", 1)
         async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
         await hass.async_block_till_done()
         state = hass.states.get("sensor.my_mock_es_energyscore")
-        assert "2022-09-18T13:00:00-0700" not in state.attributes.get("total_energy")
+        assert state.attributes[HISTORY]["start"] == first_hour + 1
 
 
 async def test_update_cost_sensor(hass: HomeAssistant) -> None:
@@ -240,9 +234,9 @@ async def test_update_savings_sensor(hass: HomeAssistant) -> None:
 
     initial_datetime = dt.parse_datetime("2022-09-18 19:08:44-07:00")
 
-    # Since they are async, can't know which sensor updates first, so hardcoding cost
+    # The cost is pushed to the savings sensor when updated
     # Last reading after midnight to check reseting
-    COST = [0, 0.08, 0.23, 0.23, 0.45, 0.18, 5.44, 7.08, 7.99]
+    COST = ["unknown", 0.08, 0.23, 0.23, 0.45, 0.18, 5.44, 7.07, 7.99]
 
     # The savings should reset at midnight (hour 5)
     RESULT = [
@@ -253,7 +247,7 @@ async def test_update_savings_sensor(hass: HomeAssistant) -> None:
         {"avg": 0.66, "max": 1.12, "min": 0.28, "potential": 0.17},
         {"avg": 0.18, "max": 0.18, "min": 0.18, "potential": 0.0},
         {"avg": 5.77, "max": 6.12, "min": 5.42, "potential": 0.02},
-        {"avg": 10.94, "max": 20.26, "min": 5.9, "potential": 1.18},
+        {"avg": 10.94, "max": 20.26, "min": 5.9, "potential": 1.17},
         {"avg": 15.37, "max": 27.53, "min": 6.1, "potential": 1.89},
     ]
 
@@ -266,9 +260,10 @@ async def test_update_savings_sensor(hass: HomeAssistant) -> None:
             hass.states.async_set(
                 "sensor.electricity_price", TEST_PARAMS[hour]["price"]
             )
-            hass.states.async_set("sensor.my_mock_es_cost", COST[hour])
             async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
             await hass.async_block_till_done()
+            state = hass.states.get("sensor.my_mock_es_cost")
+            assert state.state == str(COST[hour])
             state = hass.states.get("sensor.my_mock_es_potential_savings")
             assert state.state == str(RESULT[hour]["potential"])
             assert state.attributes.get("average_cost") == RESULT[hour]["avg"]
@@ -282,9 +277,10 @@ async def test_update_savings_sensor(hass: HomeAssistant) -> None:
             hass.states.async_set(
                 "sensor.electricity_price", TEST_PARAMS[hour + 23]["price"]
             )
-            hass.states.async_set("sensor.my_mock_es_cost", COST[hour])
             async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
             await hass.async_block_till_done()
+            state = hass.states.get("sensor.my_mock_es_cost")
+            assert state.state == str(COST[hour])
             state = hass.states.get("sensor.my_mock_es_potential_savings")
             assert state.state == str(RESULT[hour]["potential"])
             assert state.attributes.get("average_cost") == RESULT[hour]["avg"]
@@ -293,19 +289,20 @@ async def test_update_savings_sensor(hass: HomeAssistant) -> None:
             frozen_datetime.tick(delta=datetime.timedelta(hours=1))
 
 
-async def test_update_savings_sensor_cost_midnight(hass: HomeAssistant, caplog) -> None:
-    """Test the update of potential savings where cost is not updated first"""
+async def test_update_savings_sensor_cost_midnight(hass: HomeAssistant) -> None:
+    """Test that potential savings use the cost from the same update over midnight"""
 
     initial_datetime = dt.parse_datetime("2022-09-18 23:18:44-07:00")
 
     # The savings should reset after midnight
+    COST = ["unknown", 0.32, 0.72, 0.72, 0.82, 0.04]
     RESULT = [
         "unknown",  # 23:18 - No energy usage
-        "unknown",  # 23:28 - First cost calc, but not picked up by potential yet
-        "unknown",  # 23:38 - Cost picked up first time for potential - but no energy calc yet
-        0.72,  # 23:48 - First time the potential can be calculated
-        0.62,  # 23:58
-        0,  # 00:08 - Cost from previous day is used in potential - Should be emitted
+        0.0,  # 23:28 - First cost calc is used in the potential at once
+        0.0,  # 23:38
+        0.0,  # 23:48
+        0.54,  # 23:58 - Cheaper price
+        0.0,  # 00:08 - Cost is reset together with the potential
     ]
 
     with freeze_time(initial_datetime) as frozen_datetime:
@@ -324,10 +321,10 @@ async def test_update_savings_sensor_cost_midnight(hass: HomeAssistant, caplog)
             async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
             await hass.async_block_till_done()
 
+            assert hass.states.get("sensor.my_mock_es_cost").state == str(COST[update])
             state = hass.states.get("sensor.my_mock_es_potential_savings")
             assert state.state == str(RESULT[update])
             frozen_datetime.tick(delta=datetime.timedelta(minutes=10))
-        assert "My Mock ES Potential Savings - Updated cost to 0" in caplog.text
 
 
 async def test_unavailable_sources(hass: HomeAssistant, caplog) -> None:
@@ -338,28 +335,21 @@ async def test_unavailable_sources(hass: HomeAssistant, caplog) -> None:
     for state in [STATE_UNAVAILABLE, STATE_UNKNOWN]:
         hass.states.async_set("sensor.energy", 24321.4)
         hass.states.async_set("sensor.electricity_price", state)
-        hass.states.async_set("sensor.my_mock_es_cost", 23.2)
         async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
         await hass.async_block_till_done()
-        assert f"My Mock ES EnergyScore - Price data is {state}" in caplog.text
-        assert f"My Mock ES Cost - Price data is {state}" in caplog.text
-        assert f"Potential data cannot be updated, state is {state}" in caplog.text
+        # The sources are only checked once for all sensors
+        assert caplog.text.count(f"My Mock ES - Price data is {state}") == 1
 
         hass.states.async_set("sensor.energy", state)
         hass.states.async_set("sensor.electricity_price", 0.42)
-        hass.states.async_set("sensor.my_mock_es_cost", 23.2)
         async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
         await hass.async_block_till_done()
-        assert f"My Mock ES EnergyScore - Energy data is {state}" in caplog.text
-        assert f"My Mock ES Cost - Energy data is {state}" in caplog.text
-        assert f"Potential data cannot be updated, state is {state}" in caplog.text
+        assert caplog.text.count(f"My Mock ES - Energy data is {state}") == 1
 
-        hass.states.async_set("sensor.energy", 24321.4)
-        hass.states.async_set("sensor.electricity_price", 0.42)
-        hass.states.async_set("sensor.my_mock_es_cost", state)
-        async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
-        await hass.async_block_till_done()
-        assert f"Potential data cannot be updated, state is {state}" in caplog.text
+    # The sensors are not updated without valid source data
+    assert hass.states.get("sensor.my_mock_es_energyscore").attributes[QUALITY] == 0
+    assert hass.states.get("sensor.my_mock_es_cost").state == STATE_UNKNOWN
+    assert hass.states.get("sensor.my_mock_es_potential_savings").state == STATE_UNKNOWN
 
 
 async def test_all_sources_unavailable(hass: HomeAssistant, caplog) -> None:
@@ -370,14 +360,10 @@ async def test_all_sources_unavailable(hass: HomeAssistant, caplog) -> None:
     for state in [STATE_UNAVAILABLE, STATE_UNKNOWN]:
         hass.states.async_set("sensor.energy", state)
         hass.states.async_set("sensor.electricity_price", state)
-        hass.states.async_set("sensor.my_mock_es_cost", state)
         async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
         await hass.async_block_till_done()
-        assert f"My Mock ES EnergyScore - Energy data is {state}" in caplog.text
-        assert f"My Mock ES EnergyScore - Price data is {state}" in caplog.text
-        assert f"My Mock ES Cost - Energy data is {state}" in caplog.text
-        assert f"My Mock ES Cost - Price data is {state}" in caplog.text
-        assert f"Potential data cannot be updated, state is {state}" in caplog.text
+        assert f"My Mock ES - Energy data is {state}" in caplog.text
+        assert f"My Mock ES - Price data is {state}" in caplog.text
 
 
 async def test_no_sources(hass: HomeAssistant, caplog) -> None:
@@ -386,10 +372,7 @@ async def test_no_sources(hass: HomeAssistant, caplog) -> None:
     await hass.async_block_till_done()
     async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
     await hass.async_block_till_done()
-    assert (
-        f"My Mock ES EnergyScore - Could not fetch price and energy data" in caplog.text
-    )
-    assert f"My Mock ES Cost - Could not fetch price and energy data" in caplog.text
+    assert f"My Mock ES - Could not fetch price and energy data" in caplog.text
 
 
 async def test_non_numeric_source_state(hass: HomeAssistant, caplog) -> None:
@@ -398,18 +381,34 @@ async def test_non_numeric_source_state(hass: HomeAssistant, caplog) -> None:
     await hass.async_block_till_done()
     hass.states.async_set("sensor.energy", 123.4)
     hass.states.async_set("sensor.electricity_price", "text")
-    hass.states.async_set("sensor.my_mock_es_cost", 12.2)
     await hass.async_block_till_done()
     async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
     await hass.async_block_till_done()
-    for i in ["EnergyScore", "Cost", "Potential Savings"]:
-        assert f"My Mock ES {i} - Possibly non-numeric source state" in caplog.text
+    assert "My Mock ES - Possibly non-numeric source state" in caplog.text
+    assert hass.states.get("sensor.my_mock_es_cost").state == STATE_UNKNOWN
 
 
-async def test_restore_energyscore(hass: HomeAssistant, caplog) -> None:
+@pytest.mark.parametrize("history_format", ["columns", "dict"])
+async def test_restore_energyscore(hass: HomeAssistant, caplog, history_format) -> None:
     """Testing restoring EnergyScore sensor state and attributes
     Inspired by code in core/tests/helpers/test_restore_state.py
     """
+    hour = epoch_hour(dt.parse_datetime("2022-09-18T13:00:00-0700"))
+    if history_format == "columns":
+        history = {
+            "history": {
+                "start": hour - 1,
+                "step": 1,
+                "total_energy": [None, 122.39],
+                "price": [None, 0.99],
+            }
+        }
+    else:
+        # The format of earlier versions
+        history = {
+            "total_energy": {"2022-09-18T13:00:00-0700": 122.39},
+            "price": {"2022-09-18T13:00:00-0700": 0.99},
+        }
     stored_state = StoredState(
         State(
             "sensor.my_mock_es_energyscore",
@@ -418,8 +417,7 @@ async def test_restore_energyscore(hass: HomeAssistant, caplog) -> None:
                 "energy_entity": "sensor.restored_energy",
                 "price_entity": "sensor.restored_price",
                 "quality": 0.12,
-                "total_energy": {"2022-09-18T13:00:00-0700": 122.39},
-                "price": {"2022-09-18T13:00:00-0700": 0.99},
+                **history,
                 "icon": "mdi:home-assistant",
                 "friendly_name": "New fancy name",
                 "last_updated": "2020-12-01T20:50:53.131803+01:00",
@@ -444,8 +442,12 @@ async def test_restore_energyscore(hass: HomeAssistant, caplog) -> None:
     state = hass.states.get("sensor.my_mock_es_energyscore")
     assert state.state == "38"
     assert state.attributes.get("quality") == 0.12
-    assert state.attributes.get("total_energy") == {"2022-09-18T13:00:00-0700": 122.39}
-    assert state.attributes.get("price") == {"2022-09-18T13:00:00-0700": 0.99}
+    assert state.attributes.get("history") == {
+        "start": hour,
+        "step": 1,
+        "total_energy": [122.39],
+        "price": [0.99],
+    }
     assert state.attributes.get("last_updated") == "2020-12-01T20:50:53.131803+01:00"
 
     # Following attributes are saved, but not restored, so should still be the default
@@ -628,6 +630,93 @@ async def test_restore_potential(hass: HomeAssistant, caplog, case) -> None:
             )
 
 
+async def test_restore_runtime_state(hass: HomeAssistant, hass_storage, caplog) -> None:
+    """Testing restoring the sensors from the runtime state of all sensors"""
+    updated = dt.parse_datetime("2022-09-18T11:10:44-07:00").timestamp()
+    hour = dt.parse_datetime("2022-09-18T11:00:00-07:00").timestamp()
+    hass_storage["energyscore.runtime_state"] = {
+        "version": 1,
+        "key": "energyscore.runtime_state",
+        "data": {
+            "Testing123": {
+                "state": 38,
+                "last_updated": updated,
+                "quality": 0.12,
+                "scores": {},
+            },
+            "Testing123_cost": {
+                "state": 2.33,
+                "unit_of_measurement": "NOK",
+                "last_updated": updated,
+                "last_updated_energy": [[updated, 4.2]],
+            },
+            "Testing123_potential_savings": {
+                "state": 3.33,
+                "unit_of_measurement": "NOK",
+                "last_updated": updated,
+                "average_cost": 1.13,
+                "minimum_cost": 0.23,
+                "maximum_cost": 5.34,
+                "energy_today": 13.1,
+                "quality": 0.76,
+                "last_updated_energy": [[updated, 4.2]],
+                "price": [[hour, 0.99]],
+            },
+        },
+    }
+
+    start = dt.parse_datetime("2022-09-18 21:08:44+01:00")
+    with freeze_time(start) as frozen:
+        assert await async_setup_component(hass, "sensor", VALID_CONFIG)
+        await hass.async_block_till_done()
+        assert "Restored My Mock ES Cost from the runtime state" in caplog.text
+
+        state = hass.states.get("sensor.my_mock_es_energyscore")
+        assert state.state == "38"
+        assert state.attributes["quality"] == 0.12
+        state = hass.states.get("sensor.my_mock_es_cost")
+        assert state.state == "2.33"
+        assert get_unit_of_measurement(hass, "sensor.my_mock_es_cost") == "NOK"
+        assert state.attributes["last_updated_energy"] == {
+            "2022-09-18T11:10:44-0700": 4.2
+        }
+        state = hass.states.get("sensor.my_mock_es_potential_savings")
+        assert state.state == "3.33"
+        assert state.attributes["minimum_cost"] == 0.23
+        assert state.attributes["price"] == {"2022-09-18T11:00:00-0700": 0.99}
+
+        # The states are written a while after an update
+        hass.states.async_set("sensor.electricity_price", 1.0)
+        hass.states.async_set("sensor.energy", 5.2)
+        frozen.tick(SCAN_INTERVAL)
+        async_fire_time_changed(hass, dt.now())
+        await hass.async_block_till_done()
+        frozen.tick(datetime.timedelta(seconds=60))
+        async_fire_time_changed(hass, dt.now())
+        await hass.async_block_till_done()
+
+    stored = hass_storage["energyscore.runtime_state"]["data"]
+    assert stored["Testing123_cost"]["state"] == 3.33
+    assert stored["Testing123_cost"]["last_updated_energy"] == [
+        [(start + SCAN_INTERVAL).timestamp(), 5.2]
+    ]
+    assert len(stored["Testing123_potential_savings"]["price"]) == 2
+    # Aggregated from the restored prices, and kept up to date
+    assert stored["Testing123_potential_savings"]["day_prices"] == {
+        "count": 1,
+        "total": 0.99,
+        "minimum": 0.99,
+        "maximum": 0.99,
+        "key": dt.parse_datetime("2022-09-18T13:00:00-07:00").timestamp(),
+        "price": 1.0,
+    }
+    # The energy of today restored without the hours is given to the last
+    assert stored["Testing123_potential_savings"]["day_energy"] == [
+        [hour, 13.1],
+        [dt.parse_datetime("2022-09-18T13:00:00-07:00").timestamp(), 1.0],
+    ]
+
+
 async def test_declining_energy_energyscore(hass, caplog):
     """Testing that energyscore handles energy sensors that declines"""
 
@@ -776,7 +865,6 @@ async def test_quality_potential_savings(hass: HomeAssistant) -> None:
             hass.states.async_set(
                 "sensor.electricity_price", TEST_PARAMS[hour]["price"]
             )
-            hass.states.async_set("sensor.my_mock_es_cost", hour)
             async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
             await hass.async_block_till_done()
             state = hass.states.get("sensor.my_mock_es_potential_savings")
@@ -791,6 +879,32 @@ async def test_quality_potential_savings(hass: HomeAssistant) -> None:
             frozen_datetime.tick(delta=datetime.timedelta(hours=1))
 
 
+async def test_max_shiftable_power(hass: HomeAssistant) -> None:
+    """Test that the minimum cost only moves the shiftable energy of every
+    hour to cheaper hours"""
+
+    CONFIG = copy.deepcopy(VALID_CONFIG)
+    CONFIG["sensor"]["max_shiftable_power"] = 1
+
+    initial_datetime = dt.parse_datetime("2022-09-18 13:08:44-07:00")
+    with freeze_time(initial_datetime) as frozen_datetime:
+        assert await async_setup_component(hass, "sensor", CONFIG)
+        await hass.async_block_till_done()
+
+        for energy, price in [(1, 3), (2, 1), (5, 2)]:
+            hass.states.async_set("sensor.energy", energy)
+            hass.states.async_set("sensor.electricity_price", price)
+            async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+            await hass.async_block_till_done()
+            frozen_datetime.tick(delta=datetime.timedelta(hours=1))
+
+        assert hass.states.get("sensor.my_mock_es_cost").state == "7.0"
+        state = hass.states.get("sensor.my_mock_es_potential_savings")
+        # Only 1 of the 3 of the last hour could have been used at price 1
+        assert state.attributes["minimum_cost"] == 6.0
+        assert state.state == "1.0"
+
+
 async def test_energy_treshold(hass: HomeAssistant) -> None:
     """Test that the treshold function is working as intended"""
 
@@ -845,11 +959,63 @@ async def test_rolling_hours(hass: HomeAssistant, rolling_hours, hours, score) -
             frozen_datetime.tick(delta=datetime.timedelta(hours=1))
 
         state = hass.states.get("sensor.my_mock_es_energyscore")
-        assert len(state.attributes[PRICES]) == rolling_hours
-        assert len(state.attributes[ENERGY]) == rolling_hours + 1
+        assert len(state.attributes[HISTORY][PRICES]) == rolling_hours + 1
+        assert len(state.attributes[HISTORY][ENERGY]) == rolling_hours + 1
         assert state.state == str(score)
 
 
+async def test_score_windows(hass: HomeAssistant) -> None:
+    """Test that extra windows score the same as separate rolling hours"""
+
+    sensors = [
+        ("My Mock ES", 3, []),
+        ("Windows", 3, ["24h", "7d"]),
+        ("Day", 24, []),
+        ("Week", 168, []),
+    ]
+    CONFIG = {
+        "sensor": [
+            {
+                **VALID_CONFIG["sensor"],
+                "name": name,
+                "unique_id": name,
+                "rolling_hours": rolling_hours,
+                "score_windows": score_windows,
+            }
+            for name, rolling_hours, score_windows in sensors
+        ]
+    }
+
+    initial_datetime = dt.parse_datetime("2022-09-18 21:08:44+01:00")
+    with freeze_time(initial_datetime) as frozen_datetime:
+        assert await async_setup_component(hass, "sensor", CONFIG)
+        await hass.async_block_till_done()
+
+        for hour in range(0, 40):
+            hass.states.async_set(
+                "sensor.energy",
+                TEST_PARAMS[hour]["energy"],
+                attributes={"state_class": sensor.SensorStateClass.TOTAL_INCREASING},
+            )
+            hass.states.async_set(
+                "sensor.electricity_price", TEST_PARAMS[hour]["price"]
+            )
+            async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+            await hass.async_block_till_done()
+            frozen_datetime.tick(delta=datetime.timedelta(hours=1))
+
+        state = hass.states.get("sensor.windows_energyscore")
+        assert state.state == hass.states.get("sensor.my_mock_es_energyscore").state
+        assert len(state.attributes[HISTORY][PRICES]) == 4
+        day = hass.states.get("sensor.day_energyscore")
+        week = hass.states.get("sensor.week_energyscore")
+        assert state.attributes[SCORES] == {
+            "24h": {"score": int(day.state), "quality": day.attributes[QUALITY]},
+            "7d": {"score": int(week.state), "quality": week.attributes[QUALITY]},
+        }
+        assert SCORES not in day.attributes
+
+
 @pytest.mark.parametrize("case", ["default", "low", "high"])
 async def test_rolling_hours_default(hass: HomeAssistant, caplog, case) -> None:
     """Test that the default rolling hours is 24"""
@@ -858,7 +1024,7 @@ async def test_rolling_hours_default(hass: HomeAssistant, caplog, case) -> None:
     if case == "low":
         CONFIG["sensor"]["rolling_hours"] = 1
     elif case == "high":
-        CONFIG["sensor"]["rolling_hours"] = 170
+        CONFIG["sensor"]["rolling_hours"] = 8761
 
     initial_datetime = dt.parse_datetime("2022-09-18 21:08:44+01:00")
     with freeze_time(initial_datetime) as frozen_datetime:
@@ -872,7 +1038,7 @@ async def test_rolling_hours_default(hass: HomeAssistant, caplog, case) -> None:
             )
         elif case == "high":
             assert (
-                "value must be at most 168 for dictionary value @ data['rolling_hours']. Got 170"
+                "value must be at most 8760 for dictionary value @ data['rolling_hours']. Got 8761"
                 in caplog.text
             )
         elif case == "default":
@@ -893,7 +1059,7 @@ async def test_rolling_hours_default(hass: HomeAssistant, caplog, case) -> None:
                 frozen_datetime.tick(delta=datetime.timedelta(hours=1))
 
             state = hass.states.get("sensor.my_mock_es_energyscore")
-            assert len(state.attributes[PRICES]) == 24
+            assert len(state.attributes[HISTORY][PRICES]) == 25
 
 
 async def test_negative_potential(hass: HomeAssistant) -> None:
@@ -905,21 +1071,17 @@ async def test_negative_potential(hass: HomeAssistant) -> None:
         assert await async_setup_component(hass, "sensor", VALID_CONFIG)
         await hass.async_block_till_done()
 
-        # Setting up a potential that would give negative potential (since cost = 0)
-        hass.states.async_set("sensor.energy", 1.2)
-        hass.states.async_set("sensor.electricity_price", 0.5)
-        hass.states.async_set("sensor.my_mock_es_cost", 0)
-        async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
-        await hass.async_block_till_done()
-
-        frozen_datetime.tick(delta=datetime.timedelta(hours=1))
-        hass.states.async_set("sensor.energy", 2.8)
-        hass.states.async_set("sensor.electricity_price", 1.0)
-        hass.states.async_set("sensor.my_mock_es_cost", 0)
-        async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
-        await hass.async_block_till_done()
+        # Small energy usage is rounded away in the cost, but not in the minimum cost
+        for energy in [1.0, 1.01, 1.02]:
+            hass.states.async_set("sensor.energy", energy)
+            hass.states.async_set("sensor.electricity_price", 0.4)
+            async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+            await hass.async_block_till_done()
+            frozen_datetime.tick(delta=datetime.timedelta(minutes=10))
 
+        assert float(hass.states.get("sensor.my_mock_es_cost").state) == 0
         state = hass.states.get("sensor.my_mock_es_potential_savings")
+        assert state.attributes.get("minimum_cost") == 0.01
         assert float(state.state) == 0
 
 
@@ -968,3 +1130,420 @@ async def test_uom(hass: HomeAssistant, caplog, uom: str) -> None:
         )
         assert state_cost.attributes.get("unit_of_measurement") == None
         assert state_save.attributes.get("unit_of_measurement") == None
+
+
+async def test_uom_cached(hass: HomeAssistant, monkeypatch) -> None:
+    """Unit of measurement is only resolved again when invalidated"""
+
+    entity_reg = er.async_get(hass)
+    for entity in ["electricity_price", "energy"]:
+        entity_reg.async_get_or_create(
+            "sensor", "test", entity, suggested_object_id=entity
+        )
+    hass.states.async_set(
+        "sensor.electricity_price", 1.22, attributes={"unit_of_measurement": "NOK/kWh"}
+    )
+    hass.states.async_set(
+        "sensor.energy", 2.22, attributes={"unit_of_measurement": "kWh"}
+    )
+
+    lookups = []
+
+    def counting_get_unit_of_measurement(hass, entity_id):
+        lookups.append(entity_id)
+        return get_unit_of_measurement(hass, entity_id)
+
+    monkeypatch.setattr(
+        "custom_components.energyscore.sensor.get_unit_of_measurement",
+        counting_get_unit_of_measurement,
+    )
+
+    assert await async_setup_component(hass, "sensor", VALID_CONFIG)
+    await hass.async_block_till_done()
+    for _ in range(3):
+        async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+        await hass.async_block_till_done()
+    count = len(lookups)
+    assert 0 < count <= 4
+    assert (
+        hass.states.get("sensor.my_mock_es_cost").attributes.get("unit_of_measurement")
+        == "NOK"
+    )
+
+    # Polling without changes does not resolve the unit again
+    async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+    await hass.async_block_till_done()
+    assert len(lookups) == count
+
+    # A changed source unit is picked up on the next update
+    hass.states.async_set(
+        "sensor.electricity_price", 1.22, attributes={"unit_of_measurement": "EUR/kWh"}
+    )
+    async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+    await hass.async_block_till_done()
+    assert len(lookups) > count
+    assert (
+        hass.states.get("sensor.my_mock_es_cost").attributes.get("unit_of_measurement")
+        == "EUR"
+    )
+    assert (
+        hass.states.get("sensor.my_mock_es_potential_savings").attributes.get(
+            "unit_of_measurement"
+        )
+        == "EUR"
+    )
+
+    # Updated registry entries of the sources invalidate the unit
+    count = len(lookups)
+    entity_reg.async_update_entity("sensor.energy", name="Energy")
+    await hass.async_block_till_done()
+    async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+    await hass.async_block_till_done()
+    assert len(lookups) > count
+
+
+async def test_event_driven_updates(hass: HomeAssistant) -> None:
+    """Test that sensors update on source changes instead of polling"""
+
+    CONFIG = copy.deepcopy(VALID_CONFIG)
+    CONFIG["sensor"]["event_driven"] = True
+
+    initial_datetime = dt.parse_datetime("2022-09-18 21:08:44+01:00")
+    with freeze_time(initial_datetime) as frozen_datetime:
+        assert await async_setup_component(hass, "sensor", CONFIG)
+        await hass.async_block_till_done()
+
+        # Polling does not update the sensors
+        hass.states.async_set("sensor.energy", 1.2)
+        hass.states.async_set("sensor.electricity_price", 0.5)
+        hass.states.async_set("sensor.energy", 1.2)
+        await hass.async_block_till_done()
+        state = hass.states.get("sensor.my_mock_es_energyscore")
+        last_updated = state.attributes.get("last_updated")
+        assert last_updated is not None
+        assert hass.states.get("sensor.my_mock_es_cost").state == "unknown"
+
+        # Only attribute changes do not update the sensors
+        frozen_datetime.tick(delta=datetime.timedelta(minutes=5))
+        hass.states.async_set("sensor.energy", 1.2, attributes={"a": 1})
+        await hass.async_block_till_done()
+        state = hass.states.get("sensor.my_mock_es_energyscore")
+        assert state.attributes.get("last_updated") == last_updated
+
+        # Source state changes update the sensors
+        hass.states.async_set("sensor.energy", 1.8)
+        await hass.async_block_till_done()
+        state = hass.states.get("sensor.my_mock_es_energyscore")
+        assert state.attributes.get("last_updated") != last_updated
+        assert hass.states.get("sensor.my_mock_es_cost").state == "0.3"
+
+        # Hours without source changes are registered at the start of the hour
+        frozen_datetime.move_to("2022-09-18 22:00:00+01:00")
+        async_fire_time_changed(hass, dt.now())
+        await hass.async_block_till_done()
+        state = hass.states.get("sensor.my_mock_es_energyscore")
+        assert len(state.attributes[HISTORY][PRICES]) == 2
+
+
+async def test_event_driven_debounced(hass: HomeAssistant) -> None:
+    """Test that source changes during the cooldown refresh the sources once"""
+
+    CONFIG = copy.deepcopy(VALID_CONFIG)
+    CONFIG["sensor"]["event_driven"] = True
+
+    initial_datetime = dt.parse_datetime("2022-09-18 21:08:44+01:00")
+    with freeze_time(initial_datetime) as frozen_datetime:
+        assert await async_setup_component(hass, "sensor", CONFIG)
+        await hass.async_block_till_done()
+        sensor = hass.data["sensor"].get_entity("sensor.my_mock_es_energyscore")
+        coordinator = sensor.coordinator
+
+        with patch.object(
+            coordinator, "_async_update_data", wraps=coordinator._async_update_data
+        ) as update:
+            # A meter reporting every second, and the price at the same time
+            for energy in (1.0, 1.1, 1.2):
+                hass.states.async_set("sensor.energy", energy)
+                hass.states.async_set("sensor.electricity_price", 0.5)
+                await hass.async_block_till_done()
+                frozen_datetime.tick(delta=datetime.timedelta(seconds=1))
+            assert update.call_count == 1
+            assert coordinator.data.energy == 1.0
+
+            # The changes during the cooldown are refreshed once after it
+            frozen_datetime.tick(delta=datetime.timedelta(seconds=REFRESH_COOLDOWN))
+            async_fire_time_changed(hass, dt.now())
+            await hass.async_block_till_done()
+            assert update.call_count == 2
+        assert coordinator.data.energy == 1.2
+
+
+async def test_price_hub(hass: HomeAssistant) -> None:
+    """Test that sensors sharing a price entity are scored together"""
+
+    CONFIG = copy.deepcopy(VALID_CONFIG_2)
+    for config in CONFIG["sensor"]:
+        config["event_driven"] = True
+    CONFIG["sensor"][1]["rolling_hours"] = 2
+
+    initial_datetime = dt.parse_datetime("2022-09-18 21:08:44+01:00")
+    with freeze_time(initial_datetime) as frozen_datetime:
+        assert await async_setup_component(hass, "sensor", CONFIG)
+        await hass.async_block_till_done()
+        assert list(hass.data[DATA_PRICE_HUBS]) == [("sensor.electricity_price", 60)]
+
+        for energy, alternative, price in [(1, 1, 0.5), (2, 2.5, 1.0)]:
+            hass.states.async_set("sensor.electricity_price", price)
+            hass.states.async_set("sensor.energy", energy)
+            hass.states.async_set("sensor.alternative_energy", alternative)
+            await hass.async_block_till_done()
+            frozen_datetime.tick(delta=datetime.timedelta(hours=1))
+        state = hass.states.get("sensor.my_alternative_es_energyscore")
+        assert state.attributes[QUALITY] == 0.5
+        last_updated = state.attributes["last_updated"]
+
+        # Updates of the other sensor move the window of both
+        hass.states.async_set("sensor.alternative_energy", STATE_UNAVAILABLE)
+        frozen_datetime.tick(delta=datetime.timedelta(hours=1))
+        hass.states.async_set("sensor.energy", 3)
+        await hass.async_block_till_done()
+        state = hass.states.get("sensor.my_alternative_es_energyscore")
+        assert state.attributes[QUALITY] == 0
+        assert state.attributes["last_updated"] == last_updated
+        state = hass.states.get("sensor.my_mock_es_energyscore")
+        assert state.attributes[QUALITY] == 0.04
+
+
+async def test_price_hub_filled_once(hass: HomeAssistant) -> None:
+    """Test that the scores are rebuilt once when all sensors sharing a price
+    entity fill missing prices"""
+
+    CONFIG = copy.deepcopy(VALID_CONFIG_2)
+    for config in CONFIG["sensor"]:
+        config["event_driven"] = True
+        config["price_attributes"] = True
+
+    initial_datetime = dt.parse_datetime("2022-09-18 21:08:44+01:00")
+    with freeze_time(initial_datetime):
+        assert await async_setup_component(hass, "sensor", CONFIG)
+        await hass.async_block_till_done()
+        hub = hass.data[DATA_PRICE_HUBS][("sensor.electricity_price", 60)]
+
+        with patch.object(
+            hub, "async_rebuild", side_effect=hub.async_rebuild
+        ) as rebuild:
+            hass.states.async_set("sensor.energy", 1)
+            hass.states.async_set("sensor.alternative_energy", 1)
+            hass.states.async_set(
+                "sensor.electricity_price", 0.5, {"today": [1.0] * 24}
+            )
+            await hass.async_block_till_done()
+        assert rebuild.call_count == 1
+
+
+async def test_diagnostic_sensors(hass: HomeAssistant) -> None:
+    """Test the diagnostic sensors of the update metrics"""
+    entity_reg = er.async_get(hass)
+    # Enabled before setup, the sensors are disabled by default
+    for key in ["last_update_duration", "skipped_updates", "attribute_size"]:
+        entity_reg.async_get_or_create(
+            "sensor",
+            "energyscore",
+            f"Testing123_{key}",
+            suggested_object_id=f"my_mock_es_{key}",
+        )
+
+    assert await async_setup_component(hass, "sensor", VALID_CONFIG)
+    await hass.async_block_till_done()
+    entry = entity_reg.async_get("sensor.my_mock_es_failed_updates")
+    assert entry.disabled_by is er.RegistryEntryDisabler.INTEGRATION
+    assert entry.entity_category is EntityCategory.DIAGNOSTIC
+    assert hass.states.get("sensor.my_mock_es_failed_updates") is None
+
+    hass.states.async_set("sensor.energy", STATE_UNAVAILABLE)
+    hass.states.async_set("sensor.electricity_price", 0.42)
+    async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+    await hass.async_block_till_done()
+    assert hass.states.get("sensor.my_mock_es_skipped_updates").state == "1"
+
+    hass.states.async_set("sensor.energy", 1.2)
+    async_fire_time_changed(hass, dt.now() + 2 * SCAN_INTERVAL)
+    await hass.async_block_till_done()
+    state = hass.states.get("sensor.my_mock_es_last_update_duration")
+    assert float(state.state) > 0
+    assert state.attributes["unit_of_measurement"] == "ms"
+    assert int(hass.states.get("sensor.my_mock_es_attribute_size").state) > 100
+    assert hass.states.get("sensor.my_mock_es_skipped_updates").state == "1"
+
+
+@pytest.mark.parametrize("attribute", ["raw_today", "today"])
+async def test_price_attributes(hass: HomeAssistant, attribute) -> None:
+    """Test that missing prices of today are filled from the price attributes"""
+
+    CONFIG = copy.deepcopy(VALID_CONFIG)
+    CONFIG["sensor"]["price_attributes"] = True
+
+    initial_datetime = dt.parse_datetime("2022-09-18 21:08:44+01:00")
+    with freeze_time(initial_datetime) as frozen_datetime:
+        assert await async_setup_component(hass, "sensor", CONFIG)
+        await hass.async_block_till_done()
+
+        # Quarter hourly prices, 0.1 higher every hour
+        midnight = dt.start_of_local_day()
+        quarters = [
+            (midnight + datetime.timedelta(minutes=15 * index), index // 4 / 10)
+            for index in range(96)
+        ]
+        attributes = {
+            "raw_today": {
+                "raw_today": [
+                    {
+                        "start": start.isoformat(),
+                        "end": (start + datetime.timedelta(minutes=15)).isoformat(),
+                        "value": value,
+                    }
+                    for start, value in quarters
+                ]
+            },
+            "today": {"today": [value for _, value in quarters]},
+        }[attribute]
+        for energy in [10, 11]:
+            hass.states.async_set("sensor.energy", energy)
+            hass.states.async_set("sensor.electricity_price", 0.3, attributes)
+            async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+            await hass.async_block_till_done()
+            frozen_datetime.tick(delta=datetime.timedelta(hours=1))
+
+        # 13:00 and 14:00 local time are updated, the hours before are filled
+        state = hass.states.get("sensor.my_mock_es_energyscore")
+        history = state.attributes[HISTORY]
+        assert history["start"] == epoch_hour(midnight)
+        assert history[PRICES] == [hour / 10 for hour in range(13)] + [0.3, 0.3]
+        assert state.attributes[QUALITY] == 0.04
+
+
+async def test_interval(hass: HomeAssistant) -> None:
+    """Test keeping prices and energy by quarter hour"""
+
+    CONFIG = copy.deepcopy(VALID_CONFIG)
+    CONFIG["sensor"]["interval"] = 15
+    CONFIG["sensor"]["rolling_hours"] = 3
+
+    initial_datetime = dt.parse_datetime("2022-09-18 21:08:44+01:00")
+    with freeze_time(initial_datetime) as frozen_datetime:
+        assert await async_setup_component(hass, "sensor", CONFIG)
+        await hass.async_block_till_done()
+
+        for quarter in range(6):
+            hass.states.async_set("sensor.energy", quarter + 1)
+            hass.states.async_set("sensor.electricity_price", quarter / 10)
+            async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+            await hass.async_block_till_done()
+            frozen_datetime.tick(delta=datetime.timedelta(minutes=15))
+
+        state = hass.states.get("sensor.my_mock_es_energyscore")
+        history = state.attributes[HISTORY]
+        assert history["start"] == epoch_interval(initial_datetime, 15)
+        assert history["step"] == 0.25
+        assert history[ENERGY] == [1, 2, 3, 4, 5, 6]
+        assert history[PRICES] == [0, 0.1, 0.2, 0.3, 0.4, 0.5]
+        # 5 quarters with energy usage of the 12 of 3 hours
+        assert state.attributes[QUALITY] == 0.42
+
+
+async def test_coalesce_energy(hass: HomeAssistant) -> None:
+    """Test that frequent energy readings are coalesced into the cost and
+    potential savings once per interval, each at its own price"""
+
+    CONFIG = copy.deepcopy(VALID_CONFIG)
+    CONFIG["sensor"]["coalesce_energy"] = True
+
+    initial_datetime = dt.parse_datetime("2022-09-18 21:50:00+01:00")
+    with freeze_time(initial_datetime) as frozen_datetime:
+        assert await async_setup_component(hass, "sensor", CONFIG)
+        await hass.async_block_till_done()
+
+        hass.states.async_set("sensor.electricity_price", 1.0)
+        hass.states.async_set("sensor.energy", 10.0)
+        await hass.async_block_till_done()
+        # Readings every 6 seconds are added up until the hour is completed
+        for reading in range(1, 90):
+            frozen_datetime.tick(delta=datetime.timedelta(seconds=6))
+            hass.states.async_set("sensor.energy", 10.0 + reading / 50)
+        await hass.async_block_till_done()
+        assert hass.states.get("sensor.my_mock_es_cost").state == "unknown"
+
+        # Polling does not update the cost
+        async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+        await hass.async_block_till_done()
+        assert hass.states.get("sensor.my_mock_es_cost").state == "unknown"
+
+        # The usage across the hour is split between the hours
+        frozen_datetime.move_to("2022-09-18 22:00:00+01:00")
+        hass.states.async_set("sensor.electricity_price", 3.0)
+        frozen_datetime.move_to("2022-09-18 22:01:06+01:00")
+        hass.states.async_set("sensor.energy", 12.22)
+        await hass.async_block_till_done()
+        assert hass.states.get("sensor.my_mock_es_cost").state == "2.0"
+        state = hass.states.get("sensor.my_mock_es_potential_savings")
+        assert state.attributes["energy_today"] == 2.0
+        assert list(state.attributes[PRICES].values()) == [1.0]
+        assert state.state == "0.0"
+
+        frozen_datetime.move_to("2022-09-18 23:00:00+01:00")
+        hass.states.async_set("sensor.energy", 13.0)
+        await hass.async_block_till_done()
+        assert hass.states.get("sensor.my_mock_es_cost").state == "5.0"
+        state = hass.states.get("sensor.my_mock_es_potential_savings")
+        assert state.attributes["energy_today"] == 3.0
+        assert list(state.attributes[PRICES].values()) == [1.0, 3.0]
+        assert state.attributes["minimum_cost"] == 3.0
+        assert state.state == "2.0"
+
+
+async def test_backfill(recorder_mock, hass: HomeAssistant) -> None:
+    """Test that missing hours are filled from the recorder statistics"""
+
+    now = dt.utcnow().replace(minute=0, second=0, microsecond=0)
+    for statistic_id, statistic_type, unit, values in [
+        ("sensor.energy", "state", "kWh", [10 + hour * 0.5 for hour in range(30)]),
+        ("sensor.electricity_price", "mean", "NOK/kWh", [0.5, 1.0, 1.5] * 10),
+    ]:
+        async_import_statistics(
+            hass,
+            {
+                "has_mean": statistic_type == "mean",
+                "has_sum": False,
+                "name": None,
+                "source": "recorder",
+                "statistic_id": statistic_id,
+                "unit_of_measurement": unit,
+            },
+            [
+                {
+                    "start": now - datetime.timedelta(hours=30 - hour),
+                    statistic_type: value,
+                }
+                for hour, value in enumerate(values)
+            ],
+        )
+    await async_wait_recording_done(hass)
+
+    CONFIG = copy.deepcopy(VALID_CONFIG)
+    CONFIG["sensor"]["backfill"] = True
+    assert await async_setup_component(hass, "sensor", CONFIG)
+    await hass.async_block_till_done()
+    await async_wait_recording_done(hass)
+    await hass.async_block_till_done()
+
+    state = hass.states.get("sensor.my_mock_es_energyscore")
+    assert len(state.attributes[HISTORY][PRICES]) == 24
+    assert len(state.attributes[HISTORY][ENERGY]) == 24
+    assert state.attributes[QUALITY] == 0.96
+
+    hass.states.async_set("sensor.energy", 25.5)
+    hass.states.async_set("sensor.electricity_price", 0.5)
+    async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+    await hass.async_block_till_done()
+    state = hass.states.get("sensor.my_mock_es_energyscore")
+    assert state.attributes[QUALITY] == 1.0
@@ -0,0 +1,231 @@
+"""Service tests for EnergyScore"""
+
+import datetime
+
+from freezegun import freeze_time
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.setup import async_setup_component
+from homeassistant.util import dt
+import pytest
+from pytest_homeassistant_custom_component.common import (
+    async_capture_events,
+    async_fire_time_changed,
+)
+
+from custom_components.energyscore.const import SCAN_INTERVAL
+from custom_components.energyscore.services import (
+    EVENT_CHEAPEST_WINDOW,
+    EVENT_SIMULATED,
+)
+
+from .const import VALID_CONFIG
+
+
+async def _simulate(hass: HomeAssistant, **data) -> dict:
+    """Calls the simulate service, returns the results of the event"""
+    events = async_capture_events(hass, EVENT_SIMULATED)
+    await hass.services.async_call(
+        "energyscore",
+        "simulate",
+        {"entity_id": "sensor.my_mock_es_energyscore", **data},
+        blocking=True,
+    )
+    assert len(events) == 1
+    return events[0].data
+
+
+async def test_simulate_history(hass: HomeAssistant) -> None:
+    """Test scoring profiles against the price history"""
+
+    initial_datetime = dt.parse_datetime("2022-09-18 13:08:44-07:00")
+    with freeze_time(initial_datetime) as frozen_datetime:
+        assert await async_setup_component(hass, "sensor", VALID_CONFIG)
+        await hass.async_block_till_done()
+
+        for energy, price in [(1, 3), (2, 1), (5, 2)]:
+            hass.states.async_set("sensor.energy", energy)
+            hass.states.async_set("sensor.electricity_price", price)
+            async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+            await hass.async_block_till_done()
+            frozen_datetime.tick(delta=datetime.timedelta(hours=1))
+        frozen_datetime.tick(delta=-datetime.timedelta(hours=1))
+
+        data = await _simulate(hass, profiles=[[0, 1, 2], [3, 0, 0], [0, 0, 0]])
+        assert data["start"] == "2022-09-18T13:00:00-07:00"
+        assert data["quality"] == 1
+        assert data["results"] == [
+            {"score": 66, "cost": 5.0, "potential_savings": 2.0},
+            {"score": 0, "cost": 9.0, "potential_savings": 6.0},
+            {"score": None, "cost": 0.0, "potential_savings": 0.0},
+        ]
+
+        # Only part of the energy of every hour could have been moved
+        data = await _simulate(hass, profiles=[[3, 0, 0]], max_shiftable_power=1)
+        assert data["results"][0]["potential_savings"] == 2.0
+
+        # Hours before the history have no price
+        data = await _simulate(hass, profiles=[[1, 0, 0, 2]])
+        assert data["quality"] == 0.75
+        assert data["results"][0]["cost"] == 4.0
+
+
+async def test_simulate_half_hour_zone(hass: HomeAssistant) -> None:
+    """Test that the start is the start of the local hour in a zone with a
+    half hour offset"""
+    hass.config.set_time_zone("Asia/Kolkata")
+
+    with freeze_time(dt.parse_datetime("2022-09-18 13:08:44+05:30")):
+        assert await async_setup_component(hass, "sensor", VALID_CONFIG)
+        await hass.async_block_till_done()
+        hass.states.async_set("sensor.energy", 1)
+        hass.states.async_set("sensor.electricity_price", 1)
+        async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+        await hass.async_block_till_done()
+
+        data = await _simulate(hass, profiles=[[1]])
+        assert data["start"] == "2022-09-18T13:00:00+05:30"
+
+
+async def test_simulate_tomorrow(hass: HomeAssistant) -> None:
+    """Test scoring a profile against the day ahead prices"""
+
+    with freeze_time(dt.parse_datetime("2022-09-18 13:08:44-07:00")):
+        assert await async_setup_component(hass, "sensor", VALID_CONFIG)
+        await hass.async_block_till_done()
+        hass.states.async_set(
+            "sensor.electricity_price",
+            1,
+            {"tomorrow": [hour % 12 / 10 for hour in range(24)]},
+        )
+
+        data = await _simulate(hass, profiles=[[0] * 11 + [2] * 2], prices="tomorrow")
+        assert data["start"] == "2022-09-19T00:00:00-07:00"
+        assert data["results"] == [{"score": 50, "cost": 2.2, "potential_savings": 2.2}]
+
+        with pytest.raises(HomeAssistantError, match="No today prices"):
+            await _simulate(hass, profiles=[[1, 2]], prices="today")
+
+
+async def test_simulate_invalid(hass: HomeAssistant) -> None:
+    """Test that invalid profiles and entities are refused"""
+    assert await async_setup_component(hass, "sensor", VALID_CONFIG)
+    await hass.async_block_till_done()
+
+    with pytest.raises(HomeAssistantError, match="same length"):
+        await _simulate(hass, profiles=[[1, 2], [3]])
+    with pytest.raises(HomeAssistantError, match="same length"):
+        await _simulate(hass, profiles=[["a"]])
+    with pytest.raises(HomeAssistantError, match="not an EnergyScore sensor"):
+        await hass.services.async_call(
+            "energyscore",
+            "simulate",
+            {"entity_id": "sensor.my_mock_es_cost", "profiles": [[1]]},
+            blocking=True,
+        )
+
+
+async def test_cheapest_window(hass: HomeAssistant) -> None:
+    """Test finding the cheapest hours in the upcoming prices and the history"""
+
+    with freeze_time(dt.parse_datetime("2022-09-18 13:08:44-07:00")):
+        assert await async_setup_component(hass, "sensor", VALID_CONFIG)
+        await hass.async_block_till_done()
+        hass.states.async_set("sensor.energy", 1)
+        hass.states.async_set("sensor.electricity_price", 1)
+        async_fire_time_changed(hass, dt.now() + SCAN_INTERVAL)
+        await hass.async_block_till_done()
+        hass.states.async_set(
+            "sensor.electricity_price",
+            1,
+            {
+                "today": [hour / 10 for hour in range(24)],
+                "tomorrow": [
+                    5 if hour == 22 else (23 - hour) / 10 for hour in range(24)
+                ],
+            },
+        )
+
+        events = async_capture_events(hass, EVENT_CHEAPEST_WINDOW)
+        data = {"entity_id": "sensor.my_mock_es_energyscore", "hours": 2.5}
+        await hass.services.async_call(
+            "energyscore", "cheapest_window", data, blocking=True
+        )
+        assert events[0].data["contiguous"] == {
+            "start": "2022-09-19T19:00:00-07:00",
+            "end": "2022-09-19T22:00:00-07:00",
+            "average_price": 0.3,
+        }
+        assert events[0].data["non_contiguous"] == {
+            "starts": [
+                "2022-09-19T20:00:00-07:00",
+                "2022-09-19T21:00:00-07:00",
+                "2022-09-19T23:00:00-07:00",
+            ],
+            "average_price": 0.17,
+        }
+
+        # The windows are kept until the prices change
+        sensor = hass.data["sensor"].get_entity("sensor.my_mock_es_energyscore")
+        _, windows = sensor.price_windows()
+        assert sensor.price_windows()[1] is windows
+        hass.states.async_set("sensor.electricity_price", 1, {"today": [1] * 24})
+        assert sensor.price_windows()[1] is not windows
+
+        # The history only has the price of the current hour
+        await hass.services.async_call(
+            "energyscore",
+            "cheapest_window",
+            {**data, "hours": 1, "prices": "history"},
+            blocking=True,
+        )
+        assert events[1].data["contiguous"] == {
+            "start": "2022-09-18T13:00:00-07:00",
+            "end": "2022-09-18T14:00:00-07:00",
+            "average_price": 1.0,
+        }
+        await hass.services.async_call(
+            "energyscore",
+            "cheapest_window",
+            {**data, "prices": "history"},
+            blocking=True,
+        )
+        assert events[2].data["contiguous"] is None
+        assert events[2].data["non_contiguous"] is None
+
+
+async def test_cheapest_window_half_hour_zone(hass: HomeAssistant) -> None:
+    """Test that the windows start at the local hours of the published prices
+    in a zone with a half hour offset"""
+    hass.config.set_time_zone("Asia/Kolkata")
+
+    with freeze_time(dt.parse_datetime("2022-09-18 13:08:44+05:30")):
+        assert await async_setup_component(hass, "sensor", VALID_CONFIG)
+        await hass.async_block_till_done()
+        hass.states.async_set(
+            "sensor.electricity_price",
+            1,
+            {"today": [0.1 if hour in (20, 22) else 1 for hour in range(24)]},
+        )
+
+        events = async_capture_events(hass, EVENT_CHEAPEST_WINDOW)
+        await hass.services.async_call(
+            "energyscore",
+            "cheapest_window",
+            {"entity_id": "sensor.my_mock_es_energyscore", "hours": 1},
+            blocking=True,
+        )
+        assert events[0].data["contiguous"] == {
+            "start": "2022-09-18T20:00:00+05:30",
+            "end": "2022-09-18T21:00:00+05:30",
+            "average_price": 0.1,
+        }
+
+        data = {"entity_id": "sensor.my_mock_es_energyscore", "hours": 2}
+        await hass.services.async_call(
+            "energyscore", "cheapest_window", data, blocking=True
+        )
+        assert events[1].data["non_contiguous"] == {
+            "starts": ["2022-09-18T20:00:00+05:30", "2022-09-18T22:00:00+05:30"],
+            "average_price": 0.1,
+        }
@@ -0,0 +1,68 @@
+"""History store tests for EnergyScore"""
+
+import numpy as np
+
+from custom_components.energyscore import store as store_module
+from custom_components.energyscore.store import HistoryStore
+
+
+def test_store_persists_history(tmp_path) -> None:
+    """Test that the history is kept in the file between loads"""
+    path = str(tmp_path / ".storage" / "history.npy")
+    store = HistoryStore(path, 4)
+    store.load()
+    assert store.energy.newest is None
+    store.energy.set(100, 1.5)
+    store.energy.set(101, None)
+    store.price.set(101, 0.3)
+    store.close()
+
+    store = HistoryStore(path, 4)
+    store.load()
+    assert list(store.energy.items()) == [(100, 1.5), (101, None)]
+    assert list(store.price.items()) == [(101, 0.3)]
+    store.close()
+
+
+def test_store_resize(tmp_path) -> None:
+    """Test that the newest hours are kept when the capacity changes"""
+    path = str(tmp_path / "history.npy")
+    store = HistoryStore(path, 5)
+    store.load()
+    for hour in range(10, 15):
+        store.energy.set(hour, float(hour))
+    store.close()
+
+    store = HistoryStore(path, 3)
+    store.load()
+    assert list(store.energy.items()) == [(12, 12.0), (13, 13.0), (14, 14.0)]
+    assert list(store.price.items()) == []
+    store.close()
+    assert len(np.load(path)) == 3
+
+
+def test_store_unreadable_file(tmp_path, caplog) -> None:
+    """Test that an unreadable file is replaced by a new history"""
+    path = tmp_path / "history.npy"
+    path.write_bytes(b"not a history")
+    store = HistoryStore(str(path), 3)
+    store.load()
+    assert "starting a new history" in caplog.text
+    assert list(store.energy.items()) == []
+    store.close()
+
+
+def test_store_removes_older_layouts(tmp_path, monkeypatch) -> None:
+    """Test that the files of older layouts are removed, not left behind"""
+    old_path = tmp_path / "energyscore.sensor.history.v1.npy"
+    store = HistoryStore(str(old_path), 3)
+    store.load()
+    store.energy.set(10, 1.0)
+    store.close()
+
+    monkeypatch.setattr(store_module, "STORE_VERSION", 2)
+    store = HistoryStore(str(tmp_path / "energyscore.sensor.history.v2.npy"), 3)
+    store.load()
+    assert not old_path.exists()
+    assert list(store.energy.items()) == []
+    store.close()
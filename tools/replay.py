@@ -0,0 +1,350 @@
+"""Offline replay of the recorded states of an energy and a price entity
+
+Scores a local copy of the SQLite database of the Home Assistant recorder with
+the EnergyScore, Cost and Potential Savings sensors, so options can be tried
+on months of history without waiting for a live instance. Run from the
+repository root:
+
+    python -m tools.replay home-assistant_v2.db \\
+        --energy-entity sensor.energy --price-entity sensor.price \\
+        --rolling-hours 168 --energy-treshold 0.1 --output replay.csv
+
+The states are streamed from the database in chunks and fed to the sensors
+with a simulated clock, polling every scan interval like the coordinator, or
+on every state change and the start of every interval when event driven. The
+scores, costs and potential savings at the end of every hour are written as
+CSV.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import datetime
+import heapq
+from itertools import groupby
+import json
+from operator import attrgetter
+import sqlite3
+import sys
+from types import SimpleNamespace
+from typing import Any, Iterator, NamedTuple
+
+from homeassistant.const import (
+    CONF_NAME,
+    CONF_UNIQUE_ID,
+    STATE_UNAVAILABLE,
+    STATE_UNKNOWN,
+)
+from homeassistant.util import dt
+
+from custom_components.energyscore.const import (
+    CONF_ENERGY_ENTITY,
+    CONF_PRICE_ENTITY,
+    INTERVALS,
+    MAX_ROLLING_HOURS,
+    QUALITY,
+    SCAN_INTERVAL,
+    SCORE_WINDOWS,
+)
+from custom_components.energyscore.coordinator import SourceData
+from custom_components.energyscore.history import epoch_hour, interval_start
+from custom_components.energyscore.hub import PriceHub
+from custom_components.energyscore.sensor import Cost, EnergyScore, PotentialSavings
+
+# Number of states read from the database at a time
+CHUNK_SIZE = 10000
+
+FIELDS = ["hour", "score", "quality", "cost", "potential_savings", "savings_quality"]
+
+
+class RecordedState(NamedTuple):
+    """A recorded state of a source entity"""
+
+    time: datetime.datetime
+    entity_id: str
+    state: str | None
+    attributes: str | None  # JSON, only parsed when used
+
+
+def _columns(connection: sqlite3.Connection, table: str) -> set[str]:
+    return {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+
+
+def recorded_states(
+    connection: sqlite3.Connection,
+    entity_id: str,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[RecordedState]:
+    """Streams the recorded states of an entity in chronological order
+
+    Databases where the entity ids are kept in states_meta, and older ones
+    with the last updated time as a datetime instead of a timestamp, are
+    read as well.
+    """
+    columns = _columns(connection, "states")
+    if "last_updated_ts" in columns:
+        time_column = "states.last_updated_ts"
+        bounds = [time.timestamp() if time else None for time in (start, end)]
+    else:
+        time_column = "states.last_updated"
+        bounds = [
+            dt.as_utc(time).strftime("%Y-%m-%d %H:%M:%S") if time else None
+            for time in (start, end)
+        ]
+    if _columns(connection, "states_meta"):
+        entity_filter = (
+            "states.metadata_id = "
+            "(SELECT metadata_id FROM states_meta WHERE entity_id = ?)"
+        )
+    else:
+        entity_filter = "states.entity_id = ?"
+    if "attributes_id" in columns:
+        attributes = "COALESCE(state_attributes.shared_attrs, states.attributes)"
+        join = (
+            "LEFT JOIN state_attributes "
+            "ON states.attributes_id = state_attributes.attributes_id"
+        )
+    else:
+        attributes, join = "states.attributes", ""
+
+    cursor = connection.execute(
+        f"SELECT {time_column}, states.state, {attributes} FROM states {join} "
+        f"WHERE {entity_filter} "
+        f"AND (? IS NULL OR {time_column} >= ?) "
+        f"AND (? IS NULL OR {time_column} < ?) "
+        f"ORDER BY {time_column}",
+        (entity_id, bounds[0], bounds[0], bounds[1], bounds[1]),
+    )
+    while rows := cursor.fetchmany(chunk_size):
+        for time, state, attributes in rows:
+            if isinstance(time, (float, int)):
+                time = dt.utc_from_timestamp(time)
+            else:
+                time = dt.as_utc(dt.parse_datetime(time))
+            yield RecordedState(time, entity_id, state, attributes)
+
+
+def _value(state: RecordedState | None) -> float | None:
+    """Returns the numeric state, None if not usable like in the coordinator"""
+    if state is None or state.state in (None, STATE_UNAVAILABLE, STATE_UNKNOWN):
+        return None
+    try:
+        return round(float(state.state), 2)
+    except ValueError:
+        return None
+
+
+class Replay:
+    """EnergyScore, Cost and Potential Savings sensors fed by recorded states
+    with a simulated clock"""
+
+    def __init__(
+        self,
+        energy_entity: str,
+        price_entity: str,
+        energy_treshold: float = 0,
+        rolling_hours: int = 24,
+        score_windows: list[str] | None = None,
+        interval: int = 60,
+        max_shiftable_power: float = 0,
+    ) -> None:
+        config = {
+            CONF_NAME: "Replay",
+            CONF_UNIQUE_ID: None,
+            CONF_ENERGY_ENTITY: energy_entity,
+            CONF_PRICE_ENTITY: price_entity,
+        }
+        self.energy_entity = energy_entity
+        self.price_entity = price_entity
+        self.coordinator = SimpleNamespace(
+            cost_unit_valid=True, data=None, interval=interval
+        )
+        self.energyscore = EnergyScore(
+            self.coordinator,
+            config,
+            energy_treshold,
+            rolling_hours,
+            score_windows or [],
+        )
+        # Kept by the replay, as written by the sensor
+        self.score = self.energyscore.state
+        self.cost = Cost(self.coordinator, config)
+        self.savings = PotentialSavings(
+            self.coordinator, config, self.cost, max_shiftable_power
+        )
+        # Without Home Assistant, the hub rebuilds the scores at the first update
+        self.energyscore.async_join_price_hub(PriceHub(None, price_entity, interval))
+        self._attributes: dict[str | None, dict[str, Any]] = {}
+        self._states: dict[str, RecordedState] = {}
+
+    def _energy_attributes(self, state: RecordedState) -> dict[str, Any]:
+        """Returns the attributes of a recorded energy state, parsed once"""
+        if state.attributes not in self._attributes:
+            self._attributes[state.attributes] = json.loads(state.attributes or "{}")
+        return self._attributes[state.attributes]
+
+    def update(self, time: datetime.datetime) -> None:
+        """Updates the sensors with the latest states at the given time, like
+        the coordinator and the update handlers"""
+        price = _value(self._states.get(self.price_entity))
+        energy = _value(self._states.get(self.energy_entity))
+        if price is None or energy is None:
+            return
+        data = SourceData(
+            price,
+            energy,
+            self._energy_attributes(self._states[self.energy_entity]),
+            {},
+        )
+        self.coordinator.data = data
+        now = dt.as_local(time)
+        self.score = self.energyscore.process_new_data(data, now)
+        self.cost.process_new_data(data, now)
+        self.savings.process_new_data(data, self.cost.state, now)
+
+    def row(self, hour: int) -> dict[str, Any]:
+        """Returns the states of the sensors at the end of an hour"""
+        return {
+            "hour": interval_start(hour, 60, dt.DEFAULT_TIME_ZONE).isoformat(),
+            "score": self.score,
+            "quality": self.energyscore.attr[QUALITY],
+            "cost": self.cost.state,
+            "potential_savings": self.savings.state,
+            "savings_quality": self.savings.attr[QUALITY],
+        }
+
+    def _next_update(self, time: datetime.datetime, event_driven: bool):
+        """Returns the time of the next scheduled update"""
+        if not event_driven:
+            return time + SCAN_INTERVAL
+        # The start of the next interval
+        minutes = self.coordinator.interval
+        local = dt.as_local(time)
+        start = local.replace(
+            minute=local.minute - local.minute % minutes, second=0, microsecond=0
+        )
+        return dt.as_utc(start + datetime.timedelta(minutes=minutes))
+
+    def _update_times(
+        self, states: Iterator[RecordedState], event_driven: bool
+    ) -> Iterator[datetime.datetime]:
+        """Applies the states in chronological order, yields the times of the
+        updates in between"""
+        next_update = None
+        for time, changes in groupby(states, key=attrgetter("time")):
+            if next_update is None:
+                next_update = time
+            while next_update < time:
+                yield next_update
+                next_update = self._next_update(next_update, event_driven)
+            for state in changes:
+                self._states[state.entity_id] = state
+            if event_driven:
+                yield time
+                while next_update <= time:
+                    next_update = self._next_update(next_update, event_driven)
+        if next_update is not None and not event_driven:
+            yield next_update
+
+    def run(
+        self, states: Iterator[RecordedState], event_driven: bool = False
+    ) -> Iterator[dict[str, Any]]:
+        """Feeds the recorded states to the sensors, yields the hourly rows"""
+        hour = None
+        for time in self._update_times(states, event_driven):
+            if hour is not None and epoch_hour(dt.as_local(time)) != hour:
+                yield self.row(hour)
+            hour = epoch_hour(dt.as_local(time))
+            self.update(time)
+        if hour is not None:
+            yield self.row(hour)
+
+
+def _datetime(value: str | None) -> datetime.datetime | None:
+    """Parses a date or a time, local if no time zone is given"""
+    if value is None:
+        return None
+    if (time := dt.parse_datetime(value)) is None:
+        if (date := dt.parse_date(value)) is None:
+            raise ValueError(f"Invalid date or time: {value}")
+        return dt.start_of_local_day(date)
+    return time if time.tzinfo else time.replace(tzinfo=dt.DEFAULT_TIME_ZONE)
+
+
+def _rolling_hours(value: str) -> int:
+    """Parses the rolling hours, in the range allowed by the options"""
+    hours = int(value)
+    if not 2 <= hours <= MAX_ROLLING_HOURS:
+        raise argparse.ArgumentTypeError(
+            f"{hours} is not from 2 to {MAX_ROLLING_HOURS}"
+        )
+    return hours
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Replays a recorder database from the command line"""
+    parser = argparse.ArgumentParser(
+        description="Scores the recorded states of an energy and a price entity"
+    )
+    parser.add_argument("database", help="Copy of the recorder SQLite database")
+    parser.add_argument("--energy-entity", required=True)
+    parser.add_argument("--price-entity", required=True)
+    parser.add_argument("--energy-treshold", type=float, default=0)
+    parser.add_argument(
+        "--rolling-hours", type=_rolling_hours, default=24, metavar="HOURS"
+    )
+    parser.add_argument(
+        "--score-windows", nargs="*", default=[], choices=list(SCORE_WINDOWS)
+    )
+    parser.add_argument("--interval", type=int, default=60, choices=INTERVALS)
+    parser.add_argument("--max-shiftable-power", type=float, default=0)
+    parser.add_argument("--event-driven", action="store_true")
+    parser.add_argument(
+        "--time-zone", default="UTC", help="Time zone of Home Assistant"
+    )
+    parser.add_argument("--start", help="Date or time to start at")
+    parser.add_argument("--end", help="Date or time to end at")
+    parser.add_argument("--output", help="CSV file, standard output if not given")
+    args = parser.parse_args(argv)
+
+    if (time_zone := dt.get_time_zone(args.time_zone)) is None:
+        parser.error(f"Unknown time zone: {args.time_zone}")
+    dt.set_default_time_zone(time_zone)
+    try:
+        start, end = _datetime(args.start), _datetime(args.end)
+    except ValueError as error:
+        parser.error(str(error))
+
+    replay = Replay(
+        args.energy_entity,
+        args.price_entity,
+        args.energy_treshold,
+        args.rolling_hours,
+        args.score_windows,
+        args.interval,
+        args.max_shiftable_power,
+    )
+    connection = sqlite3.connect(f"file:{args.database}?mode=ro", uri=True)
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        states = heapq.merge(
+            *(
+                recorded_states(connection, entity_id, start, end)
+                for entity_id in (args.energy_entity, args.price_entity)
+            ),
+            key=lambda state: state.time,
+        )
+        writer = csv.DictWriter(output, FIELDS)
+        writer.writeheader()
+        writer.writerows(replay.run(states, args.event_driven))
+    finally:
+        connection.close()
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())